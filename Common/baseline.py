@@ -0,0 +1,30 @@
+'''
+Baseline estimation by asymmetric least squares (AsLS)
+
+Shared by XRD-Analysis/peakfind.py (background of 2theta scans) and
+X-Ray Sensitivity and Response/utilsplot.py (baseline of the X-ray response).
+
+Usage:
+    from baseline import baseline_als
+    bkg = baseline_als(y, lam=1e6, p=0.001)
+'''
+
+import numpy as np
+from scipy.sparse import diags, spdiags
+import scipy.sparse.linalg as spla
+
+def baseline_als(y, lam, p, niter=10):
+    #https://stackoverflow.com/questions/29156532/python-baseline-correction-library
+    #p: 0.001 - 0.1, lam: 10^2 - 10^9
+    # Baseline correction with asymmetric least squares smoothing, P. Eilers, 2005
+    # the second difference matrix is built sparse (no L x L dense matrix)
+    L = len(y)
+    D = diags([1, -2, 1], [0, -1, -2], shape=(L, L-2), format='csc', dtype=float)
+    DD = lam * D.dot(D.transpose())
+    w = np.ones(L)
+    for i in range(niter):
+        W = spdiags(w, 0, L, L)
+        Z = (W + DD).tocsc()
+        z = spla.spsolve(Z, w*y)
+        w = p * (y > z) + (1-p) * (y < z)
+    return z
@@ -0,0 +1,40 @@
+'''
+Cut-off of a normalized decay (TRPL histograms, ToF transients)
+
+Shared by TRPL-Analysis/TRPL.py and ToF-Analysis/ToF.py, so both cut their decays at the same point.
+
+Usage:
+    from decay_cutoff import detect_cut_off
+    cut_index, noise_floor = detect_cut_off(Y_norm, on_index)
+'''
+
+import numpy as np
+
+def detect_cut_off(Y, on_index, start_power=-3, step=0.2):
+    """
+    Cut-off index of a normalized decay in one pass over the array
+    The cut is where the decay first falls below 10**start_power; if it never does,
+    the threshold is raised by 10**step until it does (same result as raising it in a loop).
+    On the running minimum (monotone envelope) this is one searchsorted.
+    Return cut index and noise floor (median + 1.4826*MAD of the counts after the cut,
+    or before the peak if the cut is at the end)
+    """
+    Y = np.asarray(Y, dtype=float)
+    envelope = np.minimum.accumulate(Y[on_index:])
+    lowest = envelope[-1]
+    # smallest threshold 10**(start_power + k*step) above the lowest value
+    if lowest < 10 ** start_power or not np.isfinite(lowest):
+        power = start_power
+    else:
+        power = start_power + (np.floor((np.log10(lowest) - start_power) / step) + 1) * step
+    # first point below the threshold (envelope is decreasing, so search on -envelope)
+    cut_index = int(np.searchsorted(-envelope, -(10 ** power), side='right')) + on_index
+    cut_index = min(cut_index, len(Y) - 1)
+
+    # noise floor
+    noise = Y[cut_index:] if len(Y) - cut_index > 10 else Y[:on_index]
+    if len(noise) == 0:
+        noise = Y[cut_index:]
+    median = np.median(noise)
+    noise_floor = median + 1.4826 * np.median(np.abs(noise - median))
+    return cut_index, noise_floor
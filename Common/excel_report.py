@@ -0,0 +1,85 @@
+'''
+Designed Excel report written from a DataFrame in one pass
+
+Shared by TRPL-Analysis/TRPL.py (summary of the batch fit) and
+Old/JV-Analysis-for-SCTF-PVproject/JVanalysis.py (cell information and performance summary).
+
+Usage:
+    from excel_report import write_excel_report
+    write_excel_report(df, excel_path, sheet_name='Performances', band_column='Sample',
+                       hyperlinks={'ID': links})
+'''
+
+import numpy as np
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, NamedStyle
+from openpyxl.utils import get_column_letter
+
+def write_excel_report(df, excel_path, sheet_name='Sheet1', band_column=None, hyperlinks=None,
+                       font = "Meiryo UI", fontsize = 10, head_bkg_color = '000000', head_let_color = 'FFFFFF',
+                       bkg_colors = ("F2F2F2", "D9D9D9")):
+    """
+    Write a DataFrame as a designed Excel file in one pass (the workbook is saved once)
+    Design (replaces the old Design_excel, which loaded, styled and saved the workbook again):
+    1. Set the font for all cells and align center
+    2. Set the style for the first row (Fill black, make bold and white)
+    3. Freeze the top row
+    4. Adjust column widths (computed from the DataFrame)
+    5. Fill background with light gray / gray, switching when the value in band_column changes
+    6. Insert hyperlinks, hyperlinks = {column name: list of link targets (None for no link)}
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+
+    # Shared named styles (one style object for all cells instead of one per cell)
+    alignment = Alignment(horizontal='center', vertical='center')
+    header_style = NamedStyle(name='report_header', alignment=alignment,
+                              font=Font(color=head_let_color, bold=True, name=font, size=fontsize),
+                              fill=PatternFill(start_color=head_bkg_color, end_color=head_bkg_color, fill_type="solid"))
+    wb.add_named_style(header_style)
+    body_styles = []
+    for i, color in enumerate(bkg_colors if band_column is not None else [None]):
+        fill = PatternFill(start_color=color, end_color=color, fill_type="solid") if color else PatternFill()
+        style = NamedStyle(name=f'report_body_{i}', alignment=alignment, font=Font(name=font, size=fontsize), fill=fill)
+        wb.add_named_style(style)
+        body_styles.append(style.name)
+
+    # Adjust column widths based on content
+    values = df.astype(object).where(df.notna(), None)
+    lengths = values.where(values.notna(), '').astype(str).apply(lambda column: column.str.len().max() if len(column) else 0)
+    for i, column in enumerate(df.columns):
+        max_length = max(len(str(column)), int(lengths.iloc[i]) if len(df) else 0)
+        ws.column_dimensions[get_column_letter(i + 1)].width = (max_length + 2) * 1.2 # Adjust the width factor as necessary
+
+    # Freeze the top row
+    ws.freeze_panes = 'A2'
+
+    # Background band: the index changes every time the value in band_column changes
+    if band_column is not None and len(df):
+        indicator = df[band_column]
+        band = ((indicator != indicator.shift()).cumsum() - 1) % len(body_styles)
+        band = band.to_numpy()
+    else:
+        band = np.zeros(len(df), dtype=int)
+
+    # Hyperlink columns
+    links = {}
+    for column, targets in (hyperlinks or {}).items():
+        links[df.columns.get_loc(column)] = list(targets)
+
+    def make_cell(value, style, link=None):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        if link:
+            cell.hyperlink = link
+        return cell
+
+    # header
+    ws.append([make_cell(str(column), header_style.name) for column in df.columns])
+    # data
+    for row_number, row in enumerate(values.itertuples(index=False, name=None)):
+        style = body_styles[band[row_number]]
+        ws.append([make_cell(value, style, links[i][row_number] if i in links else None) for i, value in enumerate(row)])
+
+    wb.save(excel_path)
@@ -0,0 +1,117 @@
+'''
+On-disk cache for fit results
+
+A result is stored under a key made from
+1. the content of the input file (sha1), 2. the model name, 3. the fit settings
+so it is reused as long as the data and the settings are unchanged,
+and refitted automatically when one of them changes.
+By default the results are stored in a ".fitcache" folder next to the input file.
+Failed fits (a result with a non-empty 'error' or 'Error') are not stored, so they are tried again next time.
+
+This module is shared by TRPL-Analysis, XRD-Analysis and Mu-tau-fitting (install the Common folder once:
+    pip install -e Common
+see Common/setup.py)
+'''
+
+import os
+import json
+import pickle
+import hashlib
+from pathlib import Path
+
+# Change this number when the fitting code changes so that old results are not reused
+CACHE_VERSION = 1
+CACHE_FOLDER = '.fitcache'
+
+# (path, size, mtime) -> sha1, so the same file is hashed only once per session
+_hash_memo = {}
+
+def file_hash(path, chunk_size=1 << 20):
+    """sha1 of the file content"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key in _hash_memo:
+        return _hash_memo[memo_key]
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    _hash_memo[memo_key] = h.hexdigest()
+    return _hash_memo[memo_key]
+
+def array_hash(*arrays):
+    """sha1 of numerical data (for data that do not come from a single file)"""
+    import numpy as np
+    h = hashlib.sha1()
+    for a in arrays:
+        a = np.ascontiguousarray(a, dtype=float)
+        h.update(str(a.shape).encode())
+        h.update(a.tobytes())
+    return h.hexdigest()
+
+def make_key(data_hash, model, settings=None):
+    """Key from data hash, model name and fit settings (anything json can write)"""
+    text = json.dumps([CACHE_VERSION, data_hash, model, settings], sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+def default_cache_dir(path):
+    return str(Path(path).parent / CACHE_FOLDER)
+
+def load(cache_dir, key):
+    """Return the cached result or None"""
+    cache_path = os.path.join(cache_dir, f'{key}.pkl')
+    try:
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        return None
+
+def save(cache_dir, key, result):
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, f'{key}.pkl')
+    # write to a temporary file first, so parallel workers never read a half-written file
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(result, f)
+    os.replace(tmp_path, cache_path)
+
+def is_failed(result):
+    """True for a result dict with a non-empty 'error' or 'Error' (not stored in the cache)"""
+    return isinstance(result, dict) and bool(result.get('error') or result.get('Error'))
+
+def cached_fit(path, model, settings, fit_function, cache_dir=None, use_cache=True):
+    """
+    Return fit_function() for the file in path, reusing the stored result if available
+    path: input data file, model: model name, settings: fit settings (dict)
+    Failed fits (see is_failed) are returned but not stored
+    """
+    if not use_cache:
+        return fit_function()
+    if cache_dir is None:
+        cache_dir = default_cache_dir(path)
+    return cached_result(cache_dir, make_key(file_hash(path), model, settings), fit_function)
+
+def cached_result(cache_dir, key, fit_function):
+    """
+    Return fit_function(), reusing the result stored under key (see make_key) if available
+    Failed fits (see is_failed) are returned but not stored
+    """
+    result = load(cache_dir, key)
+    # failed fits stored by older versions are fitted again too
+    if result is None or is_failed(result):
+        result = fit_function()
+        if is_failed(result):
+            return result
+        try:
+            save(cache_dir, key, result)
+        except Exception as e:
+            print(f'Could not save the fit result in the cache due to the error "{e}"')
+    return result
+
+def clear(cache_dir):
+    """Remove all cached results in cache_dir"""
+    if not os.path.isdir(cache_dir):
+        return
+    for name in os.listdir(cache_dir):
+        if name.endswith('.pkl'):
+            os.remove(os.path.join(cache_dir, name))
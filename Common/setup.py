@@ -0,0 +1,18 @@
+'''
+Shared modules of the analysis folders (TRPL-Analysis, ToF-Analysis, XRD-Analysis, Mu-tau-fitting,
+X-Ray Sensitivity and Response, Old/JV-Analysis-for-SCTF-PVproject)
+
+Install once in the Python environment of the notebooks (editable, so changes here are used right away):
+    pip install -e Common
+Then they are imported by name, e.g. "import fitcache", from any folder.
+'''
+
+from setuptools import setup
+
+setup(
+    name='saidaminovlab-common',
+    version='1.0',
+    description='Shared fit cache, decay cut-off, Excel report and AsLS baseline modules',
+    py_modules=['fitcache', 'decay_cutoff', 'excel_report', 'baseline'],
+    install_requires=['numpy', 'scipy', 'openpyxl'],
+)
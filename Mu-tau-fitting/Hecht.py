@@ -0,0 +1,48 @@
+'''
+Hecht fitting for mu-tau product
+
+Usage in a notebook:
+    import Hecht
+    fit = Hecht.fit_hecht_file(excel_path, L=0.39)   # reused from the cache if the file has not changed
+    print(f"I0: {fit['I0']:.2f}, mt: {fit['mt']:.4f}, R2: {fit['R2']:.3f}")
+'''
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import curve_fit
+from sklearn.metrics import r2_score
+import fitcache
+
+# Define Hecht equation
+def Hecht(E, I0, mt, L):
+    I = I0 * mt * E / L * (1 - np.exp(-L/mt/E))
+    return I
+
+def fit_hecht(Vs, Is, L, mt_guess=0.005):
+    """
+    Vs: applied voltage (V), Is: response current density (nA/cm2), L: thickness (cm)
+    """
+    Es = np.asarray(Vs, dtype=float) / L # electric field V/cm
+    Is = np.asarray(Is, dtype=float)
+
+    # initial guess and bounds
+    I0_guess = Is.max()
+    bounds = [[Is.max(),0],[2*Is.max(),1]]
+
+    # fit the Hecht function to the data
+    popt, pcov = curve_fit(lambda E, I0, mt: Hecht(E, I0, mt, L), Es, Is, p0=[I0_guess, mt_guess], bounds=bounds)
+    I0_fit, mt_fit = popt
+
+    # calculate R-squared value
+    R2 = r2_score(Is, Hecht(Es, I0_fit, mt_fit, L))
+    return {'I0': I0_fit, 'mt': mt_fit, 'R2': R2, 'Es': Es, 'Is': Is}
+
+def fit_hecht_file(excel_path, L, mt_guess=0.005, cache_dir=None, use_cache=True):
+    """Read the summary excel (columns 'V', 'I (nA/cm2)', 'I_err') and fit, reusing the stored result if unchanged"""
+    def fit_function():
+        df = pd.read_excel(excel_path)
+        fit = fit_hecht(df['V'], df['I (nA/cm2)'], L, mt_guess)
+        fit['Is_err'] = df['I_err'].to_numpy(dtype=float) # stdev of I
+        return fit
+    settings = {'L': L, 'mt_guess': mt_guess}
+    return fitcache.cached_fit(excel_path, 'Hecht', settings, fit_function, cache_dir, use_cache)
@@ -8,14 +8,18 @@ from pathlib import Path
 from datetime import datetime, timedelta
 import pandas as pd
 import matplotlib.pyplot as plt
-import csv
+import io
+import json
+import sqlite3
 import numpy as np
+from collections import namedtuple
+from typing import NamedTuple
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 import tkinter as tk
 from tkinter import filedialog
-import openpyxl
-from openpyxl import load_workbook
-from openpyxl.styles import Font, PatternFill, Alignment
-from openpyxl.utils import get_column_letter
+import JVmetrics
+from excel_report import write_excel_report
 
 def list_directories(path):
     path = Path(path)
@@ -67,135 +71,129 @@ def add_days_to_date(date_str, days):
     new_date = int(new_date.strftime('%y%m%d'))
     return new_date
 
-# Define hex id for each cell
-def get_cell_hex_id(dat):    # expecting dat file path in dat
+# Cell key: crystallization date, fabrication date, batch, sample and cell of a device
+class CellKey(NamedTuple):
     """
-    Make hex id based on the data
-    
+    Immutable key of one cell, sorted in the order of the fields (same order as the hex id)
     ex: CD240309 FD240325 Batch1 Sample01 Cell02 -> 24030924032510102 -> '555FFF82950896'
-    to decode, use int(N,16)
     the decoded number is [6-digit][6-digit][1-digit][2-digit][2-digit] = [crystallization_date][fabrication_date][batch_number][sample_id][cell_id]
     unless you use this code until June 2072, the digits for hex id is always 14.
     """
+    crystallization_date: int
+    fabrication_date: int
+    batch_number: int
+    sample_id: int
+    cell_id: int
+
+    @property
+    def hex(self):
+        return _encode_cell_key(self)
+
+    @classmethod
+    def from_hex(cls, cell_hex_id):
+        return _decode_cell_key(cell_hex_id)
+
+@lru_cache(maxsize=None)
+def _encode_cell_key(key):
+    return hex(int(f'{key.crystallization_date:06}{key.fabrication_date:06}{key.batch_number}{key.sample_id:02}{key.cell_id:02}'))[2:].upper()
+
+@lru_cache(maxsize=None)
+def _decode_cell_key(cell_hex_id):
+    # Convert hex to decimal
+    cell_info = str(int(cell_hex_id,16))
+    return CellKey(int(cell_info[:6]), int(cell_info[6:12]), int(cell_info[12:13]), int(cell_info[13:15]), int(cell_info[15:17]))
 
+@lru_cache(maxsize=None)
+def _parse_cell_key(dat):
     # Have a different format to get directory info
     dat_path_info  = Path(dat) # have a different format for later
 
-    crystallization_date = dat_path_info.parents[3].name[1:7] # ex: take 240329 from 'C240329'
-    fabrication_date = dat_path_info.parents[2].name.split('_')[0][1:7] # ex: take 240329 from 'F240329_B1'
-    batch_number = dat_path_info.parents[2].name[-1:] # last letter in the folder name
+    crystallization_date = int(dat_path_info.parents[3].name[1:7]) # ex: take 240329 from 'C240329'
+    fabrication_date = int(dat_path_info.parents[2].name.split('_')[0][1:7]) # ex: take 240329 from 'F240329_B1'
+    batch_number = int(dat_path_info.parents[2].name[-1:]) # last letter in the folder name
     sample_id = int(dat_path_info.parents[0].name.split('_')[0])
-    try:
-        cell_id = int(os.path.basename(dat).split('-')[0])
-    except:
-        cell_id = int(os.path.basename(dat).split('_')[0])
-    cell_hex_id = hex(int(f'{crystallization_date}{fabrication_date}{batch_number}{sample_id:02}{cell_id:02}'))[2:].upper()
+    cell_id = get_cell_id(dat)
+    return CellKey(crystallization_date, fabrication_date, batch_number, sample_id, cell_id)
 
-    return cell_hex_id
+def get_cell_key(dat):    # expecting dat file path in dat
+    """CellKey from the folder names and the file name (parsed once for each path)"""
+    return _parse_cell_key(os.path.normpath(str(dat)))
 
-# Decode cell_hex_id
-def decode_cell_hex_id(cell_hex_id):
-    # Convert hex to decimal
-    cell_info = str(int(cell_hex_id,16))
-    
-    crystallization_date = cell_info[:6]
-    fabrication_date = cell_info[6:12]
-    batch_number = cell_info[12:13]
-    sample_id = cell_info[13:15]
-    cell_id = cell_info[15:17]
-
-    return [int(crystallization_date), int(fabrication_date), int(batch_number), int(sample_id), int(cell_id)]
-
-# Excel design
-def Design_excel(excel_path, font = "Meiryo UI", fontsize = 10, head_bkg_color = '000000', head_let_color = 'FFFFFF'):
+# Define hex id for each cell
+def get_cell_hex_id(dat):    # expecting dat file path in dat
     """
-    Load excel file:
-    1. Set the font for all cells to "Meiryo UI"
-    2. Set the style for the first row (Fill black, make bold and white)
-    3. Freeze the top row
-    4. Adjust column widths
-    5. Align center
+    Make hex id based on the data (see CellKey)
+    to decode, use decode_cell_hex_id or CellKey.from_hex
     """
+    return get_cell_key(dat).hex
 
-    # Load the Excel file
-    wb = openpyxl.load_workbook(excel_path)
-    ws = wb.active
-    # Set the font for all cells
-    for row in ws.iter_rows():
-        for cell in row:
-            cell.font = Font(name=font, size=fontsize)
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-    # Set the style for the first row
-    for cell in ws['1:1']:
-        cell.fill = PatternFill(start_color=head_bkg_color, end_color=head_bkg_color, fill_type="solid")
-        cell.font = Font(color=head_let_color, bold=True, name=font, size=fontsize)
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    # Freeze the top row
-    ws.freeze_panes = 'A2'
-
-    # Adjust column widths based on content
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter  # Get the column letter
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = (max_length + 2) * 1.2  # Adjust the width factor as necessary
-        ws.column_dimensions[column].width = adjusted_width
-    # Save the changes
-    wb.save(excel_path)
-
-def fill_excel_bkg(excel_path, indication_number):
-    # fill bkg color based on the sample name
-    bkg_colors = ["F2F2F2", "D9D9D9"] # light gray, gray
-        
-    # Load the Excel file
-    wb = openpyxl.load_workbook(excel_path)
-    ws = wb.active
-    # Fill the background
-    color_change = 0
-    for i, row in enumerate(ws.iter_rows()):
-        if i == 0:
+# Decode cell_hex_id
+def decode_cell_hex_id(cell_hex_id):
+    return list(CellKey.from_hex(cell_hex_id))
+
+# One parsed dat file
+# metadata: first data row of the header ({column: value}), area: device area (cm2),
+# V: voltage (V), J: current density as written in the dat file (mA/cm2), scan_direction: 'R' or 'F'
+DatRecord = namedtuple('DatRecord', ['metadata', 'area', 'V', 'J', 'scan_direction'])
+
+def _parse_value(text):
+    # same types as pandas would give: int, float, or str ('' -> nan)
+    text = text.strip()
+    if text == '':
+        return np.nan
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
             pass
-        elif i == 1:
-            indicator = row[indication_number].value # define sample number
-            for cell in row:
-                cell.fill = PatternFill(start_color=bkg_colors[0], end_color=bkg_colors[0], fill_type="solid") # use light gray
-        elif i > 1:
-            if indicator != row[indication_number].value:
-                indicator = row[indication_number].value # update
-                color_change += 1
-                for cell in row:
-                    cell.fill = PatternFill(start_color=bkg_colors[color_change % 2], end_color=bkg_colors[color_change % 2], fill_type="solid")
-            else:
-                for cell in row:
-                    cell.fill = PatternFill(start_color=bkg_colors[color_change % 2], end_color=bkg_colors[color_change % 2], fill_type="solid")
-
-    wb.save(excel_path)
-
+    return text
+
+@lru_cache(maxsize=4096)
+def _read_dat(dat, mtime):
+    with open(dat, 'r') as f:
+        header = f.readline().rstrip('\r\n').split('\t')
+        values = f.readline().rstrip('\r\n').split('\t')
+        data = pd.read_csv(io.StringIO(f.read()), delimiter='\t', header=None).to_numpy(dtype=float)
+    metadata = dict(zip(header, [_parse_value(v) for v in values]))
+    V = data[:, 0] # voltage (V)
+    J = data[:, 1] # current density (mA/cm2)
+    # if the first voltage is higher than the second voltage, direction is 'reverse (R)'
+    scan_direction = 'R' if V[1] > V[2] else 'F'
+    return DatRecord(metadata, float(metadata['device area']), V, J, scan_direction)
+
+def read_dat(dat):
+    """
+    Read a dat file once and return DatRecord
+    The record is kept in memory for the same path and modification time,
+    so the JV pipeline parses each file only once
+    """
+    return _read_dat(os.path.normpath(str(dat)), os.stat(dat).st_mtime_ns)
 
-def get_cell_information(dat, df_cell_info, mode):
+def get_cell_information(dat, known_ids):
+    """
+    Cell information of the dat file as a record
+    [ID, C-date, F-date, Batch, Sample, Info, Cell, Area_dat, Area_new, Note]
+    Return errors and the record (None if the cell is in known_ids or the file could not be read)
+    """
     error_check = []
-    cols = df_cell_info.columns.to_list()
+    new_cell_info = None
     # Get all cell info
     try:
         # Define hex_id
-        cell_hex_id = get_cell_hex_id(dat)
-        if cell_hex_id in df_cell_info['ID'].values: # if the dataframe has the cell info, skip
+        cell_key = get_cell_key(dat)
+        cell_hex_id = cell_key.hex
+        if cell_hex_id in known_ids: # if the dataframe has the cell info, skip
             pass
         else:
             # get some info based on the directory name
-            crystallization_date, fabrication_date, batch_number, sample_id, cell_id = decode_cell_hex_id(cell_hex_id)
+            crystallization_date, fabrication_date, batch_number, sample_id, cell_id = cell_key
             # get other info
             sample_info_parts = Path(dat).parents[0].name.split('_')
             sample_info = '_'.join(sample_info_parts[1:])
-            area_dat = float(pd.read_csv(dat,delimiter='\t')[:1]['device area'][0])
+            area_dat = read_dat(dat).area
 
             # Define new row for the dataframe
-            new_cell_info = [[
+            new_cell_info = [
                         cell_hex_id,
                         crystallization_date,
                         fabrication_date,
@@ -206,33 +204,41 @@ def get_cell_information(dat, df_cell_info, mode):
                         area_dat,
                         None, # corrected area
                         '' # Note
-                    ]]
-
-            new_row = pd.DataFrame(data=new_cell_info, columns=cols)
-
-            if mode == 'Create New':
-                if len(df_cell_info) == 0:
-                    df_cell_info = new_row
-                else:
-                    df_cell_info = pd.concat([df_cell_info, new_row], ignore_index=True, axis=0)
-
-            elif mode == 'Update':
-                # Merge the previous data and new row based on ID
-                merged_df = df_cell_info.set_index('ID').combine_first(new_row.set_index('ID'))
-                # For 'Area_new' and 'Selection', we use the existing data
-                merged_df['Area_new'] = df_cell_info.set_index('ID')['Area_new'].combine_first(merged_df['Area_new'])
-                merged_df['Note'] = df_cell_info.set_index('ID')['Note'].combine_first(merged_df['Note'])
-                merged_df = merged_df.reset_index()[df_cell_info.columns]
-                # Update df_cell_info
-                df_cell_info = merged_df
+                    ]
 
     except Exception as e:
         error_check.append(f'error in {os.path.basename(dat)}, "{e}" ')
 
-    return error_check, df_cell_info
-            
+    return error_check, new_cell_info
+
+def cell_manifest_path(save_path):
+    # ex: Cell-information.manifest.json next to Cell-information.xlsx
+    return f'{os.path.splitext(save_path)[0]}.manifest.json'
+
+def load_manifest(manifest_path):
+    try:
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_manifest(manifest_path, manifest):
+    tmp_path = f'{manifest_path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+def folder_state(folder, dat_list):
+    """Modification time and file names of the folder (saved in the manifest)"""
+    return {'mtime': os.stat(folder).st_mtime_ns, 'files': [os.path.basename(dat) for dat in dat_list]}
+
 # Grab Cell Information and Update/Create the summary as an Excel file
 def update_cell_information(folder_list, save_path):
+    """
+    New cells are collected as records and merged once.
+    Folders whose modification time and file list are the same as in the last run
+    (saved in Cell-information.manifest.json) are skipped in Update mode.
+    """
     mode = 'Update' # 'Update' or 'Create New'
     # if the excel file already exists
     try:
@@ -245,19 +251,43 @@ def update_cell_information(folder_list, save_path):
         df_cell_info = pd.DataFrame(index=[], columns=cols)
         mode = 'Create New'
 
+    manifest_path = cell_manifest_path(save_path)
+    manifest = load_manifest(manifest_path) if mode == 'Update' else {}
+    known_ids = set(df_cell_info['ID'])
+    new_cell_infos = []
+    n_skipped = 0
+
     for folder in folder_list:
         try:
             # grab all dat files in the directory
             dat_list = glob(f'{folder}/*.dat')
             dat_list.sort()
-            
-            # get cell information and update dataframe
+
+            # skip the folder if nothing changed since the last run
+            folder_key = os.path.normpath(str(folder))
+            state = folder_state(folder, dat_list)
+            previous = manifest.get(folder_key, {})
+            if previous.get('mtime') == state['mtime'] and previous.get('files') == state['files'] \
+                    and set(previous.get('ids', [])) <= known_ids:
+                n_skipped += 1
+                continue
+
+            # get cell information of new cells
+            error_check = []
+            folder_ids = set()
             for dat in dat_list:
-                error_check, df_cell_info = get_cell_information(dat, df_cell_info, mode)
+                errors, new_cell_info = get_cell_information(dat, known_ids)
+                error_check += errors
+                if new_cell_info is not None:
+                    new_cell_infos.append(new_cell_info)
+                    known_ids.add(new_cell_info[0])
+                if len(errors) == 0:
+                    folder_ids.add(get_cell_hex_id(dat))
 
             # Message
             if len(error_check) == 0:
-                pass
+                # remember the folder only if all files were read
+                manifest[folder_key] = dict(state, ids=sorted(folder_ids))
             elif len(error_check) == len(dat_list):
                 print(' PASS, no data was saved\n')
             else:
@@ -267,50 +297,88 @@ def update_cell_information(folder_list, save_path):
         except Exception as e:
             print(f'Skipped "{os.path.basename(folder)}" due to the error "{e}"')
 
-    # Save the data
-    df_cell_info = df_cell_info.sort_values(by='ID').reset_index(drop=True)
-    with pd.ExcelWriter(save_path) as writer:
-        df_cell_info.to_excel(writer, sheet_name='Cell-Info', index=False)
+    # Merge all new cells at once
+    new_rows = pd.DataFrame(data=new_cell_infos, columns=cols)
+    if len(df_cell_info) == 0:
+        df_cell_info = new_rows
+    elif len(new_rows) > 0:
+        df_cell_info = pd.concat([df_cell_info, new_rows], ignore_index=True, axis=0)
 
-    # Design
-    Design_excel(save_path)
-
-    # fill bkg color based on the sample name
-    fill_excel_bkg(save_path,indication_number=4)
+    # Save the data with the design
+    # fill bkg color based on the sample name (5th column)
+    df_cell_info = df_cell_info.sort_values(by='ID').reset_index(drop=True)
+    write_excel_report(df_cell_info, save_path, sheet_name='Cell-Info', band_column=df_cell_info.columns[4])
+    save_manifest(manifest_path, manifest)
 
+    if n_skipped > 0:
+        print(f'{n_skipped} folders were not changed since the last update')
     print('COMPLETE')
 
     return
 
-def get_jv_id(dat):
-    dat_folder = os.path.dirname(dat)
-    dat_list = glob(f'{dat_folder}/*.dat')
-    hex_id = get_cell_hex_id(dat)
-    # get some info based on the directory name
-    fabrication_date = decode_cell_hex_id(hex_id)[1] # int
-    measurement_date = Path(dat).parents[1].name[1:7] # ex: take 240329 from 'M240329'
-    # calculate how many days have passed
-    measurement_days = calculate_date_difference(fabrication_date,measurement_date)
-    # Count which trial the dat file is
+def get_cell_id(dat):
+    # ex: 2 from '02-....dat' or '02_....dat'
+    try:
+        cell_id = int(os.path.basename(dat).split('-')[0])
+    except:
+        cell_id = int(os.path.basename(dat).split('_')[0])
+    return cell_id
+
+def index_dat_folder(folder):
+    """
+    Parse every dat file in the folder once and assign jv_id to each file
+    Files are sorted, grouped by cell hex id, and the trial number counts up in each group
+    Return {dat path: jv_id} (files whose name cannot be parsed are not included)
+    """
+    dat_list = glob(f'{folder}/*.dat')
     dat_list.sort()
-    trial = 1
-    for file in dat_list:
-        file_hex_id = get_cell_hex_id(file) # get hex key to check the file is same as the objective file
-        if file_hex_id == hex_id and file == dat: # if it is the same cell and same measurement data
-            break
-        elif file_hex_id == hex_id and file != dat: # if it is the same cell but different measurement data
-            trial += 1
-        else:
-            pass
-    # Define jv_id
-    jv_id = f'{hex_id}-{measurement_days}-{trial:02}'
-    return jv_id
+    jv_index = {}
+    trials = {} # number of files found so far for each cell
+    for dat in dat_list:
+        try:
+            cell_key = get_cell_key(dat)
+            hex_id = cell_key.hex
+            # get some info based on the directory name
+            fabrication_date = cell_key.fabrication_date
+            measurement_date = Path(dat).parents[1].name[1:7] # ex: take 240329 from 'M240329'
+            # calculate how many days have passed
+            measurement_days = calculate_date_difference(fabrication_date,measurement_date)
+        except:
+            continue
+        trials[hex_id] = trials.get(hex_id, 0) + 1
+        # Define jv_id
+        jv_index[os.path.normpath(dat)] = f'{hex_id}-{measurement_days}-{trials[hex_id]:02}'
+    return jv_index
+
+# {folder: (folder mtime, index)}, rebuilt when a file is added to or removed from the folder
+_jv_index_memo = {}
+
+def get_jv_index(folder):
+    """index_dat_folder, reused until the folder changes"""
+    folder = os.path.normpath(str(folder))
+    mtime = os.stat(folder).st_mtime_ns
+    if folder not in _jv_index_memo or _jv_index_memo[folder][0] != mtime:
+        _jv_index_memo[folder] = (mtime, index_dat_folder(folder))
+    return _jv_index_memo[folder][1]
+
+def group_by_cell(jv_index):
+    """{cell_id: [(dat, jv_id), ...]} in the order of the trial number"""
+    cells = {}
+    for dat, jv_id in jv_index.items():
+        cells.setdefault(get_cell_key(dat).cell_id, []).append((dat, jv_id))
+    return dict(sorted(cells.items()))
+
+def get_jv_id(dat, jv_index=None):
+    if jv_index is None:
+        jv_index = get_jv_index(os.path.dirname(dat))
+    if os.path.normpath(dat) not in jv_index:
+        get_cell_hex_id(dat) # shows why this file could not be parsed
+        raise KeyError(f'{os.path.basename(dat)} is not in the folder index')
+    return jv_index[os.path.normpath(dat)]
 
 def make_new_filename_dat2csv(dat):
-    # Define hex_id
-    cell_hex_id = get_cell_hex_id(dat)
     # get some info based on the directory name
-    crystallization_date, fabrication_date, batch_number, sample_id, cell_id = decode_cell_hex_id(cell_hex_id)
+    crystallization_date, fabrication_date, batch_number, sample_id, cell_id = get_cell_key(dat)
     measurement_info = Path(dat).name[2:-4]
     measurement_date = Path(dat).parents[1].name[1:7] # ex: take 240329 from 'M240329'
     sample_info = Path(dat).parents[0].name
@@ -320,11 +388,7 @@ def make_new_filename_dat2csv(dat):
     measurement_days = calculate_date_difference(fabrication_date,measurement_date)
     
     # scan_direction
-    df = pd.read_csv(dat,delimiter='\t',skiprows=2,header=None) # read dataframe
-    if df.at[1, 0] > df.at[2, 0]: # if the first voltage is higher than the second voltage, direction is 'reverse (R)'
-        scan_direction = 'R'
-    else:
-        scan_direction = 'F'
+    scan_direction = read_dat(dat).scan_direction
         
     # define new filename
     filename = f'{crystallization_date}_FD{fabrication_days}-B{batch_number}_{sample_info}-{cell_id:02}_MD{measurement_days}-{scan_direction}_{measurement_info}.csv'
@@ -333,54 +397,224 @@ def make_new_filename_dat2csv(dat):
 
 
 def save_JV_as_csv(V, I, J, file_save_path):
-    # save to csv file
-    with open(file_save_path, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        # header
-        writer.writerow(["Voltage (V)", "Current (mA)", "Current density (mA/cm2)"])
-        # data
-        for v, i, j in zip(V, I, J):
-            writer.writerow([v, i, j])
-
-def save_dat_as_csv(dat, save_folder_path, performance_csv_path):
+    # save to csv file (same text as csv.writer: shortest float repr, CRLF)
+    np.savetxt(file_save_path, np.column_stack([V, I, J]), fmt='%s', delimiter=',',
+               header='Voltage (V),Current (mA),Current density (mA/cm2)', comments='', newline='\r\n')
+
+# Performance store
+# The rows of all dat files are kept in a SQLite database next to the performance csv (ex: _summary.sqlite),
+# with the jv_id as the primary key. Rows are added in bulk, and the csv is written once at the end.
+PERFORMANCE_TABLE = 'performances'
+
+def performance_db_path(performance_csv_path):
+    return f'{os.path.splitext(performance_csv_path)[0]}.sqlite'
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+def _to_sql_value(value):
+    # numpy scalars -> python, nan -> NULL
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+def dat_file_name(dat):
+    # project_dir/C.../F.../M.../sample/file.dat -> C.../F.../M.../sample/file.dat (same if the project is moved)
+    return '/'.join(Path(dat).parts[-5:])
+
+def upsert_performances(performance_csv_path, df_new, overwrite=False):
+    """
+    Add rows (DataFrame with 'ID') to the performance store in one transaction
+    Existing rows are kept, and only their empty values are filled (same as combine_first)
+    overwrite: the values of df_new replace the stored ones (dat files that were written again)
+    New columns are added to the table when needed
+    Rows of dat files whose jv_id is stored for another dat file are not saved (see _same_dat_file)
+    Return the saved rows
+    """
+    if len(df_new) == 0:
+        return df_new
+    import_performance_csv(performance_csv_path)
+    db_path = performance_db_path(performance_csv_path)
+    same = _same_dat_file(db_path, df_new)
+    if not same.all():
+        print(f'CAUTION: {int((~same).sum())} dat files were not saved because their jv_id belongs to another dat file. '
+              'The trial number follows the order of the file names, so a new file that sorts before '
+              'the existing files of a cell takes their jv_id. Rename the file so that it sorts after them.')
+        for jv_id, dat in zip(df_new.loc[~same, 'ID'], df_new.loc[~same, 'Dat file']):
+            print(f'{dat} ({jv_id})')
+        df_new = df_new[same]
+    _upsert(db_path, df_new, overwrite)
+    return df_new
+
+def _same_dat_file(db_path, df_new):
+    """
+    True for the rows of df_new that are new or stored for the same dat file
+    (compared by 'Dat file', or by 'CSV name' for rows saved before 'Dat file' was stored)
+    """
+    same = pd.Series(True, index=df_new.index)
+    if 'Dat file' not in df_new.columns or not has_performance_table(db_path):
+        return same # sweeps of the other setups: the ID is made from the file name
+    with sqlite3.connect(db_path) as conn:
+        existing = [row[1] for row in conn.execute(f'PRAGMA table_info({PERFORMANCE_TABLE})')]
+        select = ', '.join(_quote(col) if col in existing else 'NULL' for col in ['ID', 'Dat file', 'CSV name'])
+        stored = {row[0]: row[1:] for row in conn.execute(f'SELECT {select} FROM {PERFORMANCE_TABLE}')}
+    for index, jv_id, dat, csv_name in zip(df_new.index, df_new['ID'], df_new['Dat file'], df_new['CSV name']):
+        if jv_id in stored:
+            stored_dat, stored_csv_name = stored[jv_id]
+            same[index] = dat == stored_dat if stored_dat is not None else csv_name == stored_csv_name
+    return same
+
+def has_performance_table(db_path):
+    """True if the store exists and has the performance table (the file alone may only hold csv_areas)"""
+    if not os.path.exists(db_path):
+        return False
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                            (PERFORMANCE_TABLE,)).fetchone() is not None
+
+def import_performance_csv(performance_csv_path):
+    # import the csv of an older analysis once (before anything else is written to the store)
+    db_path = performance_db_path(performance_csv_path)
+    if not has_performance_table(db_path) and os.path.exists(performance_csv_path):
+        df_csv = pd.read_csv(performance_csv_path, float_precision='round_trip')
+        _upsert(db_path, df_csv)
+
+def _upsert(db_path, df, overwrite=False):
+    columns = df.columns.to_list()
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {PERFORMANCE_TABLE} (ID TEXT PRIMARY KEY)')
+        existing = [row[1] for row in conn.execute(f'PRAGMA table_info({PERFORMANCE_TABLE})')]
+        for col in columns:
+            if col not in existing:
+                conn.execute(f'ALTER TABLE {PERFORMANCE_TABLE} ADD COLUMN {_quote(col)}')
+        others = [col for col in columns if col != 'ID']
+        if overwrite:
+            update = ', '.join(f'{_quote(col)} = excluded.{_quote(col)}' for col in others)
+        else:
+            update = ', '.join(f'{_quote(col)} = COALESCE({_quote(col)}, excluded.{_quote(col)})' for col in others)
+        conn.executemany(
+            f'INSERT INTO {PERFORMANCE_TABLE} ({", ".join(_quote(col) for col in columns)}) '
+            f'VALUES ({", ".join("?" * len(columns))}) '
+            + (f'ON CONFLICT(ID) DO UPDATE SET {update}' if update else 'ON CONFLICT(ID) DO NOTHING'),
+            [[_to_sql_value(v) for v in row] for row in df.itertuples(index=False, name=None)])
+
+def load_performances(performance_csv_path):
+    """All performance rows sorted by ID (from the store, or from the csv if there is no store yet)"""
+    db_path = performance_db_path(performance_csv_path)
+    if not has_performance_table(db_path):
+        return pd.read_csv(performance_csv_path)
+    with sqlite3.connect(db_path) as conn:
+        return pd.read_sql_query(f'SELECT * FROM {PERFORMANCE_TABLE} ORDER BY ID', conn)
+
+def load_csv_areas(performance_csv_path):
+    """{jv_id: area} used for J in the JV csv files that were rewritten with a corrected area"""
+    db_path = performance_db_path(performance_csv_path)
+    if not os.path.exists(db_path):
+        return {}
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('CREATE TABLE IF NOT EXISTS csv_areas (ID TEXT PRIMARY KEY, area REAL)')
+        return dict(conn.execute('SELECT ID, area FROM csv_areas'))
+
+def save_csv_areas(performance_csv_path, csv_areas):
+    """Record the area of rewritten JV csv files ({jv_id: area}, None: area in the dat file)"""
+    if len(csv_areas) == 0:
+        return
+    # the store of an older analysis is created from its csv first
+    import_performance_csv(performance_csv_path)
+    with sqlite3.connect(performance_db_path(performance_csv_path)) as conn:
+        conn.execute('CREATE TABLE IF NOT EXISTS csv_areas (ID TEXT PRIMARY KEY, area REAL)')
+        conn.executemany('INSERT OR REPLACE INTO csv_areas (ID, area) VALUES (?, ?)',
+                         [(jv_id, _to_sql_value(area)) for jv_id, area in csv_areas.items()])
+
+def export_performance_csv(performance_csv_path):
+    """Write the performance store to the csv (the csv is only an export)"""
+    load_performances(performance_csv_path).to_csv(performance_csv_path, index=False)
+
+def ingest_sweeps(paths, area, performance_csv_path, source, current_sign=-1):
+    """
+    Add J-V sweeps measured with Keithley2450 (run_IV) or Keithley617 (JVMeasurementApp) to the performance store
+    paths: csv files, area: device area (cm2), source: name of the setup (ex: '2450'), used in the ID
+    current_sign: -1 if the photocurrent is negative in the csv
+    The metrics are calculated from the curves (JVmetrics) and saved with the same columns as the dat files
+    """
+    curves, rows = [], []
+    for path in paths:
+        try:
+            sweeps = JVmetrics.read_sweep_csv(path)
+        except Exception as e:
+            print(f'Skipped {os.path.basename(path)} due to the error "{e}"')
+            continue
+        stem = Path(path).stem
+        for n, (cycle, V, I) in enumerate(sweeps):
+            curves.append((V, current_sign * I * 1000 / area)) # mA/cm2
+            rows.append({
+                'ID': f'{source}:{stem}' if len(sweeps) == 1 else f'{source}:{stem}:{n+1:02}',
+                'CSV name': os.path.basename(path),
+                'File Name': os.path.basename(path),
+                # forward and reverse files of run_IV: name-F.csv, name-R.csv
+                'pair': (stem[:-2] if stem[-2:] in ('-F', '-R') else stem, cycle),
+            })
+    if len(curves) == 0:
+        print('No sweeps were found')
+        return pd.DataFrame()
+
+    metrics = JVmetrics.jv_metrics(*JVmetrics.pad_curves(curves), area)
+    df = pd.DataFrame(rows)
+    # same sign and units as the dat files
+    df_performance = pd.DataFrame({
+        'ID': df['ID'],
+        'CSV name': df['CSV name'],
+        'File Name': df['File Name'],
+        'device area': area,
+        'Jsc (mA/cm2)': metrics['Jsc (mA/cm2)'] * (-1),
+        'Voc (V)': metrics['Voc (V)'],
+        'Fill Factor': metrics['FF (%)'] / 100,
+        'Pmax (mW/cm2)': metrics['Pmax (mW/cm2)'] * (-1),
+        'Vmpp': metrics['Vmpp (V)'],
+        'Rseries (Ohms)': metrics['Rseries(ohm)'],
+        'Rshunt (Ohms)': metrics['Rshunt(ohm)'],
+        'Source': source,
+        'Scan': metrics['Scan'],
+        'Hysteresis index': JVmetrics.pair_hysteresis(df['pair'].to_list(), metrics['Scan'].to_list(), metrics['Pmax (mW/cm2)'].to_numpy()),
+    })
+    upsert_performances(performance_csv_path, df_performance)
+    export_performance_csv(performance_csv_path)
+    print(f'COMPLETE: {len(df_performance)} sweeps')
+    return df_performance
+
+def convert_dat(dat, save_folder_path, jv_index=None):
     """
     read dat file
     1. convert it to csv file and rename it
-    2. make jv-id (id for each measurement) and update performance summary as csv
+    2. make jv-id (id for each measurement)
+    Return the performance row (DataFrame) and the errors
     """
 
     # Error check
     error_check = []
 
     # get the data
-    jv_id = get_jv_id(dat)
+    jv_id = get_jv_id(dat, jv_index)
 
-    df = pd.read_csv(dat,delimiter='\t',skiprows=2,header=None) # read dataframe
-    df_performance = pd.read_csv(dat,delimiter='\t')[:1]
-    area = float(df_performance['device area'][0]) # get area from original data
-    J = df[1].to_list()
-    J = [n*(-1) for n in J] # current density (mA/cm2)
-    I = [n*area for n in J] # current (mA)
-    V = df[0].to_list() # voltage (V)
+    record = read_dat(dat) # read dat file
+    df_performance = pd.DataFrame([record.metadata])
+    area = record.area # get area from original data
+    J = record.J * (-1) # current density (mA/cm2)
+    I = J * area # current (mA)
+    V = record.V # voltage (V)
 
     # Add jv-id
     df_performance['ID'] = jv_id
     # Add csv name
     df_performance['CSV name'] = make_new_filename_dat2csv(dat)
+    # Add the dat file (C.../F.../M.../sample/file.dat), checked before a stored row is replaced
+    df_performance['Dat file'] = dat_file_name(dat)
     # Change order
     new_order = ['ID', 'CSV name'] + [col for col in df_performance.columns if col not in ['ID', 'CSV name']]
     df_performance = df_performance[new_order]
 
-    # Merge
-    try:
-        df_performance_csv = pd.read_csv(performance_csv_path)
-        # Merge the previous data and new row based on ID
-        merged_df = df_performance_csv.set_index('ID').combine_first(df_performance.set_index('ID'))
-        merged_df = merged_df.reset_index()[df_performance_csv.columns]
-        merged_df.to_csv(performance_csv_path, index=False)
-    except:
-        df_performance.to_csv(performance_csv_path, index=False)
-    
     try:
         # define new filename
         filename = make_new_filename_dat2csv(dat)
@@ -391,69 +625,109 @@ def save_dat_as_csv(dat, save_folder_path, performance_csv_path):
 
     except Exception as e:
         error_check.append(f'Error in {os.path.basename(dat)}: "{e}"')
+    return df_performance, error_check
+
+def save_dat_as_csv(dat, save_folder_path, performance_csv_path, jv_index=None):
+    """
+    read dat file
+    1. convert it to csv file and rename it
+    2. make jv-id (id for each measurement) and update performance summary as csv
+    """
+    df_performance, error_check = convert_dat(dat, save_folder_path, jv_index)
+    df_performance = upsert_performances(performance_csv_path, df_performance)
+    save_csv_areas(performance_csv_path, dict.fromkeys(df_performance['ID']))
+    export_performance_csv(performance_csv_path)
     return error_check
 
-def save_all_dat_as_csv(folder_list, save_folder_dir, performance_csv_path):
+def _convert_task(task):
+    # worker of save_all_dat_as_csv: one dat file, errors are returned instead of raised
+    dat, save_folder_path, jv_id = task
+    try:
+        jv_index = {} if jv_id is None else {os.path.normpath(dat): jv_id}
+        return convert_dat(dat, save_folder_path, jv_index)
+    except Exception as e:
+        return None, [f'Error in {os.path.basename(dat)}: "{e}"']
+
+def save_all_dat_as_csv(folder_list, save_folder_dir, performance_csv_path, max_workers=None, chunksize=8):
+    """
+    Convert all dat files in the folders to csv files in a process pool (max_workers=1: no pool)
+    and save their performances in the store at once
+    """
+    save_dat_files({folder: None for folder in folder_list}, save_folder_dir, performance_csv_path, max_workers, chunksize)
+
+def save_dat_files(folder_files, save_folder_dir, performance_csv_path, max_workers=None, chunksize=8, overwrite=False):
+    """
+    Same as save_all_dat_as_csv for selected files
+    folder_files: {folder: [dat files] (None: all dat files in the folder)}
+    overwrite: replace the stored performances of the files (see upsert_performances)
+    """
     # Make directory if you don't have it
     if not os.path.exists(save_folder_dir):
         os.mkdir(save_folder_dir)
 
-    for folder in folder_list:
+    # list the files of each folder (jv_id is given in this process, so the folder is indexed once)
+    folder_tasks = {}
+    for folder, dat_list in folder_files.items():
         try:
             # grab all dat files in the directory
-            dat_list = glob(f'{folder}/*.dat')
-            dat_list.sort()
-            # save all JV data
-            for dat in dat_list:
-                error_check = save_dat_as_csv(dat, save_folder_dir, performance_csv_path)
-            if len(error_check) == 0:
-                pass
-            elif len(error_check) == len(dat_list):
-                print(' PASS, no data was saved\n')
-            else:
-                print(f'CAUTION: {len(error_check)} of {len(dat_list)} dat files in {os.path.basename(folder)} were not saved. Check below.')
-                for error in error_check:
-                    print(error)
-
+            if dat_list is None:
+                dat_list = glob(f'{folder}/*.dat')
+            dat_list = sorted(dat_list)
+            # jv_id for all files in the folder
+            jv_index = get_jv_index(folder)
+            folder_tasks[folder] = [(dat, save_folder_dir, jv_index.get(os.path.normpath(dat))) for dat in dat_list]
         except Exception as e:
             print(f' PASS, due to the error "{e}"\n')
-    
-    print('\nCOMPLETE')
 
-def insert_hyperlink(excel_path,jv_folder_dir,performance_csv_path):
-    df_reference =  pd.read_csv(performance_csv_path)
-    
-    # Open an existing Excel file
-    wb = openpyxl.load_workbook(excel_path)
-    ws = wb.active
-
-    # Locate 'ID' column (assuming ID column is always present here)
-    id_column_index = None
-    for col in ws[1]:  # check the header
-        if col.value == 'ID':
-            id_column_index = col.column  # Get an index for ID
+    # save all JV data
+    tasks = [task for folder_task in folder_tasks.values() for task in folder_task]
+    if max_workers == 1 or len(tasks) <= 1:
+        results = [_convert_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_convert_task, tasks, chunksize=chunksize))
+
+    # Message for each folder
+    performance_rows = [] # performance of all dat files, saved at once
+    n_done = 0
+    for folder, folder_task in folder_tasks.items():
+        error_check = []
+        for df_performance, errors in results[n_done:n_done + len(folder_task)]:
+            if df_performance is not None:
+                performance_rows.append(df_performance)
+            error_check += errors
+        n_done += len(folder_task)
+        if len(error_check) == 0:
+            pass
+        elif len(error_check) == len(folder_task):
+            print(' PASS, no data was saved\n')
+        else:
+            print(f'CAUTION: {len(error_check)} of {len(folder_task)} dat files in {os.path.basename(folder)} were not saved. Check below.')
+            for error in error_check:
+                print(error)
+
+    # Update the performance store and the csv once
+    if len(performance_rows) > 0:
+        df_new = pd.concat(performance_rows, ignore_index=True)
+        df_new = upsert_performances(performance_csv_path, df_new, overwrite)
+        # the csv files were written again with the area in the dat files
+        save_csv_areas(performance_csv_path, dict.fromkeys(df_new['ID']))
+    if has_performance_table(performance_db_path(performance_csv_path)):
+        export_performance_csv(performance_csv_path)
     
-    # Determine the column letter for 'ID' column using its index
-    id_column_letter = get_column_letter(id_column_index)
-
-    # Add hyperlinks to the 'ID' column
-    for row in range(2, ws.max_row + 1):  # Assuming the first row is the header
-        cell = ws[f"{id_column_letter}{row}"]
-        # Define hyperlink
-        jv_id = cell.value # Get jv id ex 555F73CFCB9895-35-02
-        csv_name = df_reference.loc[df_reference['ID']==jv_id, 'CSV name'].values[0]
-        link = f"{jv_folder_dir}/{csv_name}"
-        # Change cell settings
-        cell.hyperlink = link
-        # cell.style = "Hyperlink"
-
-    # Save the changes and overwrite the existing file
-    wb.save(excel_path)
+    print('\nCOMPLETE')
 
+def csv_links(jv_ids, jv_folder_dir, performance_csv_path):
+    """Link to the csv file of each jv_id (None if the jv_id is not in the performance store)"""
+    df_reference = load_performances(performance_csv_path)
+    csv_names = dict(zip(df_reference['ID'], df_reference['CSV name']))
+    return [f"{jv_folder_dir}/{csv_names[jv_id]}" if jv_id in csv_names else None for jv_id in jv_ids]
 
-def update_cell_performances(params):
+def update_cell_performances(params, metrics='dat'):
     '''
     Update cell perfomance summary based on cell-information data frame
+    metrics: 'dat' uses the values calculated by the measurement software,
+             'curve' calculates them again from the JV csv files (JVmetrics)
     '''
     jv_folder_dir = params[0]
     performance_csv_path = params[1]
@@ -462,11 +736,12 @@ def update_cell_performances(params):
 
     # Read measurement data summary
     try:
-        df_reference =  pd.read_csv(performance_csv_path)
-        measurement_ids = df_reference['ID'].values
+        df_reference =  load_performances(performance_csv_path)
     except:
         print('Could not read the csv. Please check the path.')
         return
+    # only the dat measurements (ID: cell hex id-days-trial), not the sweeps from the other setups
+    df_reference = df_reference[df_reference['ID'].str.fullmatch(r'[0-9A-F]+-\d+-\d+')].reset_index(drop=True)
 
     # Read cell-information summary
     try:
@@ -488,129 +763,194 @@ def update_cell_performances(params):
         df_performances = pd.DataFrame(index=[], columns=cols)
         mode = 'Create New'
 
-    for jv_id in measurement_ids:
-        # Get reference dataframe
-        df_measurement = df_reference[df_reference['ID'] == jv_id]
-        # Get cell id to get other cell information
-        cell_hex_id = jv_id.split('-')[0]
-        crystallization_date, fabrication_date, batch_number, sample_id, cell_id = decode_cell_hex_id(cell_hex_id)
-        fabrication_days = calculate_date_difference(crystallization_date,fabrication_date)
-        sample_info = df_cell_info[df_cell_info['ID'] == cell_hex_id]['Info'].values[0]
-
-        # Get area based on cell-information
-        area_dat = df_cell_info[df_cell_info['ID'] == cell_hex_id]['Area_dat'].values[0]
-        area_correction = 0 # will be updated to 1 if you correct the area
-        # Check if the dataframe has a corrected area
-        nan_check = np.isnan(df_cell_info.loc[df_cell_info['ID'] == cell_hex_id, 'Area_new'].values[0])
-        if nan_check: # if the value is nan
-            area = area_dat
-        else:
-            area = df_cell_info[df_cell_info['ID'] == cell_hex_id]['Area_new'].values[0]
-            area_correction = 1
-        
-        # trial number
-        trial = int(jv_id.split('-')[2])
-        # measurement filename
-        filename = df_measurement['File Name'].values[0][2:-4]
-
-        # Get measurement information based on jv-id
-        measurement_days = int(jv_id.split('-')[1])
-        measurement_date = add_days_to_date(date_str=fabrication_date,days=measurement_days)
-
-        # get j-v data
-        csv_name = df_measurement['CSV name'].values[0]
+    # Join measurements and cell information once by cell hex id
+    id_parts = df_reference['ID'].str.split('-', expand=True)
+    df = df_reference.assign(cell_hex_id=id_parts[0], measurement_days=id_parts[1].astype(int), trial=id_parts[2].astype(int))
+    df = df.merge(df_cell_info[['ID','Info','Area_dat','Area_new']].rename(columns={'ID': 'cell_hex_id'}),
+                  on='cell_hex_id', how='left', indicator=True)
+    missing = df['_merge'] == 'left_only'
+    if missing.any():
+        print(f'CAUTION: {int(missing.sum())} measurements were skipped because their cells are not in Cell information')
+        for jv_id in df.loc[missing, 'ID']:
+            print(jv_id)
+        df = df[~missing].reset_index(drop=True)
+
+    # cell information from the hex id (once per cell)
+    decoded = {cell_hex_id: decode_cell_hex_id(cell_hex_id) for cell_hex_id in df['cell_hex_id'].unique()}
+    crystallization_date, fabrication_date, batch_number, sample_id, cell_id = [
+        df['cell_hex_id'].map({k: v[n] for k, v in decoded.items()}) for n in range(5)]
+    fabrication_days = df['cell_hex_id'].map({k: calculate_date_difference(v[0], v[1]) for k, v in decoded.items()})
+    measurement_date = (pd.to_datetime(fabrication_date.astype(str), format='%y%m%d')
+                        + pd.to_timedelta(df['measurement_days'], unit='D')).dt.strftime('%y%m%d').astype(int)
+
+    # area: corrected area if it is given in cell information
+    area_correction = df['Area_new'].notna().astype(int) # 1 if you correct the area
+    area = df['Area_new'].where(df['Area_new'].notna(), df['Area_dat']).astype(float)
+    area_original_dat = df['device area'].astype(float)
+
+    # update j-v data only for the files whose area changed since they were written
+    csv_areas = load_csv_areas(performance_csv_path)
+    written_area = df['ID'].map(csv_areas).fillna(area_original_dat)
+    changed = ~np.isclose(written_area, area)
+    for jv_id, csv_name, new_area in zip(df.loc[changed, 'ID'], df.loc[changed, 'CSV name'], area[changed]):
         csv_path = f'{jv_folder_dir}/{csv_name}'
         df_jv = pd.read_csv(csv_path)
-
         V = df_jv['Voltage (V)'].values
         I = df_jv['Current (mA)'].values
-        J = df_jv['Current density (mA/cm2)'].values
-
-        # update j-v data
-        area_original_dat = df_measurement['device area'].values[0]
-        if area_original_dat != area:
-            J = [n/area for n in I]
-            save_JV_as_csv(V, I, J, csv_path)
-
-        # scan direction
-        # check the scan direction based on the voltage data
-        if V[0] > V[-1]:
-            scan_direction = 'R'
-        else:
-            scan_direction = 'F'
-        
-        # get performance info
-        Jsc = df_measurement['Jsc (mA/cm2)'].values[0] * area_original_dat * (-1) / area # mA/cm2: conver it to I then use correct area
-        Voc = df_measurement['Voc (V)'].values[0] # V
-        FF = df_measurement['Fill Factor'].values[0] * 100 # %
-        Pmax = df_measurement['Pmax (mW/cm2)'].values[0] * area_original_dat * (-1) / area
-        Vmpp = df_measurement['Vmpp'].values[0] # V
-        Rseries = df_measurement['Rseries (Ohms)'].values[0] # Ohms
-        Rshunt = df_measurement['Rshunt (Ohms)'].values[0] # Ohms
-
-        # Define new row for the dataframe
-        new_performance = [[
-                    jv_id,
-                    0, # selected
-                    crystallization_date,
-                    fabrication_date,
-                    fabrication_days,
-                    batch_number,
-                    sample_id,
-                    sample_info,
-                    cell_id,
-                    area,
-                    area_correction,
-                    trial,
-                    filename,
-                    measurement_date,
-                    measurement_days,
-                    scan_direction,
-                    Jsc,
-                    Voc,
-                    FF,
-                    Pmax,
-                    Vmpp,
-                    Rseries,
-                    Rshunt,
-                    '' # Note
-                ]]
-
-        new_row = pd.DataFrame(data=new_performance, columns=cols)
-
-        # Merge
-        if mode == 'Create New':
-            if len(df_performances) == 0:
-                df_performances = new_row
-            else:
-                df_performances = pd.concat([df_performances, new_row], ignore_index=True, axis=0)
-
-        elif mode == 'Update':
-            # Merge the previous data and new row based on ID
-            merged_df = df_performances.set_index('ID').combine_first(new_row.set_index('ID'))
-            # For 'Area_new' and 'Selection', we use the existing data
-            merged_df['Selected'] = df_performances.set_index('ID')['Selected'].combine_first(merged_df['Selected'])
-            merged_df['Note'] = df_performances.set_index('ID')['Note'].combine_first(merged_df['Note'])
-            merged_df = merged_df.reset_index()[df_performances.columns]
-            # Update df_performances
-            df_performances = merged_df
-            
-    # Save the data
-    with pd.ExcelWriter(performance_summary_path) as writer:
-        df_performances.to_excel(writer, sheet_name='Performances', index=False)
-
-    # Insert hyperlink for csv files
-    insert_hyperlink(performance_summary_path,jv_folder_dir,performance_csv_path)
-    # Design Excel
-    Design_excel(performance_summary_path)
-    # fill bkg color based on the cell id
-    fill_excel_bkg(performance_summary_path,indication_number=8)
+        save_JV_as_csv(V, I, I / new_area, csv_path)
+    save_csv_areas(performance_csv_path, dict(zip(df.loc[changed, 'ID'], area[changed])))
+
+    # scan direction (written in the csv name, ex: ..._MD35-R_...)
+    scan_direction = df['CSV name'].str.extract(r'_MD\d+-([RF])_', expand=False)
+
+    # performance info (mA/cm2: convert it to I then use correct area)
+    new_rows = pd.DataFrame({
+        'ID': df['ID'],
+        'Selected': 0,
+        'C-date': crystallization_date,
+        'F-date': fabrication_date,
+        'F-days': fabrication_days,
+        'Batch': batch_number,
+        'Sample': sample_id,
+        'Info': df['Info'],
+        'Cell': cell_id,
+        'Area (cm2)': area,
+        'Area correction': area_correction,
+        'Trial': df['trial'],
+        'Filename': df['File Name'].str[2:-4],
+        'M-date': measurement_date,
+        'M-days': df['measurement_days'],
+        'Scan': scan_direction,
+        'Jsc (mA/cm2)': df['Jsc (mA/cm2)'] * area_original_dat * (-1) / area,
+        'Voc (V)': df['Voc (V)'],
+        'FF (%)': df['Fill Factor'] * 100,
+        'Pmax (mW/cm2)': df['Pmax (mW/cm2)'] * area_original_dat * (-1) / area,
+        'Vmpp (V)': df['Vmpp'],
+        'Rseries(ohm)': df['Rseries (Ohms)'],
+        'Rshunt(ohm)': df['Rshunt (Ohms)'],
+        'Note': '',
+    })
+    if metrics == 'curve':
+        # calculate the metrics from the JV curves with the corrected area
+        curves = []
+        for csv_name, curve_area in zip(df['CSV name'], area):
+            df_jv = pd.read_csv(f'{jv_folder_dir}/{csv_name}')
+            curves.append((df_jv['Voltage (V)'].values, df_jv['Current (mA)'].values / curve_area))
+        df_metrics = JVmetrics.jv_metrics(*JVmetrics.pad_curves(curves), area.values)
+        curve_columns = ['Scan','Jsc (mA/cm2)','Voc (V)','FF (%)','Pmax (mW/cm2)','Vmpp (V)','Rseries(ohm)','Rshunt(ohm)']
+        for col in curve_columns:
+            new_rows[col] = df_metrics[col].values
+        # same columns in the existing file (the names are taken from it below)
+        curve_columns = [cols[new_rows.columns.get_loc(col)] for col in curve_columns]
+    new_rows.columns = cols
+
+    # Merge all new rows at once
+    if mode == 'Create New':
+        df_performances = new_rows
+
+    elif mode == 'Update':
+        # Merge the previous data and new rows based on ID
+        merged_df = df_performances.set_index('ID').combine_first(new_rows.set_index('ID'))
+        # For 'Area_new' and 'Selection', we use the existing data
+        merged_df['Selected'] = df_performances.set_index('ID')['Selected'].combine_first(merged_df['Selected'])
+        merged_df['Note'] = df_performances.set_index('ID')['Note'].combine_first(merged_df['Note'])
+        if metrics == 'curve':
+            # the metrics calculated again from the curves replace the existing ones (only Selected and Note are kept)
+            merged_df.update(new_rows.set_index('ID')[curve_columns])
+        merged_df = merged_df.reset_index()[df_performances.columns]
+        # Update df_performances
+        df_performances = merged_df
+
+    # Save the data with the design, hyperlinks for csv files
+    # fill bkg color based on the cell id (9th column)
+    write_excel_report(df_performances, performance_summary_path, sheet_name='Performances', band_column=df_performances.columns[8],
+                       hyperlinks={'ID': csv_links(df_performances['ID'], jv_folder_dir, performance_csv_path)})
 
     print('COMPLETE')
 
     return
 
 
+# One J-V curve for the selection of the best curve
+# J and the metrics are corrected with the area in cell information
+ReviewCurve = namedtuple('ReviewCurve', ['jv_id', 'trial', 'dat', 'V', 'J', 'Jsc', 'Voc', 'FF', 'Pmax', 'selected'])
+
+def load_cell_curves(folder_list, jv_folder_dir, df_performances, df_cell_info, performance_csv_path):
+    """
+    Read the J-V curves of all dat files in the folders once
+    Return {(folder, cell_id): [ReviewCurve, ...]} in the order of the trial number,
+    and {folder: [dat files that could not be parsed]}
+    """
+    df_reference = load_performances(performance_csv_path)
+    csv_names = dict(zip(df_reference['ID'], df_reference['CSV name']))
+    performances = df_performances.drop_duplicates('ID').set_index('ID')
+    cell_areas = df_cell_info.drop_duplicates('ID').set_index('ID')
+
+    cells = {}
+    skipped = {}
+    for folder in folder_list:
+        # jv_id of all dat files (the folder is parsed once)
+        jv_index = get_jv_index(folder)
+        skipped[folder] = [dat for dat in sorted(glob(f'{folder}/*.dat')) if os.path.normpath(dat) not in jv_index]
+        for cell_id, cell_files in group_by_cell(jv_index).items():
+            curves = []
+            for dat, jv_id in cell_files:
+                if jv_id not in performances.index:
+                    print(f'CAUTION: {jv_id} ({os.path.basename(dat)}) is not in the performance summary')
+                    continue
+                performance = performances.loc[jv_id]
+                csv_name = csv_names.get(jv_id) or make_new_filename_dat2csv(dat)
+                df = pd.read_csv(f'{jv_folder_dir}/{csv_name}')
+
+                # Use area from cell_info
+                cell_area = cell_areas.loc[jv_id.split('-')[0]]
+                area_from_cell_info = cell_area['Area_new'] if performance['Area correction'] == 1 else cell_area['Area_dat']
+                area_original = float(performance['Area (cm2)'])
+                curves.append(ReviewCurve(
+                    jv_id=jv_id,
+                    trial=int(jv_id.split('-')[2]),
+                    dat=dat,
+                    V=df['Voltage (V)'].values,
+                    J=df['Current (mA)'].values / area_from_cell_info,
+                    # Correct data based on the area in cell info
+                    Jsc=float(performance['Jsc (mA/cm2)']) * area_original / area_from_cell_info,
+                    Voc=float(performance['Voc (V)']),
+                    FF=float(performance['FF (%)']),
+                    Pmax=float(performance['Pmax (mW/cm2)']) * area_original / area_from_cell_info,
+                    selected=performance['Selected'] == 1,
+                ))
+            if len(curves) > 0:
+                cells[(folder, cell_id)] = curves
+    return cells, skipped
+
+def save_selection(df_performances, select_ids, reviewed_ids, params):
+    """Set "Selected" (1: select_ids, 0: other reviewed_ids) and write the performance summary once"""
+    jv_folder_dir, performance_summary_path, performance_csv_path = params[1], params[3], params[4]
+    # "Selected" will be 0 for all cells that were checked, and 1 for selected cells
+    df_performances.loc[df_performances['ID'].isin(list(reviewed_ids)), 'Selected'] = 0
+    df_performances.loc[df_performances['ID'].isin(list(select_ids)), 'Selected'] = 1
+
+    # Save the data with the design, hyperlinks for csv files
+    # fill bkg color based on the cell id (9th column)
+    write_excel_report(df_performances, performance_summary_path, sheet_name='Performances', band_column=df_performances.columns[8],
+                       hyperlinks={'ID': csv_links(df_performances['ID'], jv_folder_dir, performance_csv_path)})
+
+def plot_cell_curves(curves, ax=None):
+    if ax is None:
+        ax = plt.gca()
+    for curve in curves:
+        ax.plot(curve.V, curve.J, label=curve.trial)
+    # figure design
+    ax.set_xlabel('Voltage (V)')
+    ax.set_ylabel('Current density (mA/cm2)')
+    ax.set_xlim(0,None)
+    ax.set_ylim(0,None)
+    ax.legend(frameon=False)
+    return ax
+
+def curve_summary(curve):
+    return f'#{curve.trial:02}  Jsc: {curve.Jsc:.2f} mA/cm2, Voc: {curve.Voc:.3f} V, FF: {curve.FF:.1f}%, Pmax: {curve.Pmax:.3f} mW/cm2, {os.path.basename(curve.dat)[2:-4]}'
+
 # Select the best JV curves
 def select_best_curve(params):
     folder_list = params[0]
@@ -621,130 +961,122 @@ def select_best_curve(params):
     df_performances = pd.read_excel(performance_summary_path) # Read summary excel
     df_cell_info = pd.read_excel(cell_info_path)
 
-    cell_hex_ids = [] # Recode which cell was analyzed
-    select_ids = []
+    # read all curves before asking
+    cells, skipped = load_cell_curves(folder_list, jv_folder_dir, df_performances, df_cell_info, performance_csv_path)
+    performance_ids = set(df_performances['ID'])
 
+    select_ids = []
+    reviewed_ids = []
     for folder in folder_list:
         # check which folder you are operating
         print(f'{os.path.basename(folder)}\n')
-
-        # grab all dat files in the directory
-        dat_list = glob(f'{folder}/*.dat')
-        dat_list.sort()
-
-        # get know how many cells you have
-        data_id_list = []
-        for dat in dat_list:
-            try:
-                # get info from file name
-                dat_name = os.path.basename(dat)
-                try:
-                    cell_id = float(dat_name.split('-')[0])
-                except:
-                    cell_id = float(dat_name.split('_')[0])
-                cell_hex_id = get_cell_hex_id(dat)
-                cell_hex_ids.append(cell_hex_id)
-                data_id_list.append(cell_id)
-            except:
-                # remove exceptional data
-                print(f'CAUTION: skipped {dat_name}')
-                dat_list.remove(dat)
-                continue
-        check_list = list(set(data_id_list))
-        check_list.sort()
+        for dat in skipped[folder]:
+            # remove exceptional data
+            print(f'CAUTION: skipped {os.path.basename(dat)}')
+        reviewed_ids += get_jv_index(folder).values()
 
         # plot all data to select the best JV for each cell
-        for check_id in check_list:
+        for (cell_folder, check_id), curves in cells.items():
+            if cell_folder != folder:
+                continue
             print(f'\nCell {int(check_id):02}')
             fig = plt.figure(figsize=(6,4))
-
-            for dat in dat_list:
-                # get info from file name
-                dat_name = os.path.basename(dat)
-                try:
-                    cell_id = float(dat_name.split('-')[0])
-                except:
-                    cell_id = float(dat_name.split('_')[0])
-                jv_id = get_jv_id(dat)
-                # "Selected" will be 0 for all cells that were checked (initialize)
-                df_performances.loc[df_performances['ID'] == jv_id, 'Selected'] = 0
-                
-                if cell_id == check_id:
-                    # Get some info
-                    measurement_id = jv_id[:-2] # ex '555F73CFCB9895-35-'
-                    measurement_info = dat_name[2:-4]
-                    csv_name = make_new_filename_dat2csv(dat) # get csv name
-                    csv_path = f'{jv_folder_dir}/{csv_name}'
-                    trial = int(jv_id.split('-')[2])
-
-                    # check performance
-                    df_performance = df_performances[df_performances['ID'] == jv_id]
-                    Jsc = float(df_performance['Jsc (mA/cm2)'].values[0])
-                    Voc = float(df_performance['Voc (V)'].values[0])
-                    FF = float(df_performance['FF (%)'].values[0])
-                    Pmax = float(df_performance['Pmax (mW/cm2)'].values[0])
-                    area_original = float(df_performance['Area (cm2)'].values[0])
-
-                    # get J-V data
-                    df = pd.read_csv(csv_path)
-                    V = df['Voltage (V)'].values
-                    I = df['Current (mA)'].values
-
-                    # Use area from cell_info
-                    area_from_cell_info = df_cell_info[df_cell_info['ID']==jv_id.split('-')[0]]['Area_dat'].values[0]
-                    if df_performance['Area correction'].values[0] == 1:
-                        area_from_cell_info = df_cell_info[df_cell_info['ID']==jv_id.split('-')[0]]['Area_new'].values[0]
-                    # Correct data based on the area in cell info
-                    Jsc = Jsc * area_original / area_from_cell_info
-                    Pmax = Pmax * area_original / area_from_cell_info
-                    J = [n/area_from_cell_info for n in I]
-
-                    # plot
-                    plt.plot(V,J,label=trial)
-
-                    print(f'#{trial:02}  Jsc: {Jsc:.2f} mA/cm2, Voc: {Voc:.3f} V, FF: {FF:.1f}%, Pmax: {Pmax:.3f} mW/cm2, {measurement_info}')
-
-            # figure design
-            plt.xlabel('Voltage (V)')
-            plt.ylabel('Current density (mA/cm2)')
-            plt.xlim(0,None)
-            plt.ylim(0,None)
-            plt.legend(frameon=False)
+            plot_cell_curves(curves)
+            for curve in curves:
+                print(curve_summary(curve))
             plt.show()
 
+            measurement_id = curves[-1].jv_id[:-2] # ex '555F73CFCB9895-35-'
             while True:
                 X = input(f'Select a number for the best JV data of Cell {int(check_id):02}')
                 try:
                     print(f'#{X} was selected for Cell {int(check_id):02}')
                     # get selected jv-id for the selected data
                     select_id = f'{measurement_id}{int(X):02}'
-                    if select_id in df_performances['ID'].values:
+                    if select_id in performance_ids:
                         select_ids.append(select_id)
                         break
                     else:
                         print('Out of range. Try again.')
                 except:
                     print('Invalid input. Try again.')
-                
 
     # Update Performance summary excel file based on select_ids
-    # "Selected" will be 1 for selected cells
-    for ID in select_ids:
-        df_performances.loc[df_performances['ID'] == ID, 'Selected'] = 1
-
-    # Save the data
-    with pd.ExcelWriter(performance_summary_path) as writer:
-        df_performances.to_excel(writer, sheet_name='Performances', index=False)
-
-    # Insert hyperlink for csv files
-    insert_hyperlink(performance_summary_path,jv_folder_dir,performance_csv_path)
-    # Design Excel
-    Design_excel(performance_summary_path)
-    # fill bkg color based on the cell id
-    fill_excel_bkg(performance_summary_path,indication_number=8)
+    save_selection(df_performances, select_ids, reviewed_ids, params)
 
     print('DONE')
 
     return
 
+def review_best_curve(params, columns=3, rows=2):
+    """
+    Select the best JV curves in Jupyter without blocking (needs ipywidgets)
+    All curves are read once and shown in pages of columns x rows cells.
+    Choose a trial for each cell with the buttons (Tab / Space work too), and "Save" writes all selections at once.
+    The best Pmax (or the current selection) is chosen by default.
+    params: same as select_best_curve
+    """
+    try:
+        import ipywidgets as widgets
+        from IPython.display import display
+    except ImportError:
+        print('ipywidgets is not installed. Use select_best_curve instead.')
+        return
 
+    folder_list, jv_folder_dir, cell_info_path, performance_summary_path, performance_csv_path = params
+    df_performances = pd.read_excel(performance_summary_path) # Read summary excel
+    df_cell_info = pd.read_excel(cell_info_path)
+    cells, skipped = load_cell_curves(folder_list, jv_folder_dir, df_performances, df_cell_info, performance_csv_path)
+    for folder, dats in skipped.items():
+        for dat in dats:
+            print(f'CAUTION: skipped {os.path.basename(dat)}')
+
+    keys = list(cells)
+    selection = {}
+    for key, curves in cells.items():
+        selected = [curve.jv_id for curve in curves if curve.selected]
+        selection[key] = selected[0] if selected else max(curves, key=lambda curve: np.nan_to_num(curve.Pmax, nan=-np.inf)).jv_id
+    reviewed_ids = [jv_id for folder in folder_list for jv_id in get_jv_index(folder).values()]
+
+    boxes = {} # each cell is drawn once
+    def cell_box(key):
+        if key not in boxes:
+            curves = cells[key]
+            out = widgets.Output()
+            with out:
+                fig, ax = plt.subplots(figsize=(4,3))
+                plot_cell_curves(curves, ax)
+                display(fig)
+                plt.close(fig)
+            buttons = widgets.ToggleButtons(options=[(f'#{curve.trial:02}', curve.jv_id) for curve in curves], value=selection[key],
+                                            tooltips=[curve_summary(curve) for curve in curves], style={'button_width': '48px'})
+            buttons.observe(lambda change, key=key: selection.__setitem__(key, change['new']), names='value')
+            title = widgets.HTML(f'<b>{os.path.basename(key[0])}, Cell {int(key[1]):02}</b>')
+            boxes[key] = widgets.VBox([title, out, buttons])
+        return boxes[key]
+
+    per_page = columns * rows
+    n_pages = max(int(np.ceil(len(keys) / per_page)), 1)
+    grid = widgets.GridBox(layout=widgets.Layout(grid_template_columns=f'repeat({columns}, 1fr)'))
+    page_label = widgets.Label()
+    previous_button = widgets.Button(description='Previous')
+    next_button = widgets.Button(description='Next')
+    save_button = widgets.Button(description='Save', button_style='success')
+    message = widgets.Label()
+    page = [0]
+
+    def show_page(n):
+        page[0] = min(max(n, 0), n_pages - 1)
+        grid.children = [cell_box(key) for key in keys[page[0]*per_page:(page[0]+1)*per_page]]
+        page_label.value = f'Page {page[0]+1} / {n_pages}'
+
+    def save(button):
+        save_selection(df_performances, selection.values(), reviewed_ids, params)
+        message.value = f'Saved {len(selection)} selections to {os.path.basename(performance_summary_path)}'
+
+    previous_button.on_click(lambda button: show_page(page[0] - 1))
+    next_button.on_click(lambda button: show_page(page[0] + 1))
+    save_button.on_click(save)
+    show_page(0)
+    display(widgets.VBox([widgets.HBox([previous_button, page_label, next_button, save_button, message]), grid]))
+    return selection
@@ -0,0 +1,154 @@
+'''
+JV metrics from raw J-V curves
+
+Many curves are processed at once as a padded 2-D array (one curve per row, nan after the last point).
+J is in mA/cm2 with the photocurrent positive (same as the JV csv files made by JVanalysis).
+
+Usage in a notebook:
+    import JVmetrics
+    V, J = JVmetrics.pad_curves([(V1, J1), (V2, J2)])
+    df = JVmetrics.jv_metrics(V, J, area)    # Jsc, Voc, FF, Pmax, Vmpp, Rseries, Rshunt, Scan
+'''
+
+import numpy as np
+import pandas as pd
+
+METRIC_COLUMNS = ['Scan','Jsc (mA/cm2)','Voc (V)','FF (%)','Pmax (mW/cm2)','Vmpp (V)','Jmpp (mA/cm2)','Rseries(ohm)','Rshunt(ohm)']
+
+def pad_curves(curves):
+    """List of (V, J) -> V, J as 2-D arrays (number of curves, longest curve) padded with nan"""
+    n_points = max([len(V) for V, J in curves] + [2])
+    V_2d = np.full((len(curves), n_points), np.nan)
+    J_2d = np.full((len(curves), n_points), np.nan)
+    for n, (V, J) in enumerate(curves):
+        V_2d[n, :len(V)] = V
+        J_2d[n, :len(J)] = J
+    return V_2d, J_2d
+
+def scan_direction(V):
+    """'R' if the voltage goes down (first point higher than the last point), otherwise 'F'"""
+    V = np.asarray(V, dtype=float)
+    last = V[np.arange(len(V)), np.maximum(np.sum(~np.isnan(V), axis=1) - 1, 0)]
+    return np.where(V[:, 0] > last, 'R', 'F')
+
+def sort_by_voltage(V, J):
+    # nan is sorted to the end of each row
+    order = np.argsort(V, axis=1)
+    return np.take_along_axis(V, order, axis=1), np.take_along_axis(J, order, axis=1)
+
+def interpolate_rows(x, y, x0):
+    """Linear interpolation of each row at x0 (x sorted, nan at the end); the end segments are extended"""
+    rows = np.arange(len(x))
+    n_valid = np.sum(~np.isnan(x), axis=1)
+    k = np.clip(np.sum(x < x0[:, None], axis=1), 1, np.maximum(n_valid - 1, 1))
+    x1, x2, y1, y2 = x[rows, k-1], x[rows, k], y[rows, k-1], y[rows, k]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return y1 + (y2 - y1) * (x0 - x1) / (x2 - x1)
+
+def zero_crossing(x, y):
+    """x where y first becomes <= 0 in each row (x sorted), nan if y does not cross zero"""
+    rows = np.arange(len(x))
+    below = y <= 0 # nan -> False
+    first = np.argmax(below, axis=1)
+    crossed = below.any(axis=1) & (first > 0)
+    k = np.maximum(first, 1)
+    x1, x2, y1, y2 = x[rows, k-1], x[rows, k], y[rows, k-1], y[rows, k]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(crossed, x1 + y1 * (x2 - x1) / (y1 - y2), np.nan)
+
+def local_slope(x, y, x0, n_points=5):
+    """Least-squares slope dy/dx of the n_points points nearest to x0 in each row (nan if less than 2 points)"""
+    distance = np.abs(x - x0[:, None])
+    distance[np.isnan(distance)] = np.inf
+    nearest = np.argsort(distance, axis=1)[:, :n_points]
+    xs = np.take_along_axis(x, nearest, axis=1)
+    ys = np.take_along_axis(y, nearest, axis=1)
+    used = np.isfinite(np.take_along_axis(distance, nearest, axis=1)) & np.isfinite(ys)
+    n = used.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_mean = np.where(used, xs, 0).sum(axis=1) / n
+        y_mean = np.where(used, ys, 0).sum(axis=1) / n
+        dx = np.where(used, xs - x_mean[:, None], 0)
+        dy = np.where(used, ys - y_mean[:, None], 0)
+        return np.where(n >= 2, (dx * dy).sum(axis=1) / (dx * dx).sum(axis=1), np.nan)
+
+def jv_metrics(V, J, area, n_points=5):
+    """
+    Metrics of each curve (row) of the padded arrays V (V) and J (mA/cm2, photocurrent positive)
+    area: device area (cm2), scalar or one value per curve
+    n_points: number of points for the local slopes at Voc (series resistance) and at 0 V (shunt resistance)
+    Return a DataFrame with the columns in METRIC_COLUMNS (same names as the performance summary)
+    """
+    V = np.atleast_2d(np.asarray(V, dtype=float))
+    J = np.atleast_2d(np.asarray(J, dtype=float))
+    area = np.broadcast_to(np.asarray(area, dtype=float), (len(V),))
+    rows = np.arange(len(V))
+    scan = scan_direction(V)
+    V, J = sort_by_voltage(V, J)
+
+    # Jsc at 0 V and Voc at J = 0
+    Jsc = interpolate_rows(V, J, np.zeros(len(V)))
+    Voc = zero_crossing(V, J)
+
+    # maximum power point in the first quadrant (mW/cm2)
+    P = V * J
+    in_quadrant = (V >= 0) & (J >= 0)
+    mpp = np.argmax(np.where(in_quadrant, P, -np.inf), axis=1)
+    found = in_quadrant.any(axis=1)
+    Pmax = np.where(found, P[rows, mpp], np.nan)
+    Vmpp = np.where(found, V[rows, mpp], np.nan)
+    Jmpp = np.where(found, J[rows, mpp], np.nan)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        FF = Pmax / (Jsc * Voc) * 100 # %
+        # resistance from the local slopes: V/(mA/cm2) -> ohm cm2 -> ohm
+        Rseries = (-1) * 1000 / (local_slope(V, J, Voc, n_points) * area)
+        Rshunt = (-1) * 1000 / (local_slope(V, J, np.zeros(len(V)), n_points) * area)
+
+    return pd.DataFrame(dict(zip(METRIC_COLUMNS, [scan, Jsc, Voc, FF, Pmax, Vmpp, Jmpp, Rseries, Rshunt])))
+
+def hysteresis_index(Pmax_reverse, Pmax_forward):
+    """(PCE_reverse - PCE_forward) / PCE_reverse"""
+    Pmax_reverse = np.asarray(Pmax_reverse, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (Pmax_reverse - np.asarray(Pmax_forward, dtype=float)) / Pmax_reverse
+
+def split_sweeps(V, min_points=3):
+    """Split a voltage sequence into monotonic sweeps, return a list of slices (the turning point is in both)"""
+    V = np.asarray(V, dtype=float)
+    step = np.sign(np.diff(V))
+    moving = np.flatnonzero(step) # constant voltage belongs to the current sweep
+    turns = moving[1:][step[moving[1:]] != step[moving[:-1]]]
+    bounds = [0] + list(turns) + [len(V) - 1]
+    return [slice(start, end + 1) for start, end in zip(bounds[:-1], bounds[1:]) if end + 1 - start >= min_points]
+
+def read_sweep_csv(path):
+    """
+    csv files of Keithley2450 (run_IV) and Keithley617 (JVMeasurementApp)
+    columns: Time (s), Current (A), Voltage (V) (and Cycle for 617)
+    Return a list of (cycle, V, I) for each monotonic sweep
+    """
+    df = pd.read_csv(path)
+    V = df['Voltage (V)'].to_numpy(dtype=float)
+    I = df['Current (A)'].to_numpy(dtype=float)
+    cycles = df['Cycle'].to_numpy() if 'Cycle' in df.columns else np.ones(len(df), dtype=int)
+    sweeps = []
+    for cycle in pd.unique(cycles):
+        index = np.flatnonzero(cycles == cycle)
+        for sweep in split_sweeps(V[index]):
+            sweeps.append((cycle, V[index][sweep], I[index][sweep]))
+    return sweeps
+
+def pair_hysteresis(keys, scan, Pmax):
+    """
+    Hysteresis index of each curve, pairing the first 'R' and the first 'F' curve with the same key
+    (nan if the pair is not complete)
+    """
+    first = {}
+    for n, (key, direction) in enumerate(zip(keys, scan)):
+        first.setdefault((key, direction), n)
+    index = np.full(len(keys), np.nan)
+    for n, key in enumerate(keys):
+        if (key, 'R') in first and (key, 'F') in first:
+            index[n] = hysteresis_index(Pmax[first[(key, 'R')]], Pmax[first[(key, 'F')]])
+    return index
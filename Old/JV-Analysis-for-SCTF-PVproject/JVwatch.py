@@ -0,0 +1,184 @@
+'''
+Watch a project folder and analyze new JV dat files as soon as they are written
+
+The project folder has the same structure as for organize.ipynb:
+    project_dir/C240303/F240325_B2/M240429/1_sample/01-1_Rscan.dat
+New (or modified) dat files are
+1. added to Cell-information.xlsx, 2. converted to csv and saved in the performance store (JV-csv-data),
+3. scored in Performance.xlsx
+A dat file that is written again (same jv_id) replaces its values in the performance store.
+A new file that would take the jv_id of another dat file (it sorts before the existing files of its cell)
+is not saved (see JVanalysis.upsert_performances). Files that could not be analyzed are tried again after a while.
+File-system events come from watchdog if it is installed; otherwise the folders are polled.
+
+Usage in a notebook (interrupt the kernel to stop):
+    import JVwatch
+    JVwatch.watch(project_dir)
+or from a terminal:
+    python JVwatch.py /path/to/project
+'''
+
+import os
+import sys
+import time
+import queue
+from glob import glob
+from pathlib import Path
+import JVanalysis as jv
+
+# dat files are in project_dir/C*/F*/M*/sample/
+DAT_PATTERN = 'C*/F*/M*/*/*.dat'
+
+def project_paths(project_dir):
+    """Same file names as organize.ipynb"""
+    return {
+        'cell_info_path': f'{project_dir}/Cell-information.xlsx',
+        'jv_folder_dir': f'{project_dir}/JV-csv-data',
+        'performance_csv_path': f'{project_dir}/JV-csv-data/_summary.csv',
+        'performance_summary_path': f'{project_dir}/Performance.xlsx',
+    }
+
+def is_measurement_file(path, project_dir):
+    # project_dir/C.../F.../M.../sample/file.dat
+    try:
+        parts = Path(path).relative_to(project_dir).parts
+    except ValueError:
+        return False
+    return (len(parts) == 5 and parts[-1].endswith('.dat')
+            and parts[0].startswith('C') and parts[1].startswith('F') and parts[2].startswith('M'))
+
+def snapshot(project_dir):
+    """{dat path: (size, mtime)} of all dat files in the project"""
+    files = {}
+    for dat in glob(f'{project_dir}/{DAT_PATTERN}'):
+        try:
+            stat = os.stat(dat)
+        except FileNotFoundError:
+            continue
+        files[os.path.normpath(dat)] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+def unprocessed_files(project_dir, performance_csv_path):
+    """dat files whose jv_id is not in the performance store yet"""
+    try:
+        known_ids = set(jv.load_performances(performance_csv_path)['ID'])
+    except Exception:
+        known_ids = set()
+    pending = []
+    for folder in sorted({os.path.dirname(dat) for dat in snapshot(project_dir)}):
+        for dat, jv_id in jv.get_jv_index(folder).items():
+            if jv_id not in known_ids:
+                pending.append(dat)
+    return pending
+
+def process_files(dat_list, paths, max_workers=1):
+    """
+    Cell information, csv conversion and performance summary for the dat files (grouped by folder)
+    The files are new or were written again, so their performances replace the stored ones
+    """
+    folder_files = {}
+    for dat in dat_list:
+        folder_files.setdefault(os.path.dirname(dat), []).append(dat)
+    folders = sorted(folder_files)
+    print(f'{time.strftime("%H:%M:%S")} {len(dat_list)} new files in {", ".join(os.path.basename(f) for f in folders)}')
+
+    jv.update_cell_information(folders, paths['cell_info_path'])
+    jv.save_dat_files(folder_files, paths['jv_folder_dir'], paths['performance_csv_path'], max_workers=max_workers, overwrite=True)
+    jv.update_cell_performances([paths['jv_folder_dir'], paths['performance_csv_path'],
+                                 paths['cell_info_path'], paths['performance_summary_path']])
+
+class _EventCollector:
+    """watchdog handler putting the paths of created, modified or moved dat files in a queue"""
+    def __init__(self, project_dir, events):
+        self.project_dir = project_dir
+        self.events = events
+
+    # events of writing (reading the files in the analysis gives "opened" and "closed_no_write")
+    EVENT_TYPES = ('created', 'modified', 'moved', 'closed')
+
+    def dispatch(self, event):
+        if event.is_directory or event.event_type not in self.EVENT_TYPES:
+            return
+        for path in [getattr(event, 'dest_path', None), event.src_path]:
+            if path and is_measurement_file(path, self.project_dir):
+                self.events.put(os.path.normpath(path))
+                break
+
+def _start_observer(project_dir, events):
+    try:
+        from watchdog.observers import Observer
+    except ImportError:
+        return None
+    observer = Observer()
+    observer.schedule(_EventCollector(project_dir, events), project_dir, recursive=True)
+    observer.start()
+    return observer
+
+def watch(project_dir, interval=2.0, settle=2.0, use_watchdog=True, max_workers=1, process_existing=True, retry=30.0):
+    """
+    Analyze new dat files until interrupted
+    interval: seconds between checks, settle: a file is analyzed when its size and mtime did not change for this time
+    retry: seconds before the files of a failed analysis are tried again
+    use_watchdog: use file-system events (watchdog) if installed, otherwise poll the folders every interval
+    process_existing: analyze the dat files that are not in the performance store yet at the start
+    """
+    project_dir = os.path.normpath(str(project_dir))
+    paths = project_paths(project_dir)
+    events = queue.Queue()
+    observer = _start_observer(project_dir, events) if use_watchdog else None
+    print(f'Watching {project_dir} ({"file-system events" if observer else f"polling every {interval} s"})')
+
+    pending = {} # {dat: ((size, mtime), time when it was last changed)}
+    if process_existing:
+        now = time.monotonic() - settle
+        for dat in unprocessed_files(project_dir, paths['performance_csv_path']):
+            pending[dat] = (None, now)
+    previous = snapshot(project_dir) if observer is None else {}
+
+    try:
+        while True:
+            now = time.monotonic()
+            # new or changed files
+            if observer is None:
+                current = snapshot(project_dir)
+                changed = [dat for dat, state in current.items() if previous.get(dat) != state]
+                previous = current
+            else:
+                changed = []
+                while not events.empty():
+                    changed.append(events.get())
+            for dat in changed:
+                pending[dat] = (None, now)
+
+            # files that are completely written
+            ready = []
+            for dat, (state, changed_at) in list(pending.items()):
+                try:
+                    stat = os.stat(dat)
+                except FileNotFoundError:
+                    del pending[dat]
+                    continue
+                new_state = (stat.st_size, stat.st_mtime_ns)
+                if new_state != state:
+                    pending[dat] = (new_state, now if state is not None else changed_at)
+                elif now - changed_at >= settle:
+                    ready.append(dat)
+            if ready:
+                states = {dat: pending.pop(dat)[0] for dat in ready}
+                try:
+                    process_files(ready, paths, max_workers)
+                except Exception as e:
+                    print(f'Could not analyze the new files due to the error "{e}". They are tried again in {retry} s.')
+                    # back to pending (unless they were changed in the meantime), ready again after retry
+                    for dat in ready:
+                        pending.setdefault(dat, (states[dat], now + retry - settle))
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print('STOPPED')
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+
+if __name__ == '__main__':
+    watch(sys.argv[1] if len(sys.argv) > 1 else os.getcwd())
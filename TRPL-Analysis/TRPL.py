@@ -1,15 +1,13 @@
 import matplotlib.pyplot as plt
 import pandas as pd
-from glob import glob
 import os
 import numpy as np
-from scipy.optimize import curve_fit
+from scipy.optimize import curve_fit, least_squares, nnls
 from sklearn.metrics import r2_score
-import openpyxl
-from openpyxl import load_workbook
-from openpyxl.styles import Font, PatternFill, Alignment
-from openpyxl.utils import get_column_letter
+import json
 from pathlib import Path
+import fitcache
+from decay_cutoff import detect_cut_off
 
 def list_directories(path):
     path = Path(path)
@@ -27,14 +25,56 @@ def bi_exponential_decay(t,A1,A2,tau1,tau2, c):
 def tri_exponential_decay(t,A1,A2,A3,tau1,tau2,tau3, c):
     return A1 * np.exp((-1)*t/tau1) + A2 * np.exp((-1)*t/tau2) + A3 * np.exp((-1)*t/tau3) + c
 
+# Analytic Jacobians (columns follow the parameter order of the models above)
+def single_exponential_jac(t,A1,tau1, c):
+    e1 = np.exp((-1)*t/tau1)
+    return np.column_stack((e1, A1*t*e1/tau1**2, np.ones_like(t)))
+
+def bi_exponential_jac(t,A1,A2,tau1,tau2, c):
+    e1, e2 = np.exp((-1)*t/tau1), np.exp((-1)*t/tau2)
+    return np.column_stack((e1, e2, A1*t*e1/tau1**2, A2*t*e2/tau2**2, np.ones_like(t)))
+
+def tri_exponential_jac(t,A1,A2,A3,tau1,tau2,tau3, c):
+    e1, e2, e3 = np.exp((-1)*t/tau1), np.exp((-1)*t/tau2), np.exp((-1)*t/tau3)
+    return np.column_stack((e1, e2, e3, A1*t*e1/tau1**2, A2*t*e2/tau2**2, A3*t*e3/tau3**2, np.ones_like(t)))
+
+# model, jacobian and initial guess for each fitting model
+MODELS = {
+    'tri': (tri_exponential_decay, tri_exponential_jac, [0.7, 0.2, 0.1, 5, 50, 100, 0]),
+    'bi': (bi_exponential_decay, bi_exponential_jac, [0.7, 0.2, 5, 50, 0]),
+    'single': (single_exponential_decay, single_exponential_jac, [0.7, 0.2, 0]),
+}
+
+# settings that change the fit result (used as a part of the cache key)
+FIT_SETTINGS = {
+    'normalize': True,
+    'cut': {'start_power': -3, 'step': 0.2, 'method': 'envelope'},
+    'initial_guess': {name: model[2] for name, model in MODELS.items()},
+    # starting points tried in select_model: warm start from the larger model, variable projection, fixed guess
+    'init': ['warm', 'varpro', 'fixed'],
+    'selection': 'bic',
+}
+
+def to_results(model_name, popt):
+    """Pad fitted parameters to [A1, A2, A3, t1, t2, t3, c]"""
+    p = list(popt)
+    if model_name == 'tri':
+        return p
+    elif model_name == 'bi':
+        return [p[0], p[1], 0, p[2], p[3], 0, p[4]]
+    else:
+        return [p[0], 0, 0, p[1], 0, 0, p[2]]
+
 def process_data(X,Y,normalize=True):
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
     # find on-time
-    on_index = Y.index(max(Y))
+    on_index = int(np.argmax(Y))
     offset_time = X[on_index]
-    X = [x-offset_time for x in X]
+    X = X - offset_time
     if normalize:
-        # normalize
-        Y = [(y-min(Y))/max(Y) for y in Y]
+        # normalize (min and max are computed once for the whole array)
+        Y = (Y - Y.min()) / Y.max()
     return X, Y, on_index
 
 def take_a_look(X,Y,label,log_plot=True):
@@ -48,16 +88,96 @@ def take_a_look(X,Y,label,log_plot=True):
     plt.show()
     return
 
+# Sidecar with the parsed arrays (saved next to the data file as "<file name>.npz")
+SIDECAR_SUFFIX = '.npz'
+
+def _is_number(text):
+    try:
+        float(text)
+        return True
+    except ValueError:
+        return False
+
+def sniff_header(path, max_lines=1000, delimiter=','):
+    """
+    Find the header length (first line that has two numbers) and
+    read the header as {key: value} from "key,value" lines
+    """
+    header = {}
+    with open(path, 'r', errors='replace') as f:
+        for i, line in enumerate(f):
+            parts = [part.strip() for part in line.strip().split(delimiter)]
+            if len(parts) >= 2 and _is_number(parts[0]) and _is_number(parts[1]):
+                return i, header
+            if len(parts) >= 2 and parts[0]:
+                header[parts[0]] = delimiter.join(parts[1:]).strip()
+            if i >= max_lines:
+                break
+    raise ValueError(f'no data found in {os.path.basename(path)}')
+
+def _sidecar_path(path):
+    return f'{path}{SIDECAR_SUFFIX}'
+
+def _load_sidecar(path):
+    sidecar = _sidecar_path(path)
+    try:
+        stat = os.stat(path)
+        with np.load(sidecar) as data:
+            # use the sidecar only if it was made from the same file
+            if data['source_size'] == stat.st_size and data['source_mtime'] == stat.st_mtime_ns:
+                return data['X'], data['Y'], json.loads(str(data['metadata']))
+    except Exception:
+        pass
+    return None
+
+def _save_sidecar(path, X, Y, metadata):
+    stat = os.stat(path)
+    try:
+        with open(_sidecar_path(path), 'wb') as f:
+            np.savez(f, X=X, Y=Y, metadata=json.dumps(metadata),
+                     source_size=stat.st_size, source_mtime=stat.st_mtime_ns)
+    except OSError:
+        pass # read-only folder, just parse the text next time
+
+def load_decay(path, use_sidecar=True):
+    """
+    Read a TRPL histogram (time (ns), counts) as float arrays
+    The header length is detected, and the parsed arrays are saved in a sidecar,
+    so the text is parsed only once as long as the file is not modified
+    Return X, Y, metadata (header, header_lines, dt, n_bins)
+    """
+    if use_sidecar:
+        loaded = _load_sidecar(path)
+        if loaded is not None:
+            return loaded
+
+    header_lines, header = sniff_header(path)
+    data = pd.read_csv(path, delimiter=',', skiprows=header_lines, header=None, usecols=[0, 1], dtype=float, engine='c')
+    data = data.dropna().to_numpy()
+    X = np.ascontiguousarray(data[:, 0]) # time (ns)
+    Y = np.ascontiguousarray(data[:, 1]) # count (cts)
+    metadata = {
+        'header': header,
+        'header_lines': header_lines,
+        'dt': float(np.median(np.diff(X))) if len(X) > 1 else None, # time bin (ns)
+        'n_bins': int(len(X)),
+    }
+    if use_sidecar:
+        _save_sidecar(path, X, Y, metadata)
+    return X, Y, metadata
+
+def read_decay(path, use_sidecar=True):
+    X, Y, _ = load_decay(path, use_sidecar)
+    return X, Y
+
 def check_data(path):
-    data = pd.read_csv(path,delimiter=',',skiprows=10,header=None)
     label = os.path.basename(path)[:-4]
-    X = data[0].to_list() # time (ns)
-    Y = data[1].to_list() # count (cts)
+    X, Y = read_decay(path)
     X, Y, _ = process_data(X, Y, normalize=True)
     take_a_look(X,Y,label,log_plot=True)
 
 def show_fit_result(popt,r2,r2_log,results,label,X,Y,X_for_fit,Y_fit,figsave,fig_dir):
-    print('Fit: a1=%5.3f, a2=%5.3f, a3=%5.3f, t1=%5.3f, t2=%5.3f, t3=%5.3f, c=%5.3f' % tuple(popt))
+    print('Fit: a1=%5.3f, a2=%5.3f, a3=%5.3f, t1=%5.3f, t2=%5.3f, t3=%5.3f, c=%5.3f' % tuple(results))
     print(f'R2: {r2:.4f}, R2_log: {r2_log:.4f}')
 
     lifetime = max(results[3:6])
@@ -83,157 +203,262 @@ def show_fit_result(popt,r2,r2_log,results,label,X,Y,X_for_fit,Y_fit,figsave,fig
 
     return fig
 
-def TRPL_fit(X, Y, label, fig_dir, figsave=False):
+def fit_log_model(model_name, X_for_fit, log_Y_for_fit, p0=None):
+    """
+    Fit log(model) to log(Y) with the analytic Jacobian
+    d log(f)/dp = (df/dp) / f
+    """
+    model, jac, initial_guess = MODELS[model_name]
+    if p0 is None:
+        p0 = initial_guess
+
+    def log_fit(t, *params):
+        return np.log(model(t, *params))
+
+    def log_jac(t, *params):
+        return jac(t, *params) / model(t, *params)[:, None]
+
+    # Bounds for the parameters (all parameters are positive)
+    bounds = (0, np.inf)
+    popt, _ = curve_fit(log_fit, X_for_fit, log_Y_for_fit, p0=p0, bounds=bounds, jac=log_jac)
+    return popt
+
+def cascade_fit(X_for_fit, log_Y_for_fit):
+    """Old model choice: start from tri exponential, then fall back to bi and single exponential"""
+    for model_name in ['tri', 'bi', 'single']:
+        popt = fit_log_model(model_name, X_for_fit, log_Y_for_fit)
+        results = to_results(model_name, popt)
+        if model_name == 'tri' and min(results[0:2]) > 0.01:
+            break
+        elif model_name == 'bi' and min(results[0:1]) > 0.01:
+            break
+    return model_name, popt, {}
+
+def warm_start(popt, n_components):
+    """
+    Initial guess for a smaller model from fitted parameters
+    keep the n_components components with the largest weight (A*tau)
+    """
+    n = (len(popt) - 1) // 2
+    A, tau, c = np.asarray(popt[:n]), np.asarray(popt[n:2*n]), popt[-1]
+    keep = np.sort(np.argsort(A * tau)[::-1][:n_components])
+    keep = keep[np.argsort(tau[keep])] # short lifetime first
+    # avoid starting at the bounds (A = 0 or tau = 0)
+    A_guess = np.maximum(A[keep], 1e-3)
+    tau_guess = np.maximum(tau[keep], 1e-3)
+    return list(A_guess) + list(tau_guess) + [max(c, 0)]
+
+def information_criterion(log_Y_for_fit, log_Y_fit, n_params, selection='bic'):
+    """AIC or BIC of a fit in log space: n*ln(RSS/n) + penalty"""
+    n = len(log_Y_for_fit)
+    rss = np.sum((log_Y_for_fit - log_Y_fit) ** 2)
+    rss = max(rss, np.finfo(float).tiny)
+    if selection == 'aic':
+        return n * np.log(rss / n) + 2 * n_params
+    else:
+        return n * np.log(rss / n) + n_params * np.log(n)
+
+def estimate_lifetimes(X_for_fit, log_Y_for_fit, n_components):
+    """
+    Data-driven initial lifetimes from the log-slope of the decay
+    The decay is split into n_components segments with the same drop in log(Y)
+    (fast components dominate the first segment, slow ones the last),
+    and tau = -1/slope of a straight line fitted to log(Y) in each segment
+    """
+    X_for_fit = np.asarray(X_for_fit, dtype=float)
+    log_Y_for_fit = np.asarray(log_Y_for_fit, dtype=float)
+    span = max(X_for_fit[-1] - X_for_fit[0], np.finfo(float).eps)
+    dt = max(np.median(np.diff(X_for_fit)), np.finfo(float).eps)
+
+    # running minimum makes log(Y) monotone so that each level is crossed once
+    envelope = np.minimum.accumulate(log_Y_for_fit)
+    levels = np.linspace(envelope[0], envelope[-1], n_components + 1)
+    edges = np.searchsorted(-envelope, -levels)
+    edges[0], edges[-1] = 0, len(X_for_fit)
+
+    taus = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        # at least 2 points for a slope
+        start, end = min(start, len(X_for_fit) - 2), max(end, start + 2)
+        slope = np.polyfit(X_for_fit[start:end], log_Y_for_fit[start:end], 1)[0]
+        taus.append(-1 / slope if slope < 0 else span)
+    taus = np.clip(np.sort(taus), dt, 10 * span)
+
+    # separate lifetimes that came out (almost) the same
+    for i in range(1, len(taus)):
+        taus[i] = max(taus[i], 2 * taus[i-1])
+    return taus
+
+def exponential_basis(t, taus):
+    """Columns exp(-t/tau_i) and a constant column for the offset c"""
+    return np.column_stack([np.exp((-1)*t[:, None]/np.asarray(taus)[None, :]), np.ones_like(t)])
+
+def linear_amplitudes(t, Y, taus):
+    """
+    Amplitudes and offset for fixed lifetimes in closed form
+    (non-negative least squares weighted by 1/Y, i.e. relative error like the log fit)
+    """
+    weight = 1 / Y
+    basis = exponential_basis(t, taus)
+    coefficients, _ = nnls(basis * weight[:, None], Y * weight)
+    residuals = (basis @ coefficients - Y) * weight
+    return coefficients, residuals
+
+def varpro_fit(X_for_fit, log_Y_for_fit, n_components, taus0=None):
+    """
+    Variable projection fit of a multi-exponential decay
+    only log(tau) are optimized; A1... and c are solved by linear least squares for each set of lifetimes
+    Return parameters in the order of the models: [A1, ..., tau1, ..., c]
+    """
+    X_for_fit = np.asarray(X_for_fit, dtype=float)
+    Y_for_fit = np.exp(np.asarray(log_Y_for_fit, dtype=float))
+    if taus0 is None:
+        taus0 = estimate_lifetimes(X_for_fit, log_Y_for_fit, n_components)
+
+    # keep lifetimes between a tenth of the time step and ten times the fit range
+    span = max(X_for_fit[-1] - X_for_fit[0], np.finfo(float).eps)
+    dt = max(np.median(np.diff(X_for_fit)), np.finfo(float).eps)
+    lower, upper = np.log(dt / 10), np.log(10 * span)
+    theta0 = np.clip(np.log(taus0), lower + 1e-6, upper - 1e-6)
+
+    def residual(theta):
+        return linear_amplitudes(X_for_fit, Y_for_fit, np.exp(theta))[1]
+
+    solution = least_squares(residual, theta0, bounds=(lower, upper))
+    taus = np.exp(solution.x)
+    coefficients, _ = linear_amplitudes(X_for_fit, Y_for_fit, taus)
+    # short lifetime first
+    order = np.argsort(taus)
+    return list(coefficients[:-1][order]) + list(taus[order]) + [coefficients[-1]]
+
+def select_model(X_for_fit, log_Y_for_fit, selection='bic'):
+    """
+    Fit tri, bi and single exponential in nested order and choose the model by AIC or BIC
+    tri is started from the variable projection solution, bi from the tri parameters
+    and single from the bi parameters, so each fit starts close to its solution.
+    A model with a component amplitude below 0.01 is not chosen (unless nothing else is left)
+    Return model name, fitted parameters and the criterion of each model
+    """
+    candidates = {}
+    criteria = {}
+    popt = None
+    for model_name, n_components in [('tri', 3), ('bi', 2), ('single', 1)]:
+        # initial guesses to try in order:
+        # warm start from the previous (larger) model, variable projection, fixed guess (None)
+        guesses = ['warm', 'varpro', None] if popt is not None else ['varpro', None]
+        previous, popt = popt, None
+        for guess in guesses:
+            try:
+                if guess == 'warm':
+                    p0 = warm_start(previous, n_components)
+                elif guess == 'varpro':
+                    p0 = varpro_fit(X_for_fit, log_Y_for_fit, n_components)
+                else:
+                    p0 = None
+                popt = fit_log_model(model_name, X_for_fit, log_Y_for_fit, p0=p0)
+                break
+            except Exception:
+                continue
+        if popt is None:
+            continue
+        log_Y_fit = np.log(MODELS[model_name][0](X_for_fit, *popt))
+        if not np.all(np.isfinite(log_Y_fit)):
+            continue
+        candidates[model_name] = popt
+        criteria[model_name] = information_criterion(log_Y_for_fit, log_Y_fit, len(popt), selection)
+
+    if len(candidates) == 0:
+        raise RuntimeError('no model could be fitted')
+
+    # models without negligible components
+    valid = [name for name, popt in candidates.items() if min(popt[:(len(popt) - 1) // 2]) > 0.01]
+    if len(valid) == 0:
+        valid = list(candidates)
+    model_name = min(valid, key=lambda name: criteria[name])
+    return model_name, candidates[model_name], criteria
+
+def fit_decay(X, Y, selection=FIT_SETTINGS['selection']):
+    """
+    Fit a decay without printing or plotting
+    selection: 'bic' or 'aic' (model choice by information criterion) or 'cascade' (old tri -> bi -> single)
+    Return a dictionary with the processed data, the fitted curve and the results
+    results: [A1, A2, A3, t1, t2, t3, c] (not rounded)
+    """
     # Make On time to be 0 ns and Normalize Y
     X, Y, on_index = process_data(X, Y, normalize=True)
 
-    # Decide cut time based on the figure
-    # take_a_look(X, Y,label)
-    # cut_time = int(input('Cut time (ns)?'))
-
     # Cut time for fitting
-    power = -3
-    threshold = 10 ** power
-    while True:
-        try:
-            cut_index = next(y[0] for y in enumerate(Y[on_index:]) if y[1] < threshold) + on_index
-            break
-        except:
-            power += 0.2
-            threshold = 10 ** power
+    cut_index, noise_floor = detect_cut_off(Y, on_index)
     cut_time = X[cut_index]
-    print(f'{cut_time:.1f} ns')
 
     # Data used for fitting
     X_for_fit = X[on_index:cut_index]
     Y_for_fit = Y[on_index:cut_index]
-    # Prepare log for fitting
-    log_Y_for_fit = np.log(Y_for_fit)
 
-    try:
-        # start from tri exponential
-        def log_fit(t, A1, A2, A3, tau1, tau2, tau3, c):
-            return np.log(tri_exponential_decay(t, A1, A2, A3, tau1, tau2, tau3, c))
-        
-        # Initial guess for the parameters
-        initial_guess = [0.7, 0.2, 0.1, 5, 50, 100, 0]
-        # Bounds for the parameters (all parameters are positive)
-        bounds = (0, np.inf)  # All parameters must be greater than 0
-
-        # Fit the tri-exponential function to the data with bounds
-        popt, _ = curve_fit(log_fit, X_for_fit, log_Y_for_fit, p0=initial_guess, bounds=bounds)
+    fit = {'X': X, 'Y': Y, 'on_index': on_index, 'cut_index': cut_index, 'cut_time': cut_time, 'noise_floor': noise_floor,
+           'X_for_fit': X_for_fit, 'model': None, 'popt': None, 'Y_fit': None, 'criteria': {},
+           'results': [0,0,0,0,0,0,0], 'r2': 0, 'r2_log': 0, 'error': None}
 
-        # Calculate R-squared value
-        Y_fit = [np.exp(log_fit(x, popt[0],popt[1],popt[2],popt[3],popt[4],popt[5], popt[6])) for x in X_for_fit]
-        r2 = r2_score(Y_for_fit, Y_fit)
-        r2_log = r2_score(log_Y_for_fit, np.log(Y_fit))
-
-        results = list(popt)
-
-        if min(results[0:2]) > 0.01:
-            show_fit_result(popt,r2,r2_log,results,label,X,Y,X_for_fit,Y_fit,figsave,fig_dir)
+    try:
+        # Prepare log for fitting
+        log_Y_for_fit = np.log(Y_for_fit)
 
+        if selection == 'cascade':
+            model_name, popt, criteria = cascade_fit(X_for_fit, log_Y_for_fit)
         else:
-            # Fit with bi-exponential
-            def log_fit(t, A1, A2, tau1, tau2,c):
-                return np.log(bi_exponential_decay(t, A1, A2, tau1, tau2,c))
-            
-            # Initial guess for the parameters
-            initial_guess = [0.7, 0.2, 5, 50, 0]
-            # Bounds for the parameters (all parameters are positive)
-            bounds = (0, np.inf)  # All parameters must be greater than 0
-
-            # Fit the tri-exponential function to the data with bounds
-            popt, _ = curve_fit(log_fit, X_for_fit, log_Y_for_fit, p0=initial_guess, bounds=bounds)
-
-            # Calculate R-squared value
-            Y_fit = [np.exp(log_fit(x, popt[0],popt[1],popt[2],popt[3],popt[4])) for x in X_for_fit]
-            r2 = r2_score(Y_for_fit, Y_fit)
-            r2_log = r2_score(log_Y_for_fit, np.log(Y_fit))
-
-            results = list(popt)
-            results = [results[0],results[1],0,results[2],results[3],0,results[4]]
-
-            if min(results[0:1]) > 0.01:
-                show_fit_result(popt,r2,r2_log,results,label,X,Y,X_for_fit,Y_fit,figsave,fig_dir)
-
-            else:
-                # Fit with single-exponential
-                def log_fit(t, A1, tau1,c):
-                    return np.log(single_exponential_decay(t, A1, tau1,c))
-                
-                # Initial guess for the parameters
-                initial_guess = [0.7, 0.2, 0]
-                # Bounds for the parameters (all parameters are positive)
-                bounds = (0, np.inf)  # All parameters must be greater than 0
-
-                # Fit the tri-exponential function to the data with bounds
-                popt, _ = curve_fit(log_fit, X_for_fit, log_Y_for_fit, p0=initial_guess, bounds=bounds)
-
-                # Calculate R-squared value
-                Y_fit = [np.exp(log_fit(x, popt[0],popt[1],popt[2])) for x in X_for_fit]
-                r2 = r2_score(Y_for_fit, Y_fit)
-                r2_log = r2_score(log_Y_for_fit, np.log(Y_fit))
-
-                results = list(popt)
-                results = [results[0],0,0,results[1],0,0,0]
-
-                show_fit_result(popt,r2,r2_log,results,label,X,Y,X_for_fit,Y_fit,figsave,fig_dir)
+            model_name, popt, criteria = select_model(X_for_fit, log_Y_for_fit, selection)
+        results = to_results(model_name, popt)
+
+        # Calculate R-squared value
+        model = MODELS[model_name][0]
+        Y_fit = model(X_for_fit, *popt)
+        fit.update({
+            'model': model_name, 'popt': popt, 'Y_fit': Y_fit, 'results': results, 'criteria': criteria,
+            'r2': r2_score(Y_for_fit, Y_fit), 'r2_log': r2_score(log_Y_for_fit, np.log(Y_fit)),
+        })
 
     except Exception as e:
-        print(f'Fitting failed due to {e}')
-        results = [0,0,0,0,0,0,0]
-        r2, r2_log = 0, 0
+        fit['error'] = e
 
-    # round values
-    cut_time = round(cut_time,1)
-    results1 = [round(n,4) for n in results[:3]] # A1, A2, A3
-    results2 = [round(n,2) for n in results[3:6]] # t1, t2, t3
-    results3 = [round(results[-1],4)] # c
+    return fit
+
+def round_results(cut_time, results, r2, r2_log):
+    cut_time = round(float(cut_time),1)
+    results1 = [round(float(n),4) for n in results[:3]] # A1, A2, A3
+    results2 = [round(float(n),2) for n in results[3:6]] # t1, t2, t3
+    results3 = [round(float(results[-1]),4)] # c
     results = results1 + results2 + results3
-    r2 = round(r2,4)
-    r2_log = round(r2_log,4)
+    r2 = round(float(r2),4)
+    r2_log = round(float(r2_log),4)
     return cut_time, results, r2, r2_log
 
-# Excel design
-def Design_excel(excel_path, font = "Meiryo UI", fontsize = 10, head_bkg_color = '000000', head_let_color = 'FFFFFF'):
-    """
-    Load excel file:
-    1. Set the font for all cells to "Meiryo UI"
-    2. Set the style for the first row (Fill black, make bold and white)
-    3. Freeze the top row
-    4. Adjust column widths
-    5. Align center
-    """
-
-    # Load the Excel file
-    wb = openpyxl.load_workbook(excel_path)
-    ws = wb.active
-    # Set the font for all cells
-    for row in ws.iter_rows():
-        for cell in row:
-            cell.font = Font(name=font, size=fontsize)
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-    # Set the style for the first row
-    for cell in ws['1:1']:
-        cell.fill = PatternFill(start_color=head_bkg_color, end_color=head_bkg_color, fill_type="solid")
-        cell.font = Font(color=head_let_color, bold=True, name=font, size=fontsize)
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    # Freeze the top row
-    ws.freeze_panes = 'A2'
-
-    # Adjust column widths based on content
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter  # Get the column letter
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = (max_length + 2) * 1.2  # Adjust the width factor as necessary
-        ws.column_dimensions[column].width = adjusted_width
-    # Save the changes
-    wb.save(excel_path)
+def fit_decay_cached(X, Y, cache_dir, selection=FIT_SETTINGS['selection']):
+    """fit_decay, reusing the result stored in cache_dir for the same data and settings"""
+    # failed fits are not stored (same rule as fitcache.cached_fit)
+    key = fitcache.make_key(fitcache.array_hash(X, Y), 'TRPL', dict(FIT_SETTINGS, selection=selection))
+    return fitcache.cached_result(cache_dir, key, lambda: fit_decay(X, Y, selection))
+
+def TRPL_fit(X, Y, label, fig_dir, figsave=False, cache_dir=None, selection=FIT_SETTINGS['selection']):
+    # Decide cut time based on the figure
+    # take_a_look(X, Y,label)
+    # cut_time = int(input('Cut time (ns)?'))
 
+    # Reuse the previous result if cache_dir is given
+    if cache_dir is None:
+        fit = fit_decay(X, Y, selection)
+    else:
+        fit = fit_decay_cached(X, Y, cache_dir, selection)
+    print(f"{fit['cut_time']:.1f} ns")
+
+    if fit['error'] is None:
+        try:
+            show_fit_result(fit['popt'],fit['r2'],fit['r2_log'],fit['results'],label,fit['X'],fit['Y'],
+                            fit['X_for_fit'],fit['Y_fit'],figsave,fig_dir)
+        except Exception as e:
+            fit.update({'results': [0,0,0,0,0,0,0], 'r2': 0, 'r2_log': 0, 'error': e})
+
+    if fit['error'] is not None:
+        print(f"Fitting failed due to {fit['error']}")
+
+    # round values
+    return round_results(fit['cut_time'], fit['results'], fit['r2'], fit['r2_log'])
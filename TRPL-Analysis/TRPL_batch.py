@@ -0,0 +1,171 @@
+'''
+Batch TRPL fitting over a directory tree
+
+Usage in a notebook:
+    import TRPL_batch
+    df = TRPL_batch.batch_fit(path)                  # fit every decay under path
+    TRPL_batch.save_summary(df, f'{path}/summary.xlsx')
+    TRPL_batch.save_figures(df, f'{path}/figure')    # optional, after the fits
+
+Fit results are cached in ".fitcache" next to each file (see Common/fitcache.py),
+so only new or modified files are fitted again. Use use_cache=False to refit everything.
+Summary files (names with "summary"), hidden folders and files without numeric data are not fitted.
+With irf_path, the whole histograms are fitted by IRF reconvolution (see TRPL_irf.py).
+'''
+
+import os
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+import TRPL
+import TRPL_irf
+import fitcache
+from excel_report import write_excel_report
+
+RESULT_COLUMNS = ['A1','A2','A3','t1','t2','t3','c']
+
+def summary_columns(irf_path=None):
+    quality = ['reduced_chi2'] if irf_path else ['r2','r2_log']
+    return ['Path','Label','Intensity','Model','cut time'] + RESULT_COLUMNS + quality + ['Error']
+
+# files written by the batch (e.g. summary.csv) are not decay files
+EXCLUDE_PATTERNS = ('*summary*',)
+
+def is_decay_file(path):
+    """True if the file has (time, counts) data lines (see TRPL.sniff_header)"""
+    try:
+        TRPL.sniff_header(path)
+        return True
+    except Exception:
+        return False
+
+def find_decay_files(root, patterns=('*.txt', '*.csv'), exclude=EXCLUDE_PATTERNS):
+    """
+    Find all decay files under root (all sub-directories included)
+    Hidden folders (.fitcache, .ipynb_checkpoints), names matching exclude
+    and files without numeric data lines are skipped
+    """
+    root = Path(root)
+    paths, n_skipped = [], 0
+    for pattern in patterns:
+        for p in root.rglob(pattern):
+            if not p.is_file() or any(part.startswith('.') for part in p.relative_to(root).parts):
+                continue
+            if any(p.match(name) for name in exclude) or not is_decay_file(p):
+                n_skipped += 1
+                continue
+            paths.append(str(p))
+    if n_skipped > 0:
+        print(f'{n_skipped} files were skipped (no decay data or excluded names)')
+    paths.sort()
+    return paths
+
+def make_label(path):
+    # ex: 240419 (measurement date in the folder name) + '_' + file name without extension
+    measurement_date = Path(path).parents[0].name[:6]
+    return f'{measurement_date}_{Path(path).stem}'
+
+def fit_file(path, cache_dir=None, use_cache=True, irf_path=None):
+    """Fit one decay file and return one row of the summary (no print, no figure)"""
+    row = {'Path': str(path), 'Label': make_label(path)}
+    settings = dict(TRPL.FIT_SETTINGS)
+    if irf_path:
+        # the IRF content is a part of the fit settings
+        settings['irf'] = fitcache.file_hash(irf_path)
+        row.update(fitcache.cached_fit(path, 'TRPL-IRF', settings, partial(TRPL_irf.fit_file, path, irf_path), cache_dir, use_cache))
+    else:
+        row.update(fitcache.cached_fit(path, 'TRPL', settings, partial(_fit_file, path), cache_dir, use_cache))
+    return row
+
+def _fit_file(path):
+    row = {}
+    try:
+        X, Y = TRPL.read_decay(path)
+        fit = TRPL.fit_decay(X, Y)
+        cut_time, results, r2, r2_log = TRPL.round_results(fit['cut_time'], fit['results'], fit['r2'], fit['r2_log'])
+        row['Intensity'] = int(Y.max())
+        row['Model'] = fit['model']
+        row['cut time'] = cut_time
+        row.update(dict(zip(RESULT_COLUMNS, results)))
+        row['r2'] = r2
+        row['r2_log'] = r2_log
+        row['Error'] = '' if fit['error'] is None else str(fit['error'])
+    except Exception as e:
+        row['Error'] = str(e)
+    return row
+
+def batch_fit(root, patterns=('*.txt', '*.csv'), max_workers=None, chunksize=4, cache_dir=None, use_cache=True, irf_path=None):
+    """
+    Fit all decay files under root in a process pool
+    irf_path: IRF file for reconvolution fitting (None: tail fitting with TRPL.fit_decay)
+    Return a DataFrame with one row per file:
+    Path, Label, Intensity, Model, cut time, A1-A3, t1-t3, c, r2, r2_log (reduced_chi2 with IRF), Error
+    """
+    paths = find_decay_files(root, patterns)
+    if irf_path:
+        paths = [path for path in paths if os.path.abspath(path) != os.path.abspath(irf_path)]
+    if len(paths) == 0:
+        print(f'No decay files found in {root}')
+        return pd.DataFrame(columns=summary_columns(irf_path))
+
+    worker = partial(fit_file, cache_dir=cache_dir, use_cache=use_cache, irf_path=irf_path)
+    if max_workers == 1:
+        rows = [worker(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            rows = list(executor.map(worker, paths, chunksize=chunksize))
+
+    df = pd.DataFrame(rows, columns=summary_columns(irf_path))
+
+    # Message
+    n_error = int((df['Error'].fillna('') != '').sum())
+    if n_error > 0:
+        print(f'CAUTION: {n_error} of {len(df)} files were not fitted. Check the "Error" column.')
+    print(f'COMPLETE: {len(df)} files')
+    return df
+
+def save_summary(df, save_path):
+    # one row band per folder, links to the data files
+    df = df.assign(Folder=[os.path.basename(os.path.dirname(path)) for path in df['Path']])
+    write_excel_report(df, save_path, sheet_name='TRPL', band_column='Folder', hyperlinks={'Path': df['Path']})
+
+def plot_fit(row, ax=None):
+    """Plot one row of the batch summary (data are read again only here)"""
+    if ax is None:
+        ax = plt.gca()
+    X, Y = TRPL.read_decay(row['Path'])
+    X, Y, on_index = TRPL.process_data(X, Y, normalize=True)
+    ax.scatter(X, Y, c='white', ec='#00939280')
+    if not row['Error'] and row['Model'] in TRPL.MODELS:
+        X_fit = X[on_index:][X[on_index:] <= row['cut time']]
+        A1, A2, A3, t1, t2, t3, c = [row[n] for n in RESULT_COLUMNS]
+        # tau = 0 is an unused component
+        Y_fit = np.full_like(X_fit, c)
+        for A, tau in zip([A1, A2, A3], [t1, t2, t3]):
+            if tau > 0:
+                Y_fit += A * np.exp((-1)*X_fit/tau)
+        lifetime = max(t1, t2, t3)
+        ax.plot(X_fit, Y_fit, c='#009392', label=f"{row['Label']}: {lifetime:.1f} ns")
+    ax.set_ylabel('Counts (a.u.)')
+    ax.set_xlabel('Time (ns)')
+    ax.set_ylim(1e-4, 1)
+    ax.set_xlim(0, None)
+    ax.set_yscale('log')
+    ax.legend(frameon=False)
+    return ax
+
+def save_figures(df, fig_dir):
+    """Save one png per fitted file, without showing them"""
+    if not os.path.exists(fig_dir):
+        os.mkdir(fig_dir)
+    for _, row in df.iterrows():
+        fig, ax = plt.subplots()
+        try:
+            plot_fit(row, ax)
+            fig.savefig(f"{fig_dir}/{row['Label']}.png")
+        except Exception as e:
+            print(f"Skipped the figure of {row['Label']} due to the error \"{e}\"")
+        plt.close(fig)
@@ -0,0 +1,157 @@
+'''
+TRPL fitting with instrument response function (IRF) reconvolution
+
+The whole histogram (rising edge included) is fitted with
+    counts = IRF * (A1 exp(-t/tau1) + ... ) + background
+The convolution is done with FFT, and the FFT of the IRF is cached for each IRF file and time grid.
+The fit maximizes the Poisson likelihood (minimizes the Poisson deviance), so no log or normalization is needed.
+
+Usage in a notebook:
+    import TRPL_irf
+    fit = TRPL_irf.fit_reconvolution(X, Y, irf_path)
+    print(fit['model'], fit['results'])    # [A1, A2, A3, t1, t2, t3, c] like TRPL.TRPL_fit
+'''
+
+import os
+from functools import lru_cache
+import numpy as np
+from scipy.optimize import least_squares, nnls
+import TRPL
+
+N_COMPONENTS = {'single': 1, 'bi': 2, 'tri': 3}
+
+@lru_cache(maxsize=16)
+def _irf_fft(irf_path, mtime, dt, n_bins):
+    X_irf, Y_irf = TRPL.read_decay(irf_path)
+    # remove the dark counts (median before the peak) and put the peak at the start of the grid
+    peak = int(np.argmax(Y_irf))
+    dark = np.median(Y_irf[:peak]) if peak > 0 else 0
+    Y_irf = np.clip(Y_irf - dark, 0, None)
+    # resample on the time grid of the decay, starting at the first IRF bin (the peak time is returned for the shift)
+    t = np.arange(n_bins) * dt
+    irf = np.interp(t + X_irf[0], X_irf, Y_irf, left=0, right=0)
+    irf = irf / irf.sum()
+    # zero padding so that the circular convolution does not wrap around
+    n_fft = 1 << int(np.ceil(np.log2(2 * n_bins)))
+    return np.fft.rfft(irf, n_fft), n_fft, X_irf[peak] - X_irf[0]
+
+def irf_fft(irf_path, dt, n_bins):
+    """FFT of the IRF on the time grid of the decay (cached per IRF file, bin width and length)"""
+    return _irf_fft(os.path.abspath(irf_path), os.path.getmtime(irf_path), float(dt), int(n_bins))
+
+def binned_exponentials(t, dt, taus, shift):
+    """
+    Each exponential exp(-(t-shift)/tau) for t >= shift, integrated over each time bin
+    (integration keeps the model smooth for sub-bin shifts)
+    """
+    taus = np.asarray(taus, dtype=float)[None, :]
+    start = np.clip(t[:, None] - shift, 0, None)
+    end = np.clip(t[:, None] + dt - shift, 0, None)
+    return taus * (np.exp((-1)*start/taus) - np.exp((-1)*end/taus))
+
+def convolve(kernels, irf_spectrum, n_fft):
+    """Convolve each column of kernels with the IRF by FFT"""
+    n_bins = kernels.shape[0]
+    return np.fft.irfft(np.fft.rfft(kernels, n_fft, axis=0) * irf_spectrum[:, None], n_fft, axis=0)[:n_bins]
+
+def poisson_deviance_residuals(Y, model):
+    """Signed residuals whose sum of squares is the Poisson deviance"""
+    model = np.clip(model, 1e-12, None)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        term = np.where(Y > 0, Y * np.log(Y / model), 0) - (Y - model)
+    return np.sign(model - Y) * np.sqrt(2 * np.clip(term, 0, None))
+
+def fit_components(t, dt, Y, irf_spectrum, n_fft, n_components, shift0, taus0):
+    """Fit n_components exponentials + background; parameters [A1.., tau1.., shift, background]"""
+    # linear amplitudes for the initial lifetimes (weighted by 1/sqrt(counts) ~ Poisson errors)
+    basis = np.column_stack([convolve(binned_exponentials(t, dt, taus0, shift0), irf_spectrum, n_fft), np.ones_like(t)])
+    weight = 1 / np.sqrt(Y + 1)
+    coefficients, _ = nnls(basis * weight[:, None], Y * weight)
+    A0 = np.maximum(coefficients[:-1], 1e-6 * Y.max())
+    b0 = max(coefficients[-1], 1e-6)
+    p0 = np.concatenate([A0, taus0, [shift0, b0]])
+
+    span = t[-1] - t[0]
+    lower = np.concatenate([np.zeros(n_components), np.full(n_components, dt / 10), [t[0] - span / 10, 0]])
+    upper = np.concatenate([np.full(n_components, np.inf), np.full(n_components, 10 * span), [t[-1], np.inf]])
+    p0 = np.clip(p0, lower + 1e-9, upper - 1e-9)
+
+    def model(p):
+        A, taus, shift, b = p[:n_components], p[n_components:2*n_components], p[-2], p[-1]
+        return convolve(binned_exponentials(t, dt, taus, shift), irf_spectrum, n_fft) @ A + b
+
+    def residual(p):
+        return poisson_deviance_residuals(Y, model(p))
+
+    solution = least_squares(residual, p0, bounds=(lower, upper), x_scale='jac')
+    return solution.x, model(solution.x), 2 * solution.cost
+
+def fit_reconvolution(X, Y, irf_path, models=('tri', 'bi', 'single')):
+    """
+    Reconvolution fit of a whole TRPL histogram
+    models: candidate models, the one with the lowest BIC (Poisson deviance + k ln n) is chosen
+    Return a dictionary with results [A1, A2, A3, t1, t2, t3, c] (A: fraction of each component, c: background / max count)
+    """
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    dt = np.median(np.diff(X))
+    t = X - X[0]
+    irf_spectrum, n_fft, irf_peak_time = irf_fft(irf_path, dt, len(X))
+
+    # initial shift: IRF peak at the rising edge of the decay
+    on_index = int(np.argmax(Y))
+    shift0 = max(t[on_index] - irf_peak_time, 0)
+    # initial lifetimes from the tail (log-slope segments)
+    tail = Y[on_index:]
+    tail_end = on_index + max(int(np.argmax(tail <= 0)) if np.any(tail <= 0) else len(tail), 3)
+
+    fit = {'X': X, 'Y': Y, 'model': None, 'popt': None, 'Y_fit': None, 'criteria': {}, 'shift': None,
+           'results': [0,0,0,0,0,0,0], 'reduced_chi2': None, 'error': None}
+    candidates = {}
+    for model_name in models:
+        n_components = N_COMPONENTS[model_name]
+        try:
+            # at least 1 count per bin, so that the log is finite when the short tail reaches 0 counts
+            taus0 = TRPL.estimate_lifetimes(t[on_index:tail_end] - t[on_index], np.log(np.clip(Y[on_index:tail_end], 1, None)), n_components)
+            popt, Y_fit, deviance = fit_components(t, dt, Y, irf_spectrum, n_fft, n_components, shift0, taus0)
+            candidates[model_name] = (popt, Y_fit, deviance)
+            fit['criteria'][model_name] = deviance + len(popt) * np.log(len(Y))
+        except Exception as e:
+            fit['error'] = e
+
+    if len(candidates) == 0:
+        return fit
+
+    # models without negligible components (same rule as TRPL.select_model)
+    fractions = {name: c[0][:N_COMPONENTS[name]] / max(c[0][:N_COMPONENTS[name]].sum(), 1e-300) for name, c in candidates.items()}
+    valid = [name for name in candidates if fractions[name].min() > 0.01] or list(candidates)
+    model_name = min(valid, key=lambda name: fit['criteria'][name])
+    popt, Y_fit, deviance = candidates[model_name]
+    n_components = N_COMPONENTS[model_name]
+    A, taus = list(fractions[model_name]), list(popt[n_components:2*n_components])
+
+    # pad to [A1, A2, A3, t1, t2, t3, c]
+    padding = [0] * (3 - n_components)
+    fit.update({
+        'model': model_name, 'popt': popt, 'Y_fit': Y_fit, 'shift': popt[-2], 'error': None,
+        'results': A + padding + taus + padding + [popt[-1] / Y.max()],
+        'reduced_chi2': deviance / max(len(Y) - len(popt), 1),
+    })
+    return fit
+
+def fit_file(path, irf_path):
+    """Reconvolution fit of one file, returning a summary row like TRPL_batch.fit_file"""
+    row = {}
+    try:
+        X, Y = TRPL.read_decay(path)
+        fit = fit_reconvolution(X, Y, irf_path)
+        cut_time, results, _, _ = TRPL.round_results(X[-1] - X[int(np.argmax(Y))], fit['results'], 0, 0)
+        row['Intensity'] = int(Y.max())
+        row['Model'] = fit['model']
+        row['cut time'] = cut_time
+        row.update(dict(zip(['A1','A2','A3','t1','t2','t3','c'], results)))
+        row['reduced_chi2'] = None if fit['reduced_chi2'] is None else round(float(fit['reduced_chi2']), 4)
+        row['Error'] = '' if fit['error'] is None else str(fit['error'])
+    except Exception as e:
+        row['Error'] = str(e)
+    return row
@@ -0,0 +1,76 @@
+'''
+Time-of-flight (ToF) transient analysis
+
+Usage in a notebook:
+    import ToF
+    X, Y = ToF.read_tof(path)
+    fit = ToF.fit_tof(X, Y, model='bi')            # whole transient after the maximum
+    fit = ToF.fit_tof(X, Y, model='bi', cut=True)  # only until the signal reaches the noise (same detector as TRPL.py)
+    print(fit['popt'], fit['cut_time'], fit['noise_floor'])
+'''
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import curve_fit
+from decay_cutoff import detect_cut_off # same detector as TRPL.py
+
+def read_tof(path):
+    # data reading
+    column_names=['Time','CH']
+    df = pd.read_csv(path, names=column_names, header=None)
+    X = df['Time'].to_numpy(dtype=float)
+    Y = df['CH'].to_numpy(dtype=float)
+    return X, Y
+
+# Single-Exponential
+def f(t,A,tau):
+    y = A * np.exp(-t/tau)
+    return y
+
+# Bi-Exponential
+def biexp(t,A,tau1,tau2):
+    y = A * np.exp(-t/tau1) + (1-A) * np.exp(-t/tau2)
+    return y
+
+# model and initial guess
+MODELS = {
+    'single': (f, [1, 1e-5]),
+    'bi': (biexp, [0.5, 1e-6, 1e-5]),
+}
+
+def normalize(X, Y):
+    """Move the maximum to t = 0 and normalize by the maximum"""
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    offset_index = int(np.argmax(Y))
+    t_offset = X[offset_index] # The time when Y is maximum
+    return X - t_offset, Y / Y[offset_index], offset_index
+
+def fit_tof(X, Y, model='single', p0=None, cut=False):
+    """
+    Fit the transient after its maximum
+    cut: fit only until the signal reaches the noise (detect_cut_off), otherwise until the end (as ToF-analysis.ipynb always did)
+    """
+    X_norm, Y_norm, offset_index = normalize(X, Y)
+    if cut:
+        cut_index, noise_floor = detect_cut_off(Y_norm, offset_index)
+    else:
+        cut_index, noise_floor = len(Y_norm), None
+
+    X_for_fit = X_norm[offset_index:cut_index]
+    Y_for_fit = Y_norm[offset_index:cut_index]
+
+    function, initial_guess = MODELS[model]
+    if p0 is None:
+        p0 = initial_guess
+    popt, pcov = curve_fit(function, X_for_fit, Y_for_fit, p0=p0)
+
+    return {
+        'popt': popt,
+        'cut_index': cut_index,
+        'cut_time': X_norm[min(cut_index, len(X_norm) - 1)],
+        'noise_floor': noise_floor,
+        'X': X_for_fit,
+        'Y': Y_for_fit,
+        'Y_fit': function(X_for_fit, *popt),
+    }
@@ -2,10 +2,8 @@ import csv
 import numpy as np
 from scipy import signal
 import matplotlib.pyplot as plt
-from scipy.sparse import csc_matrix
-from scipy.sparse import spdiags
-import scipy.sparse.linalg as spla
 import pandas as pd
+from baseline import baseline_als # Baseline estimation by AsLS (same as XRD-Analysis/peakfind.py)
 
 
 # Remove first {time_offset} seconds
@@ -19,21 +17,6 @@ def offset_XY(X,Y,time_offset):
     y = Y[k:]
     return x, y
 
-# Baseline estimation by AsLS
-def baseline_als(y, lam, p, niter=10):
-    #https://stackoverflow.com/questions/29156532/python-baseline-correction-library
-    #p: 0.001 - 0.1, lam: 10^2 - 10^9
-    # Baseline correction with asymmetric least squares smoothing, P. Eilers, 2005
-    L = len(y)
-    D = csc_matrix(np.diff(np.eye(L), 2))
-    w = np.ones(L)
-    for i in range(niter):
-        W = spdiags(w, 0, L, L)
-        Z = W + lam * D.dot(D.transpose())
-        z = spla.spsolve(Z, w*y)
-        w = p * (y > z) + (1-p) * (y < z)
-    return z
-
 # Check the baseline
 def baseline_test(X,Y,paramAsLS):
     # baseline estimation and smoothing
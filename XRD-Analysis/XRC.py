@@ -0,0 +1,224 @@
+'''
+Rocking curve (XRC/omega scan) fitting with the PearsonVII function
+
+Usage in a notebook:
+    import XRC
+    fit = XRC.fit_rocking_curve_file(csv)   # reused from the cache if the file has not changed
+    print(fit['FWHM'], fit['R2'])
+
+Batch (all rocking curves in a folder or a glob pattern, fitted in a process pool):
+    df = XRC.batch_fit(folder_path)              # one row per file: position, FWHM, R2, status
+    os.makedirs(f'{folder_path}/XRC-analysis', exist_ok=True)
+    df.to_csv(f'{folder_path}/XRC-analysis/XRC-summary.csv', index=False)
+    XRC.save_figures(df, f'{folder_path}/figure') # optional, after the fits
+Summary files (names matching EXCLUDE_PATTERNS) and hidden folders are never fitted.
+'''
+
+import os
+import glob
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+from scipy.optimize import curve_fit
+from scipy.special import gamma
+from sklearn.metrics import r2_score
+import fitcache
+import xrd_reader
+import peakfit
+
+# define the PearsonVII function for the fitting of rocking curves
+# https://www.originlab.com/doc/Origin-Help/PearsonVII-FitFunc
+def PearsonVII(x, xc, y0, A, mu, w):
+    y = y0 + A*(2*gamma(mu)*np.sqrt(2**(1/mu)-1))/np.sqrt(np.pi)/gamma(mu-0.5)/w*(1+4*(2**(1/mu)-1)/w/w*(x-xc)**2)**(-mu)
+    return y
+
+def PearsonVII_jac(x, xc, y0, A, mu, w):
+    """Analytic Jacobian of PearsonVII (points, [xc, y0, A, mu, w])"""
+    _, (d_xc, d_A, d_mu, d_w) = peakfit._pearson7(np.asarray(x, dtype=float), xc, A, mu, w)
+    return np.column_stack([d_xc, np.ones_like(d_xc), d_A, d_mu, d_w])
+
+# initial guess for the parameters [xc, y0, A, mu, w]
+INITIAL_GUESS = [0, 0, 30, 1.0, 30]
+
+def auto_initial_guess(x, y):
+    """
+    Initial guess [xc, y0, A, mu, w] from the data (x: arcsec with the maximum at 0, y: normalized)
+    background from the lowest 10% of the points, w from the width at half maximum, A from the height and w
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    index = int(np.argmax(y))
+    y0 = float(np.median(np.sort(y)[:max(len(y) // 10, 1)]))
+    half = y0 + (y[index] - y0) / 2
+    # first points below half maximum on both sides, interpolated
+    left = np.flatnonzero(y[:index] < half)
+    right = np.flatnonzero(y[index:] < half) + index
+    x_left = np.interp(half, [y[left[-1]], y[left[-1]+1]], [x[left[-1]], x[left[-1]+1]]) if len(left) else x[0]
+    x_right = np.interp(half, [y[right[0]], y[right[0]-1]], [x[right[0]], x[right[0]-1]]) if len(right) else x[-1]
+    w = max(x_right - x_left, abs(np.median(np.diff(x))))
+    A = (y[index] - y0) * w * np.pi / 2 # area of a Lorentzian (mu = 1)
+    return [0, y0, A, 1.0, w]
+
+def read_xrd_csv(csv):
+    """Read a csv file from the diffractometer (see xrd_reader.py)"""
+    return xrd_reader.read_xrd_csv(csv)
+
+def fit_rocking_curve(x, y, initial_guess=INITIAL_GUESS):
+    """
+    Fit a rocking curve
+    x: omega (degree), y: intensity
+    initial_guess: [xc, y0, A, mu, w] or 'auto' (auto_initial_guess)
+    The intensity is normalized and the peak position is moved to 0 arcsec before fitting
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    I0 = y.max()
+    # Normalize intensity
+    y = y / I0
+    index = int(np.argmax(y))
+    x_peak = x[index]
+    x = (x - x_peak) * 3600 # arcsec
+
+    if isinstance(initial_guess, str) and initial_guess == 'auto':
+        initial_guess = auto_initial_guess(x, y)
+
+    fit = {'x': x, 'y': y, 'I0': I0, 'peak_angle': x_peak, 'popt': None, 'FWHM': 'Fit Fail', 'R2': None, 'A': None, 'error': None}
+    try:
+        # fit the PearsonVII function to the data
+        popt, pcov = curve_fit(PearsonVII, x, y, p0=initial_guess, jac=PearsonVII_jac)
+        # calculate R-squared value
+        y_fit = PearsonVII(x, *popt)
+        fit.update({
+            'popt': popt,
+            'FWHM': popt[4],
+            'R2': r2_score(y, y_fit),
+            'A': y_fit.sum() * I0, # Integral Intensity
+        })
+    except Exception as e:
+        fit['error'] = str(e)
+    return fit
+
+def fit_rocking_curve_file(csv, initial_guess=INITIAL_GUESS, cache_dir=None, use_cache=True):
+    """Read and fit a rocking curve file, reusing the stored result if the file and settings are unchanged"""
+    def fit_function():
+        scan = xrd_reader.read_xrd(csv)
+        return fit_rocking_curve(scan.angle, scan.intensity, initial_guess)
+    settings = {'initial_guess': initial_guess if isinstance(initial_guess, str) else list(initial_guess),
+                'x_unit': 'arcsec', 'normalize': True, 'jacobian': 'analytic'}
+    return fitcache.cached_fit(csv, 'PearsonVII', settings, fit_function, cache_dir, use_cache)
+
+# Batch fitting
+# Position: omega of the peak (degree), xc, y0, Area, mu, FWHM: fit parameters (normalized intensity, arcsec about the maximum)
+# A: integral intensity (same as fit['A'])
+SUMMARY_COLUMNS = ['Path','Folder','Name','Status','Position (deg)','FWHM (arcsec)','R2','I0','A','xc (arcsec)','y0','Area','mu','Error']
+
+# files written by the batch (e.g. XRC-summary.csv) are not rocking curves
+EXCLUDE_PATTERNS = ('*summary*',)
+
+def find_xrc_files(source, patterns=('*.csv',), exclude=EXCLUDE_PATTERNS):
+    """
+    All files in a folder (sub-folders included) or matching a glob pattern
+    Hidden folders (.fitcache, .ipynb_checkpoints) and names matching exclude are skipped
+    """
+    if os.path.isdir(source):
+        root = Path(source)
+        paths = [p for pattern in patterns for p in root.rglob(pattern)
+                 if p.is_file() and not any(part.startswith('.') for part in p.relative_to(root).parts)]
+    else:
+        paths = [Path(p) for p in glob.glob(str(source), recursive=True) if os.path.isfile(p)]
+    paths = [str(p) for p in paths if not any(p.match(name) for name in exclude)]
+    return sorted(set(paths))
+
+def fit_file(path, initial_guess='auto', cache_dir=None, use_cache=True):
+    """Fit one rocking curve and return one row of the summary (no print, no figure)"""
+    row = {'Path': str(path), 'Folder': Path(path).parent.name, 'Name': Path(path).stem}
+    try:
+        fit = fit_rocking_curve_file(path, initial_guess, cache_dir, use_cache)
+    except Exception as e:
+        row.update({'Status': 'failed', 'Error': str(e)})
+        return row
+    row['I0'] = fit['I0']
+    if fit['popt'] is None:
+        row.update({'Status': 'failed', 'Error': fit['error']})
+        return row
+    xc, y0, Area, mu, w = fit['popt']
+    row.update({
+        'Status': 'ok',
+        'Position (deg)': fit['peak_angle'] + xc / 3600,
+        'FWHM (arcsec)': abs(w),
+        'R2': fit['R2'],
+        'A': fit['A'],
+        'xc (arcsec)': xc,
+        'y0': y0,
+        'Area': Area,
+        'mu': mu,
+        'Error': '',
+    })
+    return row
+
+def batch_fit(source, initial_guess='auto', patterns=('*.csv',), max_workers=None, chunksize=4, cache_dir=None, use_cache=True):
+    """
+    Fit all rocking curves in a folder (or matching a glob pattern) in a process pool
+    initial_guess: 'auto' (from the peak position and the width at half maximum of each curve) or [xc, y0, A, mu, w]
+    Return a DataFrame with one row per file (SUMMARY_COLUMNS); failed fits have Status 'failed' and the error message
+    """
+    paths = find_xrc_files(source, patterns)
+    if len(paths) == 0:
+        print(f'No files found in {source}')
+        return pd.DataFrame(columns=SUMMARY_COLUMNS)
+
+    worker = partial(fit_file, initial_guess=initial_guess, cache_dir=cache_dir, use_cache=use_cache)
+    if max_workers == 1:
+        rows = [worker(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            rows = list(executor.map(worker, paths, chunksize=chunksize))
+    df = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+
+    # Message
+    n_failed = int((df['Status'] != 'ok').sum())
+    if n_failed > 0:
+        print(f'CAUTION: {n_failed} of {len(df)} rocking curves could not be fitted. Check the "Error" column.')
+    print(f'COMPLETE: {len(df)} rocking curves')
+    return df
+
+def plot_fit(row, ax):
+    """Plot the data and the fit of one row of the batch summary"""
+    scan = xrd_reader.read_xrd(row['Path'])
+    x = (scan.angle - scan.angle[int(np.argmax(scan.intensity))]) * 3600 # arcsec
+    y = scan.intensity / scan.intensity.max()
+    ax.scatter(x, y, s=10, c='white', ec='#474D6B')
+    if row['Status'] == 'ok':
+        x_fit = np.linspace(x.min(), x.max(), 2000)
+        y_fit = PearsonVII(x_fit, row['xc (arcsec)'], row['y0'], row['Area'], row['mu'], row['FWHM (arcsec)'])
+        ax.plot(x_fit, y_fit, c='#D2691E', label=f"FWHM = {row['FWHM (arcsec)']:.1f} arcsec\nR$^2$ = {row['R2']:.4f}")
+        ax.legend(frameon=False)
+    ax.set_xlabel('Omega (arcsec)')
+    ax.set_ylabel('Normalized intensity')
+    ax.set_title(row['Name'])
+    return ax
+
+def _save_figure(row, save_dir, file_format):
+    # Figure without pyplot, so that it can be made in a worker process
+    fig = Figure(figsize=(5, 4))
+    plot_fit(row, fig.add_subplot())
+    fig.tight_layout()
+    path = f"{save_dir}/{row['Folder']}_{row['Name']}.{file_format}"
+    fig.savefig(path, dpi=150)
+    return path
+
+def save_figures(df, save_dir, file_format='png', max_workers=None):
+    """Save a figure of each fit of batch_fit after the fitting (in a process pool)"""
+    os.makedirs(save_dir, exist_ok=True)
+    rows = df.to_dict('records')
+    worker = partial(_save_figure, save_dir=save_dir, file_format=file_format)
+    if max_workers == 1:
+        paths = [worker(row) for row in rows]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            paths = list(executor.map(worker, rows))
+    print(f'{len(paths)} figures were saved in {save_dir}')
+    return paths
@@ -0,0 +1,243 @@
+'''
+Automatic peak detection and indexing of XRD 2theta scans
+
+1. background: asymmetric least squares (AsLS, Common/baseline.py, also used by X-Ray Sensitivity and Response/utilsplot.py)
+2. detection: Savitzky-Golay smoothing and peaks with a prominence above a fraction of the highest peak
+   and above the noise (snr x the MAD of the data around the smoothed curve)
+3. fitting: initial guesses [xc, A, shape, w] for peakfit.fit_peaks from the detected positions, heights and widths;
+   each peak is fitted in a window of its own (xc +- fit_window x FWHM), overlapping peaks together
+4. indexing: each peak is matched with the nearest reflection of a reference list (within a tolerance)
+
+Usage in a notebook:
+    import peakfind
+    reference = peakfind.cubic_reflections(5.93)             # or peakfind.read_reference('MAPbBr3.csv')
+    result = peakfind.analyze_pattern(x, y, reference)
+    result['peaks']                                          # xc, FWHM, A, hkl, 2theta (ref), delta of each peak
+    df = peakfind.batch_analyze(csv_list, reference)         # all scans in a process pool, one row per peak
+    df.to_csv(f'{folder_path}/Peak-analysis/Peak-summary.csv', index=False)   # not next to the scans
+'''
+
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import product
+import numpy as np
+import pandas as pd
+from scipy import signal
+from baseline import baseline_als
+import xrd_reader
+import peakfit
+
+# Background (lam, p), smoothing and detection settings
+SETTINGS = {
+    'lam': 1e6,             # AsLS smoothness, 10^2 - 10^9
+    'p': 0.001,             # AsLS asymmetry, 0.001 - 0.1
+    'window': 11,           # Savitzky-Golay window (points)
+    'order': 3,             # Savitzky-Golay polynomial order
+    'prominence': 0.01,     # minimum prominence / highest peak
+    'snr': 5,               # minimum prominence / noise
+    'min_distance': 0.05,   # minimum distance between peaks (degree)
+    'fit_window': 3,        # fit window around each peak (x FWHM on each side)
+    'tolerance': 0.1,       # maximum distance from the reference reflection (degree)
+}
+
+def smooth(y, window=SETTINGS['window'], order=SETTINGS['order']):
+    """Savitzky-Golay smoothing (no smoothing if the scan is shorter than the window)"""
+    window = min(window, len(y) - (1 - len(y) % 2))
+    if window <= order:
+        return np.asarray(y, dtype=float)
+    return signal.savgol_filter(y, window, order)
+
+def noise_level(y, y_smooth):
+    """Noise of a scan: MAD (scaled to a standard deviation) of the data around the smoothed curve"""
+    residual = np.asarray(y, dtype=float) - y_smooth
+    return 1.4826 * np.median(np.abs(residual - np.median(residual)))
+
+def detect_peaks(x, y, background=None, settings=None):
+    """
+    Find the peaks of a scan
+    background: array (same length as y) or None to estimate it with baseline_als
+    A peak needs a prominence above settings['prominence'] x the highest peak and above settings['snr'] x the noise
+    Return a DataFrame (xc, height, FWHM, prominence; sorted by xc) and the background
+    """
+    settings = {**SETTINGS, **(settings or {})}
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if background is None:
+        background = baseline_als(y, settings['lam'], settings['p'])
+    y_smooth = smooth(y - background, settings['window'], settings['order'])
+    noise = noise_level(y - background, y_smooth)
+
+    step = abs(np.median(np.diff(x)))
+    index, properties = signal.find_peaks(
+        y_smooth,
+        prominence=max(settings['prominence'] * y_smooth.max(), settings['snr'] * noise, 0),
+        distance=max(int(settings['min_distance'] / step), 1),
+    )
+    width, _, left, right = signal.peak_widths(y_smooth, index, rel_height=0.5)
+    # half maximum positions (fractional index -> degree)
+    points = np.arange(len(x))
+    FWHM = np.abs(np.interp(right, points, x) - np.interp(left, points, x))
+    peaks = pd.DataFrame({
+        'xc': x[index],
+        'height': y_smooth[index],
+        'FWHM': np.maximum(FWHM, step),
+        'prominence': properties['prominences'],
+    })
+    return peaks, background
+
+def initial_guesses(peaks, profile='pearson7'):
+    """[[xc, A, shape, w], ...] for peakfit.fit_peaks (area of a Lorentzian with the height and FWHM)"""
+    A = peaks['height'].to_numpy() * peaks['FWHM'].to_numpy() * np.pi / 2
+    w = peaks['FWHM'].to_numpy()
+    if profile == 'voigt':
+        # sigma, gamma (half width) of a Voigt peak with about the same FWHM
+        shape, w = w / 4, w / 4
+    else:
+        shape = np.full(len(peaks), 1.0 if profile == 'pearson7' else 0.5)
+    return np.column_stack([peaks['xc'].to_numpy(), A, shape, w]).tolist()
+
+# Reference reflections
+def d_spacing(two_theta, wavelength=peakfit.WAVELENGTHS[0]):
+    return wavelength / (2 * np.sin(np.radians(two_theta) / 2))
+
+def two_theta(d, wavelength=peakfit.WAVELENGTHS[0]):
+    return np.degrees(2 * np.arcsin(np.clip(wavelength / (2 * np.asarray(d, dtype=float)), -1, 1)))
+
+def cubic_reflections(a, max_index=4, wavelength=peakfit.WAVELENGTHS[0], x_range=(5, 120)):
+    """
+    Reflections of a primitive cubic lattice (lattice constant a in angstrom, e.g. MAPbBr3 5.93)
+    Return a DataFrame (hkl, 2theta) with one row per d spacing (h >= k >= l >= 0)
+    """
+    hkl = [(h, k, l) for h, k, l in product(range(max_index + 1), repeat=3) if h >= k >= l and h > 0]
+    d = a / np.sqrt([h*h + k*k + l*l for h, k, l in hkl])
+    reference = pd.DataFrame({'hkl': [''.join(map(str, n)) for n in hkl], '2theta': two_theta(d, wavelength)})
+    reference = reference[(reference['2theta'] >= x_range[0]) & (reference['2theta'] <= x_range[1])]
+    # same d spacing (e.g. 221 and 300): one row
+    reference = reference.groupby(reference['2theta'].round(6), as_index=False).agg({'hkl': '/'.join, '2theta': 'first'})
+    return reference.sort_values('2theta').reset_index(drop=True)
+
+def read_reference(path):
+    """csv file with the columns hkl and 2theta (e.g. from a powder diffraction database)"""
+    reference = pd.read_csv(path, dtype={'hkl': str})
+    return reference[['hkl', '2theta']].sort_values('2theta').reset_index(drop=True)
+
+def index_peaks(xc, reference, tolerance=SETTINGS['tolerance']):
+    """
+    Nearest reference reflection of each peak position
+    Return a DataFrame (hkl, 2theta (ref), delta) with nan/'' where no reflection is within the tolerance
+    """
+    xc = np.asarray(xc, dtype=float)
+    ref = reference['2theta'].to_numpy(dtype=float)
+    if len(ref) == 0 or len(xc) == 0:
+        return pd.DataFrame({'hkl': [''] * len(xc), '2theta (ref)': np.nan, 'delta': np.nan}, index=range(len(xc)))
+    distance = xc[:, None] - ref[None, :]
+    nearest = np.argmin(np.abs(distance), axis=1)
+    delta = distance[np.arange(len(xc)), nearest]
+    matched = np.abs(delta) <= tolerance
+    return pd.DataFrame({
+        'hkl': np.where(matched, reference['hkl'].to_numpy()[nearest], ''),
+        '2theta (ref)': np.where(matched, ref[nearest], np.nan),
+        'delta': np.where(matched, delta, np.nan),
+    })
+
+def group_peaks(x, peaks, fit_window=SETTINGS['fit_window'], doublet=False):
+    """
+    Fit window of each peak (xc +- fit_window x FWHM, at least 5 points; with doublet up to its Ka2 peak)
+    Peaks with overlapping windows are one group (fitted together)
+    Return a list of (start, stop, [row numbers of the peaks]) sorted by position
+    """
+    x = np.asarray(x, dtype=float)
+    step = abs(np.median(np.diff(x)))
+    xc = peaks['xc'].to_numpy(dtype=float)
+    half = np.maximum(fit_window * peaks['FWHM'].to_numpy(dtype=float), 5 * step)
+    start, stop = xc - half, xc + half
+    if doublet:
+        stop = peakfit.ka2_position(xc)[0] + half
+    groups = []
+    for i in np.argsort(xc):
+        if groups and start[i] <= groups[-1][1]:
+            groups[-1][1] = max(groups[-1][1], stop[i])
+            groups[-1][2].append(int(i))
+        else:
+            groups.append([start[i], stop[i], [int(i)]])
+    return [(max(lo, x.min()), min(hi, x.max()), index) for lo, hi, index in groups]
+
+def analyze_pattern(x, y, reference=None, profile='pearson7', doublet=False, settings=None):
+    """
+    Background, peak detection, fit of the peaks (peakfit, one fit per group of overlapping peaks) and indexing of one scan
+    Return a dictionary with peaks (DataFrame with the R2, Status and Error of its group), detected (DataFrame),
+    background, fits (peakfit.fit_peaks of each group, with its range) and error
+    """
+    settings = {**SETTINGS, **(settings or {})}
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    detected, background = detect_peaks(x, y, settings=settings)
+    result = {'peaks': None, 'detected': detected, 'background': background, 'fits': [], 'error': None}
+    if len(detected) == 0:
+        result['error'] = 'No peaks were found'
+        return result
+
+    tables, errors = [], []
+    for start, stop, index in group_peaks(x, detected, settings['fit_window'], doublet):
+        window = (x >= start) & (x <= stop)
+        group = detected.iloc[index]
+        fit = peakfit.fit_peaks(x[window], y[window] - background[window], initial_guesses(group, profile),
+                                profile=profile, background=0, doublet=doublet)
+        fit['range'] = (start, stop)
+        result['fits'].append(fit)
+        if fit['popt'] is None:
+            errors.append(f'{start:.2f}-{stop:.2f} deg: {fit["error"]}')
+            peaks = group[['xc', 'FWHM']].copy()
+        else:
+            peaks = fit['peaks'].copy()
+        peaks['R2'] = fit['R2']
+        peaks['Status'] = 'ok' if fit['popt'] is not None else 'not fitted'
+        peaks['Error'] = fit['error'] or ''
+        tables.append(peaks)
+    peaks = pd.concat(tables, ignore_index=True)
+    result['error'] = '; '.join(errors) or None
+    if reference is not None:
+        peaks = pd.concat([peaks, index_peaks(peaks['xc'], reference, settings['tolerance'])], axis=1)
+    # R2, Status and Error at the end
+    result['peaks'] = peaks[[col for col in peaks.columns if col not in ('R2', 'Status', 'Error')] + ['R2', 'Status', 'Error']]
+    return result
+
+def analyze_file(path, reference=None, profile='pearson7', doublet=False, settings=None):
+    """One scan file -> rows of the batch summary (one row per peak, or one row with the error)"""
+    row = {'Path': str(path), 'Name': Path(path).stem}
+    try:
+        scan = xrd_reader.read_xrd(path)
+        result = analyze_pattern(scan.angle, scan.intensity, reference, profile, doublet, settings)
+    except Exception as e:
+        return pd.DataFrame([{**row, 'Status': 'failed', 'Error': str(e)}])
+    if result['peaks'] is None:
+        return pd.DataFrame([{**row, 'Status': 'failed', 'Error': result['error']}])
+    peaks = result['peaks'].copy()
+    peaks.insert(0, 'Peak', np.arange(1, len(peaks) + 1))
+    for n, (key, value) in enumerate(row.items()):
+        peaks.insert(n, key, value)
+    return peaks
+
+def batch_analyze(paths, reference=None, profile='pearson7', doublet=False, settings=None, max_workers=None):
+    """
+    Analyze all scans in a process pool
+    Return a DataFrame with one row per peak (file, peak number, fit parameters, hkl, R2, status)
+    """
+    paths = sorted(paths)
+    worker = partial(analyze_file, reference=reference, profile=profile, doublet=doublet, settings=settings)
+    if max_workers == 1:
+        tables = [worker(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            tables = list(executor.map(worker, paths))
+    if len(tables) == 0:
+        return pd.DataFrame()
+    df = pd.concat(tables, ignore_index=True)
+
+    # Message
+    n_failed = df.loc[df['Status'] != 'ok', 'Path'].nunique()
+    if n_failed > 0:
+        print(f'CAUTION: {n_failed} of {len(paths)} scans were not fitted. Check the "Error" column.')
+    print(f'COMPLETE: {len(paths)} scans, {int((df["Status"] == "ok").sum())} peaks')
+    return df
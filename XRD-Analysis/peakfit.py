@@ -0,0 +1,177 @@
+'''
+Multi-peak fitting of XRD patterns (PearsonVII, pseudo-Voigt, Voigt)
+
+All peaks are evaluated at once on a (peaks, points) grid, and the fit uses an analytic Jacobian.
+Parameters of each peak:
+    'pearson7'      [xc, A, mu, w]        (same function as PearsonVII in XRC.py and Peak-fit.ipynb)
+    'pseudo-voigt'  [xc, A, eta, w]       (eta: Lorentzian fraction)
+    'voigt'         [xc, A, sigma, gamma] (Gaussian sigma and Lorentzian half width, scipy.special.wofz)
+A is the peak area and w the FWHM. The background is one constant y0 for the whole pattern (last parameter).
+With doublet=True each peak is a Ka1 peak plus its Ka2 peak (position from the wavelengths, intensity ratio KA2_RATIO).
+
+Usage in a notebook:
+    import peakfit
+    fit = peakfit.fit_peaks(x, y, [[34.55, 30, 1, 0.01]])               # one PearsonVII peak
+    fit = peakfit.fit_peaks(x, y, guess, profile='voigt', doublet=True)  # Voigt Ka1/Ka2 doublets
+    print(fit['peaks'])                                                  # xc, A, shape, w, FWHM of each peak
+'''
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import curve_fit
+from scipy.special import gammaln, digamma, wofz
+from sklearn.metrics import r2_score
+
+# Cu Ka1, Ka2 (angstrom) and the intensity ratio Ka2/Ka1
+WAVELENGTHS = (1.540562, 1.544390)
+KA2_RATIO = 0.5
+
+LN2 = np.log(2)
+
+def pearson7(x, xc, A, mu, w):
+    """PearsonVII peak (area A, FWHM w) for arrays of parameters: x (points,), parameters (peaks, 1) -> (peaks, points)"""
+    return _pearson7(x, xc, A, mu, w)[0]
+
+def _pearson7(x, xc, A, mu, w):
+    # constants depending on mu, once per peak
+    k = 2**(1/mu) - 1
+    C = 2 * np.exp(gammaln(mu) - gammaln(mu - 0.5)) * np.sqrt(k) / np.sqrt(np.pi)
+    dk = (-1) * 2**(1/mu) * LN2 / mu**2 # dk/dmu
+    dlnC = digamma(mu) - digamma(mu - 0.5) + 0.5 * dk / k
+    u = (x - xc) / w
+    q = 1 + 4 * k * u**2
+    shape = C / w * q**(-mu)
+    y = A * shape
+    jacobian = [
+        y * 8 * mu * k * u / (w * q),                                 # xc
+        shape,                                                        # A
+        y * (dlnC - np.log(q) - mu * 4 * u**2 * dk / q),              # mu
+        y * ((-1) / w + 8 * mu * k * u**2 / (w * q)),                 # w
+    ]
+    return y, jacobian
+
+def _pseudo_voigt(x, xc, A, eta, w):
+    u = (x - xc) / w
+    L = 2 / (np.pi * w) / (1 + 4 * u**2)
+    G = 2 * np.sqrt(LN2 / np.pi) / w * np.exp((-4) * LN2 * u**2)
+    shape = eta * L + (1 - eta) * G
+    dL_dxc = L * 8 * u / (w * (1 + 4 * u**2))
+    dG_dxc = G * 8 * LN2 * u / w
+    dL_dw = L * ((-1) / w + 8 * u**2 / (w * (1 + 4 * u**2)))
+    dG_dw = G * ((-1) / w + 8 * LN2 * u**2 / w)
+    jacobian = [
+        A * (eta * dL_dxc + (1 - eta) * dG_dxc), # xc
+        shape,                                   # A
+        A * (L - G),                             # eta
+        A * (eta * dL_dw + (1 - eta) * dG_dw),   # w
+    ]
+    return A * shape, jacobian
+
+def _voigt(x, xc, A, sigma, gamma):
+    norm = 1 / (sigma * np.sqrt(2 * np.pi))
+    z = (x - xc + 1j * gamma) / (sigma * np.sqrt(2))
+    wz = wofz(z)
+    dwz = (-2) * z * wz + 2j / np.sqrt(np.pi) # dw/dz
+    shape = wz.real * norm
+    jacobian = [
+        A * norm * (dwz * (-1) / (sigma * np.sqrt(2))).real,  # xc
+        shape,                                                 # A
+        A * norm * ((dwz * (-1) * z).real - wz.real) / sigma,  # sigma
+        A * norm * (dwz * 1j / (sigma * np.sqrt(2))).real,     # gamma
+    ]
+    return A * shape, jacobian
+
+# profile function, lower and upper bounds of the shape parameters
+PROFILES = {
+    'pearson7': (_pearson7, (0.501, 1e3)),
+    'pseudo-voigt': (_pseudo_voigt, (0, 1)),
+    'voigt': (_voigt, (1e-8, np.inf)),
+}
+
+def fwhm(profile, peaks):
+    """FWHM of each peak from the parameters (peaks, 4)"""
+    peaks = np.atleast_2d(peaks)
+    if profile == 'voigt':
+        # Olivero and Longbothum approximation
+        f_G = 2 * peaks[:, 2] * np.sqrt(2 * LN2)
+        f_L = 2 * peaks[:, 3]
+        return 0.5346 * f_L + np.sqrt(0.2166 * f_L**2 + f_G**2)
+    return peaks[:, 3]
+
+def ka2_position(xc, wavelengths=WAVELENGTHS):
+    """2theta of the Ka2 peak and its derivative by the 2theta of the Ka1 peak (degree)"""
+    theta1 = np.radians(xc) / 2
+    sin2 = np.clip(wavelengths[1] / wavelengths[0] * np.sin(theta1), -1, 1)
+    theta2 = np.arcsin(sin2)
+    return np.degrees(2 * theta2), wavelengths[1] / wavelengths[0] * np.cos(theta1) / np.cos(theta2)
+
+def evaluate(x, params, profile='pearson7', doublet=False, wavelengths=WAVELENGTHS, ratio=KA2_RATIO, jacobian=False):
+    """
+    Each peak and the derivatives by the parameters
+    params: [xc1, A1, s1, w1, xc2, ..., y0]
+    Return components (peaks, points) (Ka1 + Ka2 for doublets, without background)
+    and, with jacobian=True, the Jacobian of the sum (points, parameters)
+    """
+    function = PROFILES[profile][0]
+    x = np.asarray(x, dtype=float)[None, :]
+    P = np.asarray(params[:-1], dtype=float).reshape(-1, 4)
+    xc, A, s, w = [P[:, [n]] for n in range(4)]
+    y, dy = function(x, xc, A, s, w)
+    if doublet:
+        xc2, dxc2 = ka2_position(xc, wavelengths)
+        y2, dy2 = function(x, xc2, ratio * A, s, w)
+        y = y + y2
+        dy = [dy[0] + dy2[0] * dxc2, dy[1] + ratio * dy2[1], dy[2] + dy2[2], dy[3] + dy2[3]]
+    if not jacobian:
+        return y
+    # (peaks, 4, points) -> (points, 4 * peaks), then the background column
+    J = np.stack(dy, axis=1).reshape(-1, x.shape[1]).T
+    return y, np.hstack([J, np.ones((x.shape[1], 1))])
+
+def model(x, *params, profile='pearson7', doublet=False, wavelengths=WAVELENGTHS, ratio=KA2_RATIO):
+    """Sum of the peaks + background y0 (last parameter)"""
+    return evaluate(x, params, profile, doublet, wavelengths, ratio).sum(axis=0) + params[-1]
+
+def fit_peaks(x, y, guess, profile='pearson7', background=None, doublet=False, wavelengths=WAVELENGTHS, ratio=KA2_RATIO):
+    """
+    Fit the peaks in guess ([[xc, A, shape, w], ...], see PROFILES) and a constant background
+    background: initial background (None: minimum of y)
+    Return a dictionary with popt, peaks (DataFrame), y_fit, components, background, R2 and error
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    guess = np.atleast_2d(np.asarray(guess, dtype=float))
+    if background is None:
+        background = y.min()
+    p0 = np.append(guess.ravel(), background)
+
+    # bounds: position in the range, positive area and width
+    shape_bounds = PROFILES[profile][1]
+    lower = np.tile([x.min(), 0, shape_bounds[0], 1e-8], len(guess)).tolist() + [-np.inf]
+    upper = np.tile([x.max(), np.inf, shape_bounds[1], np.inf], len(guess)).tolist() + [np.inf]
+    p0 = np.clip(p0, np.array(lower) + 1e-12, np.array(upper) - 1e-12)
+
+    options = dict(profile=profile, doublet=doublet, wavelengths=wavelengths, ratio=ratio)
+    fit = {'popt': None, 'peaks': None, 'y_fit': None, 'components': None, 'background': None, 'R2': None, 'error': None}
+    try:
+        popt, pcov = curve_fit(lambda x, *p: model(x, *p, **options), x, y, p0=p0,
+                               jac=lambda x, *p: evaluate(x, p, jacobian=True, **options)[1],
+                               bounds=(lower, upper))
+    except Exception as e:
+        fit['error'] = str(e)
+        return fit
+
+    peaks = popt[:-1].reshape(-1, 4)
+    shape_name = {'pearson7': 'mu', 'pseudo-voigt': 'eta', 'voigt': 'sigma'}[profile]
+    width_name = 'gamma' if profile == 'voigt' else 'w'
+    y_fit = model(x, *popt, **options)
+    fit.update({
+        'popt': popt,
+        'peaks': pd.DataFrame({'xc': peaks[:, 0], 'A': peaks[:, 1], shape_name: peaks[:, 2], width_name: peaks[:, 3],
+                               'FWHM': fwhm(profile, peaks)}),
+        'y_fit': y_fit,
+        'components': evaluate(x, popt, **options),
+        'background': popt[-1],
+        'R2': r2_score(y, y_fit),
+    })
+    return fit
@@ -0,0 +1,229 @@
+'''
+Sort XRD csv files from 0_TEMPORAL into the archive folders (same rules as File-Arrangement.ipynb)
+
+    02_XRD/0_TEMPORAL/<folder>/*.csv  ->  2_GONIO (gonio), 3_100omega (100omega), 4_200omega (200omega), 5_Others
+gonio and omega files are converted (2theta/Omega, Intensity, NORM (and NORM_omega)) as in the notebook,
+the other files are moved as they are.
+Sorted files are recorded in xrd-manifest.json (path, size, mtime, sha1), so the archive folders are never listed again:
+only the new files in 0_TEMPORAL are classified, and a file that is already in the archive (same name or same content)
+is left in 0_TEMPORAL and reported.
+
+Usage in a notebook:
+    import xrd_organizer
+    base_dir = '/Users/yukiharuta/Desktop/Temp-Data/MAPbBr3-Paper/02_XRD'
+    xrd_organizer.clean_original(base_dir)               # remove non-csv files in 1_ORIGINAL-DATA (dry run)
+    plan = xrd_organizer.organize(base_dir)               # dry run: DataFrame of the planned moves
+    plan = xrd_organizer.organize(base_dir, dry_run=False)
+'''
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+import xrd_reader
+
+# Folders in the base directory
+FOLDERS = {
+    'temporal': '0_TEMPORAL',
+    'original': '1_ORIGINAL-DATA',
+    'others': '5_Others',
+}
+MANIFEST_NAME = 'xrd-manifest.json'
+
+# (keyword in the file name, destination folder, conversion), checked in this order
+RULES = [
+    ('gonio', '2_GONIO', 'gonio'),
+    ('100omega', '3_100omega', 'omega'),
+    ('200omega', '4_200omega', 'omega'),
+]
+
+def compile_rules(rules=RULES):
+    """[(compiled pattern, destination, conversion)] (keywords are literal text)"""
+    return [(re.compile(re.escape(keyword)), destination, conversion) for keyword, destination, conversion in rules]
+
+def classify(file_name, compiled_rules, others=FOLDERS['others']):
+    """Destination folder and conversion ('gonio', 'omega' or None) of a file name"""
+    for pattern, destination, conversion in compiled_rules:
+        if pattern.search(file_name):
+            return destination, conversion
+    return others, None
+
+# Manifest
+def manifest_path(base_dir):
+    return os.path.join(base_dir, MANIFEST_NAME)
+
+def load_manifest(path):
+    # {'files': {path in the archive: {size, mtime, sha1, source}}, 'cleaned': {folder: mtime}}
+    try:
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+    except Exception:
+        manifest = {}
+    manifest.setdefault('files', {})
+    manifest.setdefault('cleaned', {})
+    return manifest
+
+def save_manifest(path, manifest):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+def file_hash(path, chunk_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+# Step 1: 1_ORIGINAL-DATA
+def clean_original(base_dir, dry_run=True):
+    """
+    Remove all files except csv files in the folders of 1_ORIGINAL-DATA
+    Folders not modified since the last run (manifest) are skipped
+    Return the list of (planned) removed files
+    """
+    path = manifest_path(base_dir)
+    manifest = load_manifest(path)
+    original_dir = os.path.join(base_dir, FOLDERS['original'])
+    removed, n_skipped = [], 0
+    for folder in os.scandir(original_dir):
+        if not folder.is_dir():
+            continue
+        mtime = folder.stat().st_mtime_ns
+        if manifest['cleaned'].get(folder.name) == mtime:
+            n_skipped += 1
+            continue
+        files = [entry.path for entry in os.scandir(folder.path) if entry.is_file() and not entry.name.lower().endswith('.csv')]
+        removed.extend(files)
+        if not dry_run:
+            for file_path in files:
+                os.remove(file_path)
+            manifest['cleaned'][folder.name] = os.stat(folder.path).st_mtime_ns
+
+    if dry_run:
+        print(f'DRY RUN: {len(removed)} files would be removed ({n_skipped} folders not changed since the last run)')
+    else:
+        save_manifest(path, manifest)
+        print(f'COMPLETE: {len(removed)} files were removed ({n_skipped} folders not changed since the last run)')
+        print('Please copy all folders that you want to analyze to 0_TEMPORAL')
+    return removed
+
+# Step 2: 0_TEMPORAL -> archive folders
+def convert(source, conversion):
+    """Same DataFrame as File-Arrangement.ipynb (saved with the index)"""
+    scan = xrd_reader.read_xrd(source)
+    x, y = scan.angle, scan.intensity
+    if conversion == 'gonio':
+        return pd.DataFrame({'2theta (degree)': x, 'Intensity': y, 'NORM': y / y.max()})
+    return pd.DataFrame({
+        'Omega (degree)': x,
+        'Intensity': y,
+        'NORM_omega': x - x[int(np.argmax(y))],
+        'NORM': y / y.max(),
+    })
+
+def plan_moves(base_dir, manifest=None, rules=RULES):
+    """
+    Classify the files in the folders of 0_TEMPORAL
+    Return a DataFrame (Source, Destination, Folder, Conversion, Size, Mtime, SHA1, Action)
+    Action: 'move', 'exists' (same name in the archive) or 'duplicate' (same content as a file in the archive)
+    """
+    if manifest is None:
+        manifest = load_manifest(manifest_path(base_dir))
+    compiled_rules = compile_rules(rules)
+    known_hashes = {entry['sha1']: name for name, entry in manifest['files'].items()}
+    temporal_dir = os.path.join(base_dir, FOLDERS['temporal'])
+
+    rows = []
+    # sorted, so that the first of the files with the same content is moved
+    for folder in sorted(os.scandir(temporal_dir), key=lambda entry: entry.name):
+        if not folder.is_dir():
+            continue
+        for entry in sorted(os.scandir(folder.path), key=lambda entry: entry.name):
+            if not entry.is_file():
+                continue
+            destination, conversion = classify(entry.name, compiled_rules)
+            relative_path = f'{destination}/{entry.name}'
+            stat = entry.stat()
+            sha1 = None # only new names are read
+            if relative_path in manifest['files'] or os.path.exists(os.path.join(base_dir, relative_path)):
+                action = 'exists'
+            else:
+                sha1 = file_hash(entry.path)
+                if sha1 in known_hashes:
+                    action = 'duplicate'
+                else:
+                    action = 'move'
+                    known_hashes[sha1] = relative_path # same content twice in 0_TEMPORAL -> moved once
+            rows.append({
+                'Source': entry.path,
+                'Destination': relative_path,
+                'Folder': destination,
+                'Conversion': conversion,
+                'Size': stat.st_size,
+                'Mtime': stat.st_mtime_ns,
+                'SHA1': sha1,
+                'Action': action,
+            })
+    columns = ['Source', 'Destination', 'Folder', 'Conversion', 'Size', 'Mtime', 'SHA1', 'Action']
+    return pd.DataFrame(rows, columns=columns)
+
+def remove_empty_folders(temporal_dir):
+    for folder in os.scandir(temporal_dir):
+        if folder.is_dir():
+            if not os.listdir(folder.path):
+                os.rmdir(folder.path)
+            else:
+                print(f'{folder.path} is not empty')
+
+def organize(base_dir, dry_run=True, rules=RULES):
+    """
+    Move (and convert) the new files of 0_TEMPORAL to the archive folders in one batch
+    dry_run: only return the plan (nothing is moved)
+    Return the plan (DataFrame, see plan_moves) with the column Done
+    """
+    path = manifest_path(base_dir)
+    manifest = load_manifest(path)
+    plan = plan_moves(base_dir, manifest, rules)
+    plan['Done'] = False
+    for relative_path in plan.loc[plan['Action'] == 'exists', 'Destination']:
+        print(f'{os.path.join(base_dir, relative_path)} already exists.')
+    for source in plan.loc[plan['Action'] == 'duplicate', 'Source']:
+        print(f'{source} has the same content as a file in the archive.')
+
+    moves = plan[plan['Action'] == 'move']
+    if dry_run:
+        print(f'DRY RUN: {len(moves)} files would be moved ' +
+              ', '.join(f'{folder}: {n}' for folder, n in moves['Folder'].value_counts().sort_index().items()))
+        return plan
+
+    print('Working...')
+    for folder in moves['Folder'].unique():
+        os.makedirs(os.path.join(base_dir, folder), exist_ok=True)
+    for index, row in moves.iterrows():
+        destination = os.path.join(base_dir, row['Destination'])
+        try:
+            if pd.isna(row['Conversion']):
+                shutil.move(row['Source'], destination)
+            else:
+                convert(row['Source'], row['Conversion']).to_csv(destination)
+                os.remove(row['Source'])
+        except Exception as e:
+            print(f'{row["Source"]} was not moved due to the error "{e}"')
+            continue
+        plan.loc[index, 'Done'] = True
+        stat = os.stat(destination)
+        manifest['files'][row['Destination']] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'sha1': row['SHA1'], # content of the original file (duplicate check of new arrivals)
+            'source': os.path.relpath(row['Source'], base_dir),
+        }
+    save_manifest(path, manifest)
+    remove_empty_folders(os.path.join(base_dir, FOLDERS['temporal']))
+    print(f'COMPLETE: {int(plan["Done"].sum())} files were moved')
+    return plan
@@ -0,0 +1,85 @@
+'''
+Reader for csv files from the diffractometer
+
+The file has an instrument metadata block ("key,value" lines) and then the data block starting with the header line
+    Angle, Intensity
+The header line is found in one pass over the file, and the data block is parsed once.
+Results are cached per file (path, size and modification time), so reading the same file again is free.
+
+Usage in a notebook:
+    import xrd_reader
+    df = xrd_reader.read_xrd_csv(csv)          # same DataFrame as the skiprows loop ('Angle', ' Intensity', ...)
+    scan = xrd_reader.read_xrd(csv)
+    scan.angle, scan.intensity, scan.metadata  # float arrays and {key: value} of the metadata block
+'''
+
+import os
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# angle, intensity: float arrays, data: all columns (DataFrame), metadata: {key: value}, header_row: line number of the header
+XRDScan = namedtuple('XRDScan', ['angle', 'intensity', 'data', 'metadata', 'header_row'])
+
+def _parse_value(text):
+    text = text.strip()
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+def _parse_metadata(lines):
+    """{key: value} from "key,value" lines (several values -> list, numbers -> float)"""
+    metadata = {}
+    for line in lines:
+        fields = [field.strip() for field in line.rstrip('\r\n').split(',')]
+        if len(fields) < 2 or fields[0] == '':
+            continue
+        values = [_parse_value(field) for field in fields[1:] if field != '']
+        metadata[fields[0]] = values[0] if len(values) == 1 else (values or '')
+    return metadata
+
+def find_header(csv, column='Angle', max_lines=1000):
+    """
+    Scan the file once for the header line (a line with the column name as one of its fields)
+    Return the line number of the header and the lines before it
+    """
+    lines = []
+    with open(csv, 'r', errors='replace') as f:
+        for n, line in enumerate(f):
+            if column in [field.strip() for field in line.split(',')]:
+                return n, lines
+            lines.append(line)
+            if n + 1 >= max_lines:
+                break
+    raise ValueError(f'No "{column}" column in the first {max_lines} lines of {os.path.basename(csv)}')
+
+def intensity_column(columns):
+    # ' Intensity' in the files from the diffractometer, otherwise the second column
+    for col in columns:
+        if str(col).strip() == 'Intensity':
+            return col
+    return columns[1]
+
+@lru_cache(maxsize=256)
+def _read_xrd(csv, size, mtime):
+    header_row, metadata_lines = find_header(csv)
+    df = pd.read_csv(csv, skiprows=header_row)
+    angle = df['Angle'].to_numpy(dtype=float)
+    intensity = df[intensity_column(df.columns)].to_numpy(dtype=float)
+    angle.flags.writeable = False
+    intensity.flags.writeable = False
+    return XRDScan(angle, intensity, df, _parse_metadata(metadata_lines), header_row)
+
+def read_xrd(csv):
+    """Read (or get from the cache) a csv file as XRDScan; do not modify scan.data, use read_xrd_csv for a copy"""
+    stat = os.stat(csv)
+    return _read_xrd(os.path.abspath(csv), stat.st_size, stat.st_mtime_ns)
+
+def read_xrd_csv(csv):
+    """DataFrame of the data block (a copy, same as pd.read_csv with the right skiprows)"""
+    return read_xrd(csv).data.copy()
+
+def clear_cache():
+    _read_xrd.cache_clear()
@@ -0,0 +1,240 @@
+'''
+Series of XRD scans (phi, gonio (2theta), omega) as one stacked array
+
+All scans of a folder are read (xrd_reader) and put on one angle grid: intensity has the shape (scans, angles).
+Offsets, normalization and the symmetry analysis of phi scans work on the whole array at once,
+and the waterfall and heatmap plots draw all scans in one call.
+
+Usage in a notebook:
+    import xrd_series
+    series = xrd_series.load_series(folder_path)                              # series.names, series.angle, series.intensity
+    phi = xrd_series.apply_offset(series, 40, period=360)                     # same as [(n-offset)%360 for n in x]
+    symmetry = xrd_series.phi_symmetry(phi)                                   # n-fold symmetry and phase of each scan
+    peaks = xrd_series.phi_peaks(phi)                                         # one row per symmetry peak
+    xrd_series.plot_waterfall(xrd_series.normalize(series), spacing=1.2)
+    xrd_series.plot_heatmap(series, log=True)
+'''
+
+import os
+import glob
+from collections import namedtuple
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.colors import LogNorm
+from scipy import signal
+import xrd_reader
+import utilities
+
+# names, paths: one per scan, angle: (angles,), intensity: (scans, angles) with nan outside each scan
+ScanSeries = namedtuple('ScanSeries', ['names', 'paths', 'angle', 'intensity'])
+
+def find_files(source, pattern='*.csv'):
+    """Files in a folder (not in sub-folders) or matching a glob pattern, sorted by name"""
+    if os.path.isdir(source):
+        paths = glob.glob(os.path.join(source, pattern))
+    else:
+        paths = glob.glob(str(source))
+    return sorted(path for path in paths if os.path.isfile(path))
+
+def interpolate_rows(x, y, grid):
+    """
+    Linear interpolation of each row of y (x sorted in each row, no nan) on one grid, nan outside each row
+    The rows are shifted apart, so that one searchsorted covers all rows
+    """
+    n_rows, n_points = x.shape
+    span = max(np.max(x), np.max(grid)) - min(np.min(x), np.min(grid)) + 1
+    shift = (np.arange(n_rows) * span)[:, None]
+    index = np.searchsorted((x + shift).ravel(), (grid[None, :] + shift).ravel()).reshape(n_rows, len(grid))
+    index -= (np.arange(n_rows) * n_points)[:, None]
+    k = np.clip(index, 1, n_points - 1)
+    rows = np.arange(n_rows)[:, None]
+    x1, x2, y1, y2 = x[rows, k-1], x[rows, k], y[rows, k-1], y[rows, k]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = y1 + (y2 - y1) * (grid[None, :] - x1) / (x2 - x1)
+    outside = (grid[None, :] < x[:, [0]]) | (grid[None, :] > x[:, [-1]])
+    return np.where(outside, np.nan, result)
+
+def stack_scans(scans, grid=None):
+    """
+    List of (angle, intensity) -> common angle grid and (scans, angles) array
+    If all scans have the same angles they are stacked as they are,
+    otherwise they are interpolated on grid (default: whole range with the finest step)
+    """
+    if len(scans) == 0:
+        return np.array([]), np.empty((0, 0))
+    first = scans[0][0]
+    if grid is None and all(len(angle) == len(first) and np.array_equal(angle, first) for angle, _ in scans):
+        return np.array(first, dtype=float), np.vstack([intensity for _, intensity in scans]).astype(float)
+    if grid is None:
+        step = min(np.median(np.abs(np.diff(angle))) for angle, _ in scans)
+        start = min(angle.min() for angle, _ in scans)
+        stop = max(angle.max() for angle, _ in scans)
+        grid = start + step * np.arange(int(round((stop - start) / step)) + 1)
+    grid = np.asarray(grid, dtype=float)
+    # rows of different length: pad with the last point (outside the scan -> nan after the interpolation)
+    n_points = max(len(angle) for angle, _ in scans)
+    x = np.empty((len(scans), n_points))
+    y = np.empty((len(scans), n_points))
+    for n, (angle, intensity) in enumerate(scans):
+        order = np.argsort(angle)
+        x[n] = np.pad(angle[order], (0, n_points - len(angle)), mode='edge')
+        y[n] = np.pad(intensity[order], (0, n_points - len(angle)), mode='edge')
+    return grid, interpolate_rows(x, y, grid)
+
+def load_series(source, pattern='*.csv', grid=None):
+    """Read all scans in a folder (or matching a glob pattern) as ScanSeries; unreadable files are skipped"""
+    names, paths, scans = [], [], []
+    for path in find_files(source, pattern):
+        try:
+            scan = xrd_reader.read_xrd(path)
+        except Exception as e:
+            print(f'{os.path.basename(path)} was skipped due to the error "{e}"')
+            continue
+        names.append(Path(path).stem)
+        paths.append(path)
+        scans.append((scan.angle, scan.intensity))
+    angle, intensity = stack_scans(scans, grid)
+    print(f'{len(names)} scans, {len(angle)} angles')
+    return ScanSeries(names, paths, angle, intensity)
+
+def apply_offset(series, offset, period=None):
+    """
+    Subtract an offset (scalar or one per scan) from the angles
+    period: 360 for phi scans (angles wrapped to [0, 360), columns sorted again)
+    With one offset per scan the scans are interpolated back on the common grid
+    """
+    offset = np.asarray(offset, dtype=float)
+    if offset.ndim == 0:
+        angle = series.angle - offset
+        if period is None:
+            return series._replace(angle=angle)
+        angle = np.mod(angle, period)
+        order = np.argsort(angle, kind='stable')
+        return series._replace(angle=angle[order], intensity=series.intensity[:, order])
+
+    # one offset per scan
+    x = series.angle[None, :] - offset[:, None]
+    y = series.intensity
+    if period is not None:
+        # wrap, then one period on both sides so that the whole grid is covered
+        x = np.mod(x, period)
+        order = np.argsort(x, axis=1)
+        x = np.take_along_axis(x, order, axis=1)
+        y = np.take_along_axis(y, order, axis=1)
+        x = np.hstack([x - period, x, x + period])
+        y = np.hstack([y, y, y])
+        grid = np.sort(np.mod(series.angle, period))
+    else:
+        grid = series.angle
+    return series._replace(angle=grid, intensity=interpolate_rows(x, y, grid))
+
+def normalize(series, method='max', background=None):
+    """
+    Normalize each scan: 'max' (maximum = 1), 'minmax' (minimum = 0, maximum = 1) or 'area' (integral = 1)
+    background: scalar or one value per scan subtracted before normalizing
+    """
+    intensity = series.intensity
+    if background is not None:
+        intensity = intensity - np.broadcast_to(np.asarray(background, dtype=float), (len(intensity),))[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if method == 'max':
+            intensity = intensity / np.nanmax(intensity, axis=1, keepdims=True)
+        elif method == 'minmax':
+            low = np.nanmin(intensity, axis=1, keepdims=True)
+            intensity = (intensity - low) / (np.nanmax(intensity, axis=1, keepdims=True) - low)
+        elif method == 'area':
+            # trapezoidal rule (nan outside the scans -> 0)
+            y = np.nan_to_num(intensity)
+            area = np.sum((y[:, 1:] + y[:, :-1]) / 2 * np.diff(series.angle), axis=1)
+            intensity = intensity / area[:, None]
+        else:
+            raise ValueError(f'Unknown normalization "{method}" (max, minmax or area)')
+    return series._replace(intensity=intensity)
+
+# Phi scans
+def _periodic_grid(series, period=360):
+    """Intensity on a uniform grid covering one period (needed for the Fourier analysis)"""
+    step = np.median(np.diff(series.angle))
+    grid = np.arange(int(round(period / step))) * (period / int(round(period / step)))
+    wrapped = apply_offset(series, 0, period)
+    x = np.hstack([wrapped.angle - period, wrapped.angle, wrapped.angle + period])
+    x = np.broadcast_to(x, (len(series.intensity), len(x)))
+    y = np.nan_to_num(np.hstack([wrapped.intensity] * 3))
+    return grid, interpolate_rows(x, y, grid)
+
+def phi_symmetry(series, max_fold=12, period=360, threshold=0.5):
+    """
+    n-fold symmetry of each phi scan from the Fourier harmonics (1 < n <= max_fold)
+    and the phase: the symmetry peaks are at phase + m * 360 / n
+    Narrow peaks give (almost) the same amplitude at all multiples of the fold, so the fold is
+    the lowest harmonic with at least threshold x the amplitude of the strongest one
+    Return a DataFrame (Name, Fold, Phase (deg), Contrast: amplitude of the harmonic / mean intensity)
+    """
+    grid, intensity = _periodic_grid(series, period)
+    F = np.fft.rfft(intensity, axis=1)
+    harmonics = np.abs(F[:, 2:max_fold + 1])
+    strong = harmonics >= threshold * harmonics.max(axis=1, keepdims=True)
+    fold = np.argmax(strong, axis=1) + 2 # first True
+    rows = np.arange(len(F))
+    phase = np.mod(-np.angle(F[rows, fold]) / fold * period / (2 * np.pi), period / fold)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        contrast = 2 * np.abs(F[rows, fold]) / np.abs(F[:, 0])
+    return pd.DataFrame({'Name': series.names, 'Fold': fold, 'Phase (deg)': phase, 'Contrast': contrast})
+
+def phi_peaks(series, prominence=0.1, period=360):
+    """
+    Peaks of each phi scan (wrapped, so that a peak at 0/360 is found once)
+    prominence: minimum prominence / (maximum - minimum) of the scan
+    Return a DataFrame with one row per peak (Name, Phi (deg), Intensity, Spacing (deg) to the next peak)
+    """
+    grid, intensity = _periodic_grid(series, period)
+    n_points = len(grid)
+    rows = []
+    for name, y in zip(series.names, intensity):
+        # three periods, keep the peaks in the middle one
+        index, _ = signal.find_peaks(np.tile(y, 3), prominence=prominence * (y.max() - y.min()))
+        index = index[(index >= n_points) & (index < 2 * n_points)] - n_points
+        phi = grid[index]
+        spacing = np.mod(np.roll(phi, -1) - phi, period) if len(phi) > 1 else np.full(len(phi), np.nan)
+        rows.append(pd.DataFrame({'Name': name, 'Phi (deg)': phi, 'Intensity': y[index], 'Spacing (deg)': spacing}))
+    if len(rows) == 0:
+        return pd.DataFrame(columns=['Name', 'Phi (deg)', 'Intensity', 'Spacing (deg)'])
+    return pd.concat(rows, ignore_index=True)
+
+# Plots
+def _colors(n, start_color='#01ADC1', end_color='#CF597E'):
+    return utilities.generate_color_codes(start_color, end_color, n) if n > 1 else [start_color][:n]
+
+def plot_waterfall(series, spacing=1.0, log=False, ax=None, xlabel='Angle (degree)', labels=True):
+    """All scans shifted by spacing (x the scan number), drawn as one LineCollection"""
+    if ax is None:
+        fig, ax = plt.subplots(figsize=(6, 1 + 0.5 * len(series.names)))
+    intensity = np.log10(np.clip(series.intensity, 1e-12, None)) if log else series.intensity
+    offsets = spacing * np.arange(len(intensity))
+    segments = np.stack([np.broadcast_to(series.angle, intensity.shape), intensity + offsets[:, None]], axis=2)
+    ax.add_collection(LineCollection(segments, colors=_colors(len(intensity)), linewidths=1))
+    ax.autoscale()
+    if labels:
+        ax.set_yticks(offsets)
+        ax.set_yticklabels(series.names)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel('log10 Intensity (offset)' if log else 'Intensity (offset)')
+    ax.figure.tight_layout()
+    return ax
+
+def plot_heatmap(series, log=True, ax=None, xlabel='Angle (degree)', cmap='viridis'):
+    """Scans (rows) x angles (columns) as one image"""
+    if ax is None:
+        fig, ax = plt.subplots(figsize=(6, 1 + 0.3 * len(series.names)))
+    intensity = np.ma.masked_invalid(series.intensity)
+    norm = LogNorm(vmin=max(intensity[intensity > 0].min(), 1e-12), vmax=intensity.max()) if log else None
+    mesh = ax.pcolormesh(series.angle, np.arange(len(series.names)), intensity, shading='nearest', cmap=cmap, norm=norm)
+    ax.set_yticks(np.arange(len(series.names)))
+    ax.set_yticklabels(series.names)
+    ax.set_xlabel(xlabel)
+    plt.colorbar(mesh, ax=ax, label='Intensity')
+    ax.figure.tight_layout()
+    return ax
@@ -0,0 +1,8 @@
+# The analysis modules are flat files in their folders (imported by name from the notebooks next to them),
+# so the folders are put on the path here. Common is also installable (pip install -e Common).
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+for folder in ['Common', 'TRPL-Analysis', 'XRD-Analysis', 'Old/JV-Analysis-for-SCTF-PVproject']:
+    sys.path.insert(0, str(ROOT / folder))
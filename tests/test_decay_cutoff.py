@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from decay_cutoff import detect_cut_off
+
+def old_cut_off(Y, on_index):
+    """The threshold loop of the original TRPL_fit"""
+    power = -3
+    threshold = 10 ** power
+    while True:
+        try:
+            cut_index = next(y[0] for y in enumerate(Y[on_index:]) if y[1] < threshold) + on_index
+            break
+        except:
+            power += 0.2
+            threshold = 10 ** power
+    return cut_index
+
+def normalized_decay(tau, background, noise, seed, n_points=1000, on_index=20):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_points) - on_index
+    Y = np.where(t >= 0, np.exp(-np.clip(t, 0, None) / tau), 0) + background
+    Y = Y + noise * rng.standard_normal(n_points)
+    Y[on_index] = Y.max() + 1e-6
+    Y = (Y - Y.min()) / Y.max()
+    return Y, int(np.argmax(Y))
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('background, noise', [(0, 0), (0, 1e-4), (1e-3, 1e-4), (0.01, 1e-3), (0.05, 0.01), (0.3, 0.02)])
+def test_matches_old_threshold_loop(seed, background, noise):
+    Y, on_index = normalized_decay(tau=30 + seed, background=background, noise=noise, seed=seed)
+    cut_index, noise_floor = detect_cut_off(Y, on_index)
+    assert cut_index == old_cut_off(Y, on_index)
+    assert np.isfinite(noise_floor)
+
+def test_decay_without_background_is_cut_below_1e_3():
+    Y, on_index = normalized_decay(tau=10, background=0, noise=0, seed=0)
+    cut_index, noise_floor = detect_cut_off(Y, on_index)
+    assert Y[cut_index] < 1e-3 <= Y[cut_index - 1]
@@ -0,0 +1,64 @@
+import numpy as np
+import fitcache
+import TRPL
+
+class Counter:
+    """fit_function that counts its calls and returns the given result"""
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+    def __call__(self):
+        self.calls += 1
+        return self.result
+
+def test_successful_fit_is_reused(tmp_path):
+    fit = Counter({'popt': [1, 2], 'error': None})
+    for _ in range(2):
+        assert fitcache.cached_result(tmp_path, 'key', fit) == fit.result
+    assert fit.calls == 1
+
+def test_failed_fit_is_not_cached(tmp_path):
+    for result in [{'error': 'did not converge'}, {'Error': 'did not converge'}]:
+        fit = Counter(result)
+        for _ in range(2):
+            assert fitcache.cached_result(tmp_path, 'key', fit) == result
+        assert fit.calls == 2
+        assert fitcache.load(tmp_path, 'key') is None
+
+def test_stored_failure_is_fitted_again(tmp_path):
+    # failed results stored by older versions
+    fitcache.save(tmp_path, 'key', {'error': 'old failure'})
+    fit = Counter({'popt': [1], 'error': None})
+    assert fitcache.cached_result(tmp_path, 'key', fit) == fit.result
+    assert fitcache.load(tmp_path, 'key') == fit.result
+
+def test_cached_fit_key_follows_file_content_and_settings(tmp_path):
+    path = tmp_path / 'data.csv'
+    path.write_text('1,2\n')
+    fit = Counter({'popt': [1], 'error': None})
+    fitcache.cached_fit(str(path), 'model', {'a': 1}, fit)
+    fitcache.cached_fit(str(path), 'model', {'a': 1}, fit)
+    assert fit.calls == 1
+    fitcache.cached_fit(str(path), 'model', {'a': 2}, fit)
+    assert fit.calls == 2
+    path.write_text('1,3\n')
+    fitcache.cached_fit(str(path), 'model', {'a': 1}, fit)
+    assert fit.calls == 3
+
+def test_cached_fit_does_not_store_failures(tmp_path):
+    path = tmp_path / 'data.csv'
+    path.write_text('1,2\n')
+    fit = Counter({'error': 'did not converge'})
+    fitcache.cached_fit(str(path), 'model', {}, fit)
+    fitcache.cached_fit(str(path), 'model', {}, fit)
+    assert fit.calls == 2
+    assert not list((tmp_path / fitcache.CACHE_FOLDER).glob('*.pkl'))
+
+def test_fit_decay_cached_does_not_store_failures(tmp_path, monkeypatch):
+    X, Y = np.arange(100.0), np.exp(-np.arange(100.0) / 10)
+    monkeypatch.setattr(TRPL, 'fit_decay', lambda X, Y, selection: {'error': RuntimeError('no model could be fitted')})
+    assert TRPL.fit_decay_cached(X, Y, tmp_path)['error'] is not None
+    assert not list(tmp_path.glob('*.pkl'))
+    monkeypatch.undo()
+    assert TRPL.fit_decay_cached(X, Y, tmp_path)['error'] is None
+    assert len(list(tmp_path.glob('*.pkl'))) == 1
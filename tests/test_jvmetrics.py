@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from scipy.optimize import brentq, minimize_scalar
+import JVmetrics
+
+# single diode without series resistance: J (mA/cm2, photocurrent positive)
+J_PH, J_0, N_VT, R_SH = 20.0, 1e-9, 1.5 * 0.02585, 1000.0 # mA/cm2, mA/cm2, V, ohm cm2
+AREA = 0.1 # cm2
+
+def diode(V):
+    return J_PH - J_0 * (np.exp(V / N_VT) - 1) - 1000 * V / R_SH
+
+def diode_slope(V):
+    return (-1) * J_0 / N_VT * np.exp(V / N_VT) - 1000 / R_SH
+
+def test_metrics_of_diode_curve():
+    V = np.arange(-0.2, 1.1, 0.001)
+    df = JVmetrics.jv_metrics(V[None, :], diode(V)[None, :], AREA)
+    row = df.iloc[0]
+
+    Voc = brentq(diode, 0, 2)
+    mpp = minimize_scalar(lambda V: (-1) * V * diode(V), bounds=(0, Voc), method='bounded')
+    Pmax = (-1) * mpp.fun
+    assert row['Scan'] == 'F'
+    assert row['Jsc (mA/cm2)'] == pytest.approx(J_PH, rel=1e-6)
+    assert row['Voc (V)'] == pytest.approx(Voc, abs=1e-4)
+    assert row['Pmax (mW/cm2)'] == pytest.approx(Pmax, rel=1e-4)
+    assert row['Vmpp (V)'] == pytest.approx(mpp.x, abs=2e-3)
+    assert row['FF (%)'] == pytest.approx(Pmax / (J_PH * Voc) * 100, rel=1e-3)
+    # resistances from the slopes (ohm cm2 / area)
+    assert row['Rshunt(ohm)'] == pytest.approx(-1000 / (diode_slope(0) * AREA), rel=1e-3)
+    assert row['Rseries(ohm)'] == pytest.approx(-1000 / (diode_slope(Voc) * AREA), rel=0.05)
+
+def test_padded_curves_and_scan_direction():
+    V_forward = np.arange(-0.2, 1.1, 0.01)
+    V_reverse = np.arange(1.1, -0.2, -0.005)
+    V, J = JVmetrics.pad_curves([(V_forward, diode(V_forward)), (V_reverse, diode(V_reverse))])
+    assert V.shape == (2, len(V_reverse))
+    df = JVmetrics.jv_metrics(V, J, [AREA, AREA])
+    assert list(df['Scan']) == ['F', 'R']
+    assert df['Voc (V)'].to_numpy() == pytest.approx(brentq(diode, 0, 2), abs=1e-3)
+    assert df['Jsc (mA/cm2)'].to_numpy() == pytest.approx(J_PH, rel=1e-4)
+
+def test_curve_without_power_gives_nan():
+    V = np.arange(-0.2, 1.1, 0.01)
+    df = JVmetrics.jv_metrics(V[None, :], (-1) * np.ones((1, len(V))), AREA)
+    assert np.isnan(df.loc[0, 'Voc (V)'])
+    assert np.isnan(df.loc[0, 'Pmax (mW/cm2)'])
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+import peakfit
+
+X = np.linspace(33.5, 35.5, 801)
+# two peaks [xc, A, shape, w] + background y0 for each profile
+PARAMS = {
+    'pearson7': [34.2, 30, 1.3, 0.05, 34.8, 10, 2.5, 0.08, 1.0],
+    'pseudo-voigt': [34.2, 30, 0.3, 0.05, 34.8, 10, 0.7, 0.08, 1.0],
+    'voigt': [34.2, 30, 0.02, 0.03, 34.8, 10, 0.04, 0.02, 1.0],
+}
+
+def numerical_jacobian(params, profile, doublet, h=1e-7):
+    params = np.asarray(params, dtype=float)
+    columns = []
+    for n in range(len(params)):
+        step = h * max(abs(params[n]), 1)
+        plus, minus = params.copy(), params.copy()
+        plus[n] += step
+        minus[n] -= step
+        columns.append((peakfit.model(X, *plus, profile=profile, doublet=doublet) -
+                        peakfit.model(X, *minus, profile=profile, doublet=doublet)) / (2 * step))
+    return np.column_stack(columns)
+
+@pytest.mark.parametrize('doublet', [False, True])
+@pytest.mark.parametrize('profile', list(PARAMS))
+def test_jacobian_matches_finite_differences(profile, doublet):
+    params = PARAMS[profile]
+    y, J = peakfit.evaluate(X, params, profile, doublet, jacobian=True)
+    assert J.shape == (len(X), len(params))
+    numerical = numerical_jacobian(params, profile, doublet)
+    # largest difference of each column relative to the largest derivative in the column
+    assert np.all(np.abs(J - numerical).max(axis=0) / np.abs(numerical).max(axis=0) < 1e-5)
+
+@pytest.mark.parametrize('profile', list(PARAMS))
+def test_area_and_fwhm(profile):
+    x = np.linspace(24, 44, 200001)
+    peak = PARAMS[profile][:4]
+    y = peakfit.evaluate(x, peak + [0], profile)[0]
+    # the Lorentzian tails of the Voigt peak outside the range are about 0.2 % of the area
+    assert np.trapezoid(y, x) == pytest.approx(peak[1], rel=3e-3)
+    above = x[y >= y.max() / 2]
+    assert above[-1] - above[0] == pytest.approx(peakfit.fwhm(profile, peak)[0], rel=2e-3)
+
+def test_fit_recovers_peaks():
+    params = PARAMS['pearson7']
+    y = peakfit.model(X, *params)
+    guess = [[34.21, 25, 1.5, 0.06], [34.79, 12, 2, 0.07]]
+    fit = peakfit.fit_peaks(X, y, guess)
+    assert fit['error'] is None
+    assert fit['popt'] == pytest.approx(params, rel=1e-4)
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+import TRPL
+
+def decay(taus, amplitudes, n_points=2000, step=0.5, delay=50):
+    """Noise-free histogram: flat before the laser pulse, then the sum of the exponentials"""
+    X = np.arange(n_points) * step
+    t = np.clip(X - delay * step, 0, None)
+    Y = sum(A * np.exp(-t / tau) for A, tau in zip(amplitudes, taus)) * 1e4
+    Y[:delay] = 0
+    return X, Y + 1
+
+@pytest.mark.parametrize('selection', ['bic', 'cascade'])
+def test_fit_decay_single_lifetime(selection):
+    X, Y = decay([20], [1])
+    fit = TRPL.fit_decay(X, Y, selection)
+    assert fit['error'] is None
+    # the cascade keeps the tri model when it converges; then all its lifetimes are the same
+    amplitudes, taus = np.array(fit['results'][:3]), np.array(fit['results'][3:6])
+    assert taus[amplitudes > 0.01] == pytest.approx(20, rel=0.02)
+    assert fit['r2'] > 0.999
+
+def test_fit_decay_selects_single_model():
+    X, Y = decay([20], [1])
+    assert TRPL.fit_decay(X, Y, 'bic')['model'] == 'single'
+
+def test_fit_decay_two_lifetimes():
+    X, Y = decay([5, 60], [0.7, 0.3])
+    fit = TRPL.fit_decay(X, Y)
+    assert fit['error'] is None
+    assert fit['model'] == 'bi'
+    taus = sorted(fit['results'][3:5])
+    assert taus[0] == pytest.approx(5, rel=0.05)
+    assert taus[1] == pytest.approx(60, rel=0.05)
+
+def test_fit_decay_cut_and_time_zero():
+    X, Y = decay([20], [1])
+    fit = TRPL.fit_decay(X, Y)
+    # time zero at the maximum, fitted up to the cut-off
+    assert fit['X'][fit['on_index']] == 0
+    assert fit['on_index'] < fit['cut_index'] < len(X)
+    assert len(fit['X_for_fit']) == fit['cut_index'] - fit['on_index']
@@ -0,0 +1,53 @@
+import os
+import pandas as pd
+import xrd_organizer
+
+def make_tree(base_dir):
+    """0_TEMPORAL with new files, a file already in the archive and files with the same content"""
+    temporal = base_dir / '0_TEMPORAL'
+    (temporal / 'A').mkdir(parents=True)
+    (temporal / 'B').mkdir()
+    (base_dir / '3_100omega').mkdir()
+    (temporal / 'A' / 's1-gonio.csv').write_text('gonio 1')
+    (temporal / 'A' / 's1-100omega.csv').write_text('omega 1')
+    (base_dir / '3_100omega' / 's1-100omega.csv').write_text('omega 1 (already sorted)')
+    (temporal / 'A' / 's1-phi.csv').write_text('phi 1')
+    (temporal / 'B' / 's2-phi.csv').write_text('phi 1') # same content as A/s1-phi.csv
+    (temporal / 'B' / 's3-200omega.csv').write_text('archived content')
+    (temporal / 'B' / 's4-gonio.csv').write_text('gonio 4')
+    (temporal / 'note.csv').write_text('not in a folder')
+    manifest = {'files': {
+        '5_Others/old.csv': {'size': 16, 'mtime': 0, 'sha1': xrd_organizer.file_hash(temporal / 'B' / 's3-200omega.csv'), 'source': ''},
+        '2_GONIO/s4-gonio.csv': {'size': 7, 'mtime': 0, 'sha1': 'moved before', 'source': ''},
+    }, 'cleaned': {}}
+    return manifest
+
+def test_plan_moves_actions(tmp_path):
+    manifest = make_tree(tmp_path)
+    plan = xrd_organizer.plan_moves(str(tmp_path), manifest).set_index('Destination')
+    assert plan['Action'].to_dict() == {
+        '3_100omega/s1-100omega.csv': 'exists',     # on disk in the archive
+        '2_GONIO/s1-gonio.csv': 'move',
+        '5_Others/s1-phi.csv': 'move',
+        '5_Others/s2-phi.csv': 'duplicate',         # same content as A/s1-phi.csv, which is moved
+        '4_200omega/s3-200omega.csv': 'duplicate',  # same content as a file in the manifest
+        '2_GONIO/s4-gonio.csv': 'exists',           # name in the manifest
+    }
+    assert plan.loc['2_GONIO/s1-gonio.csv', 'Conversion'] == 'gonio'
+    assert plan.loc['5_Others/s1-phi.csv', 'Folder'] == '5_Others'
+    assert plan.loc['5_Others/s1-phi.csv', 'Source'] == os.path.join(str(tmp_path), '0_TEMPORAL', 'A', 's1-phi.csv')
+    # files with a known name are not read
+    assert pd.isna(plan.loc['2_GONIO/s4-gonio.csv', 'SHA1'])
+
+def test_rules_are_checked_in_order():
+    compiled_rules = xrd_organizer.compile_rules()
+    assert xrd_organizer.classify('s1-gonio-200omega.csv', compiled_rules) == ('2_GONIO', 'gonio')
+    assert xrd_organizer.classify('s1-200omega.csv', compiled_rules) == ('4_200omega', 'omega')
+    assert xrd_organizer.classify('s1.csv', compiled_rules) == ('5_Others', None)
+
+def test_dry_run_moves_nothing(tmp_path):
+    make_tree(tmp_path)
+    before = sorted(str(path) for path in tmp_path.rglob('*'))
+    plan = xrd_organizer.organize(str(tmp_path))
+    assert not plan['Done'].any()
+    assert sorted(str(path) for path in tmp_path.rglob('*')) == before